@@ -0,0 +1,5 @@
+"""
+Benchmarks - Load and Latency Suite
+Runs the application against local stand-ins for Gemini, ElevenLabs and
+speech-to-text and replays consultations; see `python -m benchmarks --help`
+"""
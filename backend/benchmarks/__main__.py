@@ -0,0 +1,222 @@
+"""
+Benchmark CLI - Run a Load Test or Compare Two Runs
+Usage (from backend/):
+    python -m benchmarks run --workers 2 --users 20 --duration 60 --out results.json
+    python -m benchmarks compare baseline.json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import logging
+import subprocess
+import tempfile
+from typing import Dict, List
+
+import httpx
+
+from .driver import LoadDriver, compare
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# CLI flag -> environment variable read by the stand-ins
+UPSTREAM_FLAGS = {
+    "gemini_median_ms": "BENCH_GEMINI_MEDIAN_MS",
+    "gemini_p99_ms": "BENCH_GEMINI_P99_MS",
+    "gemini_distribution": "BENCH_GEMINI_DISTRIBUTION",
+    "gemini_tokens_per_second": "BENCH_GEMINI_TOKENS_PER_SECOND",
+    "gemini_error_rate": "BENCH_GEMINI_ERROR_RATE",
+    "tts_median_ms": "BENCH_TTS_MEDIAN_MS",
+    "tts_p99_ms": "BENCH_TTS_P99_MS",
+    "tts_distribution": "BENCH_TTS_DISTRIBUTION",
+    "tts_chunk_interval_ms": "BENCH_TTS_CHUNK_INTERVAL_MS",
+    "tts_error_rate": "BENCH_TTS_ERROR_RATE",
+    "stt_median_ms": "BENCH_STT_MEDIAN_MS",
+    "stt_p99_ms": "BENCH_STT_P99_MS",
+    "stt_real_time_factor": "BENCH_STT_REAL_TIME_FACTOR",
+    "stt_error_rate": "BENCH_STT_ERROR_RATE",
+    "seed": "BENCH_SEED"
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited before {url} became ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _uvicorn(args: List[str], env: Dict[str, str], log) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *args, "--host", "127.0.0.1", "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(args) -> int:
+    env = dict(os.environ)
+    upstreams = {}
+    for flag, variable in UPSTREAM_FLAGS.items():
+        value = getattr(args, flag)
+        if value is not None:
+            env[variable] = str(value)
+        if variable in env:
+            upstreams[variable] = env[variable]
+
+    processes = []
+    workdir = tempfile.mkdtemp(prefix="medivoice-bench-")
+    log_path = os.path.join(workdir, "server.log")
+    log = open(log_path, "w")
+    try:
+        target = args.target
+        if target is None:
+            tts_port = _free_port()
+            tts = _uvicorn(
+                ["benchmarks.fake_upstreams:create_tts_app_from_env", "--factory", "--port", str(tts_port)],
+                env, log
+            )
+            processes.append(tts)
+            _wait_ready(f"http://127.0.0.1:{tts_port}/stats", tts)
+
+            app_port = _free_port()
+            app_env = dict(env)
+            app_env["ELEVENLABS_BASE_URL"] = f"http://127.0.0.1:{tts_port}"
+            # Fresh caches per run, so results do not depend on earlier runs
+            app_env.setdefault("TTS_CACHE_DIR", os.path.join(workdir, "tts-cache"))
+            app_env.setdefault("GREETINGS_PATH", os.path.join(workdir, "greetings.json"))
+            server = _uvicorn(
+                ["benchmarks.server:app", "--port", str(app_port), "--workers", str(args.workers)],
+                app_env, log
+            )
+            processes.append(server)
+            target = f"http://127.0.0.1:{app_port}"
+            _wait_ready(f"{target}/api/health", server)
+            print(f"Server at {target} ({args.workers} workers), logs in {log_path}")
+
+        driver = LoadDriver(
+            target,
+            users=args.users,
+            consultations=args.consultations,
+            duration=args.duration,
+            think_ms=args.think_ms,
+            voice_seconds=args.voice_seconds,
+            fetch_audio=not args.no_audio,
+            seed=args.seed
+        )
+        results = asyncio.run(driver.run())
+    finally:
+        for process in reversed(processes):
+            _stop(process)
+        log.close()
+
+    results["git_revision"] = _git_revision()
+    results["config"] = {
+        "target": args.target,
+        "workers": args.workers if args.target is None else None,
+        "users": args.users,
+        "consultations": args.consultations,
+        "duration": args.duration,
+        "think_ms": args.think_ms,
+        "voice_seconds": args.voice_seconds,
+        "fetch_audio": not args.no_audio,
+        "upstreams": upstreams
+    }
+
+    for endpoint, summary in results["endpoints"].items():
+        latency = summary["latency_ms"]
+        print(
+            f"{endpoint:>13}: {summary['requests']} requests, {summary['errors']} errors, "
+            f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+            f"ttfb p50 {summary['ttfb_ms']['p50']} ms, {summary['throughput_rps']} req/s"
+        )
+    for worker in results["workers"]:
+        print(f"worker {worker['pid']}: rss {worker['rss_mb']} MB, peak {worker['peak_rss_mb']} MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.out}")
+    return 0
+
+
+def compare_files(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    lines = compare(baseline, current, threshold_pct=args.threshold)
+    print("\n".join(lines))
+    return 1 if any(line.startswith("REGRESSION") for line in lines) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Start the stand-ins and the server, then drive load")
+    run_parser.add_argument("--target", help="Drive an already running server instead of starting one")
+    run_parser.add_argument("--workers", type=int, default=1, help="Uvicorn worker processes")
+    run_parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    run_parser.add_argument("--duration", type=float, default=60, help="Seconds to keep starting consultations")
+    run_parser.add_argument("--consultations", type=int, help="Run exactly this many consultations instead")
+    run_parser.add_argument("--think-ms", type=float, default=0, help="Pause between a user's requests")
+    run_parser.add_argument("--voice-seconds", type=float, default=3.0, help="Length of voice-input recordings")
+    run_parser.add_argument("--no-audio", action="store_true", help="Skip downloading each turn's audio")
+    run_parser.add_argument("--out", help="Write the results JSON here")
+    for flag in UPSTREAM_FLAGS:
+        kind = str if flag.endswith("distribution") else (int if flag == "seed" else float)
+        run_parser.add_argument(f"--{flag.replace('_', '-')}", dest=flag, type=kind)
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Diff two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression threshold, percent")
+    compare_parser.set_defaults(handler=compare_files)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
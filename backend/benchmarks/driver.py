@@ -0,0 +1,286 @@
+"""
+Load Driver - Replays Consultations and Summarizes Latency
+Virtual users run scripted multi-turn consultations (conversation turns,
+audio fetches, report, voice input) against a running server
+"""
+
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from .scenarios import make_recording, pick_consultation
+
+logger = logging.getLogger(__name__)
+
+RESULTS_SCHEMA = 1
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q-th percentile with linear interpolation (None for no values)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Recorder:
+    """Per-endpoint samples collected during a run"""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.ttfb: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint: str, latency: float, ttfb: float, status: str):
+        self.statuses[endpoint][status] += 1
+        if status.startswith(("2", "3")):
+            self.latency[endpoint].append(latency)
+            self.ttfb[endpoint].append(ttfb)
+
+    def summary(self, elapsed: float) -> Dict:
+        endpoints = {}
+        for endpoint in sorted(self.statuses):
+            statuses = dict(sorted(self.statuses[endpoint].items()))
+            requests = sum(statuses.values())
+            ok = len(self.latency[endpoint])
+            latency, ttfb = self.latency[endpoint], self.ttfb[endpoint]
+            endpoints[endpoint] = {
+                "requests": requests,
+                "errors": requests - ok,
+                "error_rate": round((requests - ok) / requests, 4) if requests else 0.0,
+                "statuses": statuses,
+                "throughput_rps": round(ok / elapsed, 3) if elapsed else 0.0,
+                "latency_ms": {
+                    "p50": _ms(percentile(latency, 50)),
+                    "p95": _ms(percentile(latency, 95)),
+                    "p99": _ms(percentile(latency, 99)),
+                    "mean": _ms(sum(latency) / ok) if ok else None,
+                    "max": _ms(max(latency)) if ok else None
+                },
+                "ttfb_ms": {
+                    "p50": _ms(percentile(ttfb, 50)),
+                    "p95": _ms(percentile(ttfb, 95)),
+                    "p99": _ms(percentile(ttfb, 99))
+                }
+            }
+        return endpoints
+
+
+class LoadDriver:
+    def __init__(
+        self,
+        base_url: str,
+        users: int = 10,
+        consultations: Optional[int] = None,
+        duration: Optional[float] = 60,
+        think_ms: float = 0,
+        voice_seconds: float = 3.0,
+        fetch_audio: bool = True,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the driver
+
+        Args:
+            base_url: Server under test
+            users: Concurrent virtual users
+            consultations: Stop after this many consultations (overrides duration)
+            duration: Stop starting consultations after this many seconds
+            think_ms: Pause between a user's requests
+            voice_seconds: Length of the recordings sent to /api/voice-input
+            fetch_audio: Download each turn's audio_url (measures audio TTFB)
+            seed: Makes consultation choice and recordings repeatable
+        """
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.consultations = consultations
+        self.duration = duration
+        self.think_ms = think_ms
+        self.voice_seconds = voice_seconds
+        self.fetch_audio = fetch_audio
+        self.random = random.Random(seed)
+
+        self.recorder = Recorder()
+        self.completed = 0
+        self.failed = 0
+        self.workers: Dict[int, Dict] = {}
+        self._started = 0
+        self._recordings: List[bytes] = []
+
+    async def _request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        """Time one request; returns the decoded JSON body (or None)"""
+        started = time.perf_counter()
+        ttfb = None
+        chunks = []
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                async for chunk in response.aiter_bytes():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - started
+                    chunks.append(chunk)
+                status = str(response.status_code)
+                content_type = response.headers.get("content-type", "")
+        except httpx.HTTPError as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, 0.0, type(e).__name__)
+            return None
+
+        latency = time.perf_counter() - started
+        self.recorder.add(endpoint, latency, ttfb if ttfb is not None else latency, status)
+        if status.startswith("2") and content_type.startswith("application/json"):
+            return json.loads(b"".join(chunks))
+        return None
+
+    async def _think(self):
+        if self.think_ms:
+            await asyncio.sleep(self.think_ms / 1000)
+
+    async def _consultation(self, client: httpx.AsyncClient) -> bool:
+        script = pick_consultation(self.random)
+        language = script["language"]
+        conversation_id = None
+
+        for message in script["turns"]:
+            body = {"message": message, "language": language, "conversation_id": conversation_id}
+            data = await self._request(client, "conversation", "POST", "/api/conversation", json=body)
+            if data is None:
+                return False
+            conversation_id = data["conversation_id"]
+            if self.fetch_audio and data.get("audio_url", "").startswith("/api/audio/"):
+                await self._request(client, "audio", "GET", data["audio_url"])
+            if data.get("followup_url"):
+                await self._request(client, "followup", "GET", data["followup_url"])
+            await self._think()
+
+        report = await self._request(client, "report", "POST", "/api/report", json={"conversation_id": conversation_id})
+        await self._think()
+
+        recording = self.random.choice(self._recordings)
+        voice = await self._request(
+            client,
+            "voice_input",
+            "POST",
+            "/api/voice-input",
+            data={"language": language},
+            files={"audio": ("recording.wav", recording, "audio/wav")}
+        )
+        return report is not None and voice is not None
+
+    def _claim(self, deadline: Optional[float]) -> bool:
+        if self.consultations is not None:
+            if self._started >= self.consultations:
+                return False
+        elif deadline is not None and time.perf_counter() >= deadline:
+            return False
+        self._started += 1
+        return True
+
+    async def _user(self, client: httpx.AsyncClient, deadline: Optional[float]):
+        while self._claim(deadline):
+            try:
+                ok = await self._consultation(client)
+            except Exception as e:
+                logger.error(f"Consultation failed: {str(e)}")
+                ok = False
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    async def _sample_memory(self, stop: asyncio.Event):
+        # A new connection per probe, and several probes per round, so every
+        # worker process is likely to answer one
+        limits = httpx.Limits(max_keepalive_connections=0)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=5.0) as client:
+            await self._sample_rounds(client, stop)
+
+    async def _sample_rounds(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not stop.is_set():
+            for _ in range(8):
+                try:
+                    response = await client.get("/__bench/memory")
+                    sample = response.json()
+                except (httpx.HTTPError, ValueError):
+                    continue
+                worker = self.workers.setdefault(sample["pid"], {"pid": sample["pid"], "rss_mb": 0.0, "peak_rss_mb": 0.0})
+                worker["rss_mb"] = sample["rss_mb"]
+                worker["peak_rss_mb"] = max(worker["peak_rss_mb"], sample["peak_rss_mb"])
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> Dict:
+        """Run the load and return the results document"""
+        self._recordings = [make_recording(self.voice_seconds, self.random) for _ in range(3)]
+        limits = httpx.Limits(max_connections=self.users * 2 + 4, max_keepalive_connections=self.users * 2 + 4)
+        timeout = httpx.Timeout(120.0)
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout) as client:
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self._sample_memory(stop))
+
+            started_at = time.time()
+            started = time.perf_counter()
+            deadline = started + self.duration if self.consultations is None and self.duration else None
+            await asyncio.gather(*(self._user(client, deadline) for _ in range(self.users)))
+            elapsed = time.perf_counter() - started
+
+            stop.set()
+            await sampler
+
+        return {
+            "schema": RESULTS_SCHEMA,
+            "started_at": started_at,
+            "elapsed_seconds": round(elapsed, 3),
+            "users": self.users,
+            "consultations": {"completed": self.completed, "failed": self.failed},
+            "endpoints": self.recorder.summary(elapsed),
+            "workers": sorted(self.workers.values(), key=lambda worker: worker["pid"])
+        }
+
+
+def compare(baseline: Dict, current: Dict, threshold_pct: float = 10.0) -> List[str]:
+    """
+    Describe the differences between two results documents
+
+    Returns the report lines; lines for p95 regressions over threshold_pct
+    start with "REGRESSION".
+    """
+    lines = []
+    for endpoint in sorted(set(baseline["endpoints"]) | set(current["endpoints"])):
+        before = baseline["endpoints"].get(endpoint)
+        after = current["endpoints"].get(endpoint)
+        if before is None or after is None:
+            lines.append(f"{endpoint}: only in {'current' if before is None else 'baseline'}")
+            continue
+        for metric, key in (("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"), ("ttfb_ms", "p95")):
+            old, new = before[metric][key], after[metric][key]
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            regression = metric == "latency_ms" and key == "p95" and change > threshold_pct
+            prefix = "REGRESSION " if regression else ""
+            lines.append(f"{prefix}{endpoint} {metric}.{key}: {old:.1f} -> {new:.1f} ({change:+.1f}%)")
+        lines.append(
+            f"{endpoint} throughput_rps: {before['throughput_rps']} -> {after['throughput_rps']}, "
+            f"error_rate: {before['error_rate']} -> {after['error_rate']}"
+        )
+
+    peak_before = max((w["peak_rss_mb"] for w in baseline.get("workers", [])), default=None)
+    peak_after = max((w["peak_rss_mb"] for w in current.get("workers", [])), default=None)
+    if peak_before is not None and peak_after is not None:
+        lines.append(f"worker peak_rss_mb: {peak_before} -> {peak_after}")
+    return lines
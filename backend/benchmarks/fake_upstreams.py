@@ -0,0 +1,290 @@
+"""
+Fake Upstreams - Local Stand-Ins for Gemini, ElevenLabs and Speech-to-Text
+Each stand-in draws its latency from a configurable distribution, streams
+at a configurable cadence and fails at a configurable rate
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from services.stt_engines import SAMPLE_RATE, SAMPLE_WIDTH, Recognizer, STTEngine
+
+logger = logging.getLogger(__name__)
+
+# MPEG frame header, so clients that sniff the payload see MP3
+_MP3_FRAME_HEADER = b"\xff\xfb\x90\x64"
+
+
+class LatencyModel:
+    """
+    Latency distribution of an upstream
+
+    "lognormal" is fitted to the median and p99 (the usual long tail),
+    "uniform" spreads evenly between them and "fixed" always returns the
+    median.
+    """
+
+    def __init__(
+        self,
+        median_ms: float,
+        p99_ms: Optional[float] = None,
+        distribution: str = "lognormal",
+        seed: Optional[int] = None
+    ):
+        if distribution not in ("lognormal", "uniform", "fixed"):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.median_ms = median_ms
+        self.p99_ms = max(p99_ms if p99_ms is not None else median_ms * 3, median_ms)
+        self.distribution = distribution
+        self._random = random.Random(seed)
+        # z(0.99) = 2.326; sigma so the 99th percentile lands on p99_ms
+        self._sigma = math.log(self.p99_ms / median_ms) / 2.326 if median_ms > 0 else 0.0
+
+    def sample(self) -> float:
+        """One latency, in seconds"""
+        if self.distribution == "fixed" or self.median_ms <= 0:
+            return self.median_ms / 1000
+        if self.distribution == "uniform":
+            return self._random.uniform(self.median_ms, self.p99_ms) / 1000
+        return self._random.lognormvariate(math.log(self.median_ms), self._sigma) / 1000
+
+    @classmethod
+    def from_env(cls, prefix: str, median_ms: float, p99_ms: float) -> "LatencyModel":
+        seed = os.getenv("BENCH_SEED")
+        return cls(
+            median_ms=float(os.getenv(f"{prefix}_MEDIAN_MS", median_ms)),
+            p99_ms=float(os.getenv(f"{prefix}_P99_MS", p99_ms)),
+            distribution=os.getenv(f"{prefix}_DISTRIBUTION", "lognormal"),
+            seed=int(seed) if seed else None
+        )
+
+
+class InjectedError(RuntimeError):
+    """Failure produced on purpose by a stand-in"""
+
+
+class _Text:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _TextStream:
+    def __init__(self, chunks, cadence: float):
+        self._chunks = chunks
+        self._cadence = cadence
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                await asyncio.sleep(self._cadence)
+            yield _Text(chunk)
+
+
+ANSWER_TEXT = (
+    "Based on what you describe, this sounds like a tension-type headache, most likely brought on by "
+    "stress, poor sleep and not drinking enough water. Take ibuprofen 400 mg with food up to three times "
+    "a day for the next two days. Drink at least two litres of water daily and rest in a quiet, dark room. "
+    "Avoid screens for an hour before bed. If the pain suddenly becomes the worst of your life, or you "
+    "notice weakness, confusion or trouble speaking, seek emergency care right away."
+)
+
+REPORT_JSON = {
+    "patient_symptoms": "Dull frontal headache for three days, worse in the evening, with poor sleep",
+    "diagnosis": "Tension-type headache",
+    "medications": ["Ibuprofen 400 mg with food, up to three times a day for two days"],
+    "lifestyle_advice": "Drink two litres of water daily, regular sleep, fewer late screens",
+    "precautions": "Seek emergency care for sudden severe pain, weakness or confusion",
+    "follow_up": "Return if not better within a week"
+}
+
+
+class FakeGeminiModel:
+    """
+    Stand-in for genai.GenerativeModel
+
+    Implements generate_content_async, the only call GeminiService makes.
+    The first token arrives after a draw from the latency model, the rest
+    at tokens_per_second in chunks of chunk_tokens.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        tokens_per_second: float = 80.0,
+        chunk_tokens: int = 8,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _answer(self, prompt: str) -> str:
+        if "JSON FORMAT" in prompt:
+            return "```json\n" + json.dumps(REPORT_JSON, indent=2) + "\n```"
+        if "JUST GREET" in prompt:
+            return "Hello! I'm Dr. MediVoice. How can I help you today?"
+        return ANSWER_TEXT
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self._random.random() < self.error_rate:
+            raise InjectedError("Injected Gemini error")
+
+        words = self._answer(str(prompt)).split(" ")
+        chunks = [
+            " ".join(words[i:i + self.chunk_tokens]) + (" " if i + self.chunk_tokens < len(words) else "")
+            for i in range(0, len(words), self.chunk_tokens)
+        ]
+        cadence = self.chunk_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        if stream:
+            return _TextStream(chunks, cadence)
+        # Non-streaming calls return after the whole answer was generated
+        await asyncio.sleep(cadence * (len(chunks) - 1))
+        return _Text("".join(chunks))
+
+    @classmethod
+    def from_env(cls) -> "FakeGeminiModel":
+        seed = os.getenv("BENCH_SEED")
+        return cls(
+            LatencyModel.from_env("BENCH_GEMINI", 600, 2000),
+            tokens_per_second=float(os.getenv("BENCH_GEMINI_TOKENS_PER_SECOND", 80)),
+            chunk_tokens=int(os.getenv("BENCH_GEMINI_CHUNK_TOKENS", 8)),
+            error_rate=float(os.getenv("BENCH_GEMINI_ERROR_RATE", 0)),
+            seed=int(seed) if seed else None
+        )
+
+
+class _FakeRecognizer(Recognizer):
+    def __init__(self, engine: "FakeSTTEngine", language_code: str):
+        self.engine = engine
+        self.language_code = language_code
+        self._bytes = 0
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        # Engines block their worker thread, so this one does too
+        time.sleep(len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH) * self.engine.real_time_factor)
+        self._bytes += len(pcm)
+        return self._transcript()
+
+    def _transcript(self) -> str:
+        seconds = self._bytes / (SAMPLE_RATE * SAMPLE_WIDTH)
+        return f"I have had a headache for {seconds:.0f} days"
+
+    def finish(self) -> str:
+        time.sleep(self.engine.latency.sample())
+        if self.engine.should_fail():
+            raise InjectedError("Injected speech-to-text error")
+        return self._transcript() if self._bytes else ""
+
+
+class FakeSTTEngine(STTEngine):
+    """
+    Stand-in STT engine
+
+    Costs real_time_factor seconds of worker time per second of audio, plus
+    a finalization latency drawn from the latency model.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: LatencyModel, real_time_factor: float = 0.1, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.real_time_factor = real_time_factor
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def should_fail(self) -> bool:
+        return self._random.random() < self.error_rate
+
+    def recognizer(self, language_code: str) -> Recognizer:
+        return _FakeRecognizer(self, language_code)
+
+    @classmethod
+    def from_env(cls) -> "FakeSTTEngine":
+        seed = os.getenv("BENCH_SEED")
+        return cls(
+            LatencyModel.from_env("BENCH_STT", 50, 200),
+            real_time_factor=float(os.getenv("BENCH_STT_REAL_TIME_FACTOR", 0.1)),
+            error_rate=float(os.getenv("BENCH_STT_ERROR_RATE", 0)),
+            seed=int(seed) if seed else None
+        )
+
+
+def create_tts_app(
+    latency: LatencyModel,
+    chunk_bytes: int = 4096,
+    chunk_interval_ms: float = 40,
+    bytes_per_char: int = 180,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None
+) -> Starlette:
+    """
+    Stand-in for the ElevenLabs HTTP API
+
+    Serves POST /v1/text-to-speech/{voice_id}: the first chunk after a draw
+    from the latency model, the rest every chunk_interval_ms. The audio is
+    sized like real MP3 (about bytes_per_char per input character).
+    """
+    rng = random.Random(seed)
+    stats: Dict[str, int] = {"requests": 0, "errors": 0}
+
+    async def text_to_speech(request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"detail": {"status": "injected_error"}}, status_code=500)
+
+        size = max(chunk_bytes, len(body.get("text", "")) * bytes_per_char)
+        first_delay = latency.sample()
+
+        async def audio():
+            await asyncio.sleep(first_delay)
+            sent = 0
+            while sent < size:
+                chunk = min(chunk_bytes, size - sent)
+                yield _MP3_FRAME_HEADER + b"\x00" * (chunk - len(_MP3_FRAME_HEADER))
+                sent += chunk
+                if sent < size:
+                    await asyncio.sleep(chunk_interval_ms / 1000)
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/v1/text-to-speech/{voice_id}", text_to_speech, methods=["POST"]),
+        Route("/v1/text-to-speech/{voice_id}/stream", text_to_speech, methods=["POST"]),
+        Route("/stats", get_stats)
+    ])
+
+
+def create_tts_app_from_env() -> Starlette:
+    seed = os.getenv("BENCH_SEED")
+    return create_tts_app(
+        LatencyModel.from_env("BENCH_TTS", 300, 1200),
+        chunk_bytes=int(os.getenv("BENCH_TTS_CHUNK_BYTES", 4096)),
+        chunk_interval_ms=float(os.getenv("BENCH_TTS_CHUNK_INTERVAL_MS", 40)),
+        error_rate=float(os.getenv("BENCH_TTS_ERROR_RATE", 0)),
+        seed=int(seed) if seed else None
+    )
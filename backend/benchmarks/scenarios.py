@@ -0,0 +1,94 @@
+"""
+Scenarios - Consultations Replayed by the Load Driver
+Multi-turn scripts in several languages, plus synthetic voice recordings
+"""
+
+import io
+import math
+import wave
+import random
+from typing import Dict, List
+
+CONSULTATIONS: List[Dict] = [
+    {
+        "language": "en",
+        "turns": [
+            "Hello",
+            "I have had a headache for three days",
+            "It is a dull pain across my forehead, about 6 out of 10",
+            "It gets worse in the evening and I am not sleeping well",
+            "I have not taken anything for it yet",
+            "Thank you, doctor"
+        ]
+    },
+    {
+        "language": "en",
+        "turns": [
+            "Hi",
+            "My throat has been sore since yesterday",
+            "I also have a mild fever, 38.2",
+            "No cough, but swallowing hurts",
+            "Thanks"
+        ]
+    },
+    {
+        "language": "es",
+        "turns": [
+            "Hola",
+            "Tengo dolor de estómago desde ayer",
+            "Es un dolor moderado y tengo náuseas",
+            "No he vomitado",
+            "Gracias"
+        ]
+    },
+    {
+        "language": "fr",
+        "turns": [
+            "Bonjour",
+            "J'ai mal au dos depuis une semaine",
+            "La douleur est forte le matin",
+            "Merci docteur"
+        ]
+    },
+    {
+        "language": "en",
+        "turns": [
+            "Hello",
+            "I have chest pain and my left arm feels numb",
+            "It started twenty minutes ago"
+        ]
+    }
+]
+
+
+def pick_consultation(rng: random.Random) -> Dict:
+    return rng.choice(CONSULTATIONS)
+
+
+def make_recording(seconds: float, rng: random.Random, sample_rate: int = 16000) -> bytes:
+    """
+    A WAV recording: leading silence, then a voice-like tone with noise
+
+    Shaped so the voice activity detector has both silence to drop and
+    speech to keep.
+    """
+    frames = bytearray()
+    silence = int(0.5 * sample_rate)
+    total = int(seconds * sample_rate)
+    base = rng.uniform(110, 220)
+    for n in range(total):
+        if n < silence:
+            value = rng.gauss(0, 30)
+        else:
+            t = n / sample_rate
+            envelope = 0.6 + 0.4 * math.sin(2 * math.pi * 3 * t)
+            value = envelope * 6000 * math.sin(2 * math.pi * base * t) + rng.gauss(0, 300)
+        frames += int(max(-32768, min(32767, value))).to_bytes(2, "little", signed=True)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
@@ -0,0 +1,55 @@
+"""
+Benchmark Server - The Application Wired to the Stand-Ins
+Run under uvicorn (one import per worker process). ElevenLabs is reached over
+HTTP at ELEVENLABS_BASE_URL; Gemini and speech-to-text are replaced in-process
+right after the service registry starts
+"""
+
+import os
+import resource
+from contextlib import asynccontextmanager
+
+# Placeholders so the real clients can be built; no request reaches Google or ElevenLabs
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("ELEVENLABS_API_KEY", "benchmark")
+os.environ.setdefault("STT_ENGINE", "stub")
+
+from main import app  # noqa: E402
+from benchmarks.fake_upstreams import FakeGeminiModel, FakeSTTEngine  # noqa: E402
+
+_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(application):
+    async with _lifespan(application):
+        services = application.state.services
+        if services.gemini is not None:
+            services.gemini.model = FakeGeminiModel.from_env()
+        if services.speech is not None:
+            services.speech.engine = FakeSTTEngine.from_env()
+        yield
+
+
+app.router.lifespan_context = lifespan
+
+
+def _memory() -> dict:
+    """Resident and peak memory of this worker, in MB"""
+    rss_mb = None
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"pid": os.getpid(), "rss_mb": round(rss_mb or peak_mb, 1), "peak_rss_mb": round(peak_mb, 1)}
+
+
+@app.get("/__bench/memory", include_in_schema=False)
+async def bench_memory():
+    return _memory()
@@ -3,15 +3,26 @@ MediVoice AI - Multilingual Voice Medical Assistant
 Main FastAPI application entry point
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, WebSocket, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
+import json
 import os
+import time
+import uuid
+from email.utils import formatdate
 from dotenv import load_dotenv
 import logging
 
+from services.metrics import REGISTRY, MetricsMiddleware, server_timing_enabled, stage
+from services.admission import AdmissionRejected
+
 # Load environment variables
 load_dotenv()
 
@@ -19,11 +30,34 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build shared services once at startup and close them on shutdown"""
+    # Import services (lazy loading to avoid startup issues)
+    from services.registry import ServiceRegistry
+
+    registry = ServiceRegistry()
+    await registry.startup()
+    app.state.services = registry
+    try:
+        yield
+    finally:
+        await registry.shutdown()
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose serialization is recorded as the encode_json stage"""
+
+    def render(self, content) -> bytes:
+        with stage("encode_json"):
+            return super().render(content)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="MediVoice AI",
     description="Multilingual Voice Medical Assistant powered by Google Gemini and ElevenLabs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse
 )
 
 # CORS Configuration
@@ -35,41 +69,172 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser devtools show the Server-Timing breakdown cross-origin
+    expose_headers=["Server-Timing"],
 )
 
+# Request durations by route, and per-request stage timings in Server-Timing
+app.add_middleware(MetricsMiddleware, server_timing=server_timing_enabled())
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed load: 429 (rate limit) or 503 (queue full / deadline) with a retry hint"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Pydantic Models
 class ReportRequest(BaseModel):
-    conversation_history: List[dict]
+    conversation_history: Optional[List[dict]] = []
     language: str = "en"
+    conversation_id: Optional[str] = None
 
 class ConversationRequest(BaseModel):
     message: str
     language: str = "en"
     patient_id: Optional[str] = None
+    # Sessions are kept server-side: after the first turn, send the returned
+    # conversation_id and only the new message. conversation_history is used
+    # to seed a new (or expired) session.
+    conversation_id: Optional[str] = None
     conversation_history: Optional[List[dict]] = []
+    # Return the text as soon as it is ready; audio_url resolves once synthesized
+    defer_audio: bool = False
+    # Speech format: mp3, Ogg/Opus ("opus"), WebM/Opus ("webm") or raw 16-bit
+    # PCM for telephony bridges; the tier trades bitrate/sample rate for size
+    audio_format: Literal["mp3", "opus", "webm", "pcm"] = "mp3"
+    audio_quality: Literal["low", "standard", "high"] = "high"
 
 class ConversationResponse(BaseModel):
     text_response: str
     audio_url: Optional[str] = None
+    audio_pending: bool = False
+    # Format actually sent (pre-rendered greetings and emergency audio are MP3)
+    audio_format: str = "mp3"
     conversation_id: str
     language: str
     medical_context: Optional[dict] = None
+    timings: Optional[dict] = None
+    # Set when an emergency was answered from the fast path; GET it for the detailed answer
+    followup_url: Optional[str] = None
 
 class HealthCheckResponse(BaseModel):
     status: str
     version: str
     services: dict
 
+# Service Dependencies
+def get_gemini_service(request: Request):
+    """Shared GeminiService built at startup"""
+    service = request.app.state.services.gemini
+    if service is None:
+        raise HTTPException(status_code=503, detail="Gemini service is not configured")
+    return service
+
+def get_elevenlabs_service(request: Request):
+    """Shared ElevenLabsService built at startup (None when not configured)"""
+    return request.app.state.services.elevenlabs
+
+def get_speech_service(request: Request):
+    """Shared SpeechService built at startup"""
+    service = request.app.state.services.speech
+    if service is None:
+        raise HTTPException(status_code=503, detail="Speech-to-text is not configured")
+    return service
+
+def require_speech_language(speech_service, language: str):
+    """503 up front when no speech model is installed for the language"""
+    if not speech_service.supports(language):
+        raise HTTPException(status_code=503, detail=f"Speech-to-text is not available for language: {language}")
+
+def get_batch_transcriber(request: Request):
+    """Shared batch transcriber (process pool for decoding)"""
+    batch = request.app.state.services.batch
+    if batch is None:
+        raise HTTPException(status_code=503, detail="Speech-to-text is not configured")
+    return batch
+
+def get_session_store(request: Request):
+    """Shared server-side session store"""
+    return request.app.state.services.sessions
+
+def get_pipeline(request: Request):
+    """Shared conversation turn pipeline"""
+    pipeline = request.app.state.services.pipeline
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Gemini service is not configured")
+    return pipeline
+
+def get_emergency_responder(request: Request):
+    """Shared emergency fast path"""
+    return request.app.state.services.emergency
+
+def get_idempotency_store(request: Request):
+    """Shared store of responses by Idempotency-Key"""
+    return request.app.state.services.idempotency
+
+def get_report_jobs(request: Request):
+    """Shared report job queue"""
+    report_jobs = request.app.state.services.reports
+    if report_jobs is None:
+        raise HTTPException(status_code=503, detail="Gemini service is not configured")
+    return report_jobs
+
+def get_greeting_store(request: Request):
+    """Shared pre-rendered greetings"""
+    return request.app.state.services.greetings
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need the ADMIN_TOKEN value in the X-Admin-Token header"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+# How often an in-flight request checks whether its client went away
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", 0.5))
+
+async def run_until_disconnected(http_request: Request, awaitable):
+    """
+    Await an upstream call, cancelling it if the client disconnects
+
+    Raises:
+        HTTPException(499) when the client went away before completion
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling upstream call")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
 # Health Check Endpoint
 @app.get("/", response_model=HealthCheckResponse)
-async def health_check():
-    """Health check endpoint"""
+async def health_check(request: Request):
+    """
+    Health check endpoint
+    Reports "degraded" (still 200) while an upstream's circuit breaker is not
+    closed; those calls fail fast and fall back until it recovers.
+    """
+    resilience = request.app.state.services.resilience
+    breakers = resilience.breakers() if resilience is not None else {}
     return {
-        "status": "healthy",
+        "status": "degraded" if any(b["state"] != "closed" for b in breakers.values()) else "healthy",
         "version": "1.0.0",
         "services": {
             "gemini": "configured" if os.getenv("GOOGLE_API_KEY") else "not_configured",
-            "elevenlabs": "configured" if os.getenv("ELEVENLABS_API_KEY") else "not_configured"
+            "elevenlabs": "configured" if os.getenv("ELEVENLABS_API_KEY") else "not_configured",
+            "circuit_breakers": breakers
         }
     }
 
@@ -78,99 +243,622 @@ async def api_health():
     """API health check"""
     return {"status": "ok", "message": "MediVoice AI is running"}
 
+async def run_conversation_turn(
+    request: ConversationRequest,
+    pipeline,
+    session_store,
+    emergency
+) -> ConversationResponse:
+    """One conversation turn: the emergency fast path or the full pipeline"""
+    from services.session_store import load_or_create_session
+    from services.pipeline import StageTimings
+    
+    timings = StageTimings()
+    audio_variant = None
+    if pipeline.elevenlabs_service is not None:
+        audio_variant = pipeline.elevenlabs_service.audio_variant(request.audio_format, request.audio_quality)
+    with timings.stage("triage"):
+        triage = emergency.detect(request.message, request.language)
+    
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    
+    async def run_turn():
+        # Hold the conversation from load to save so concurrent writers don't overwrite each other
+        async with session_store.lock(conversation_id):
+            session = await load_or_create_session(
+                session_store,
+                conversation_id,
+                request.conversation_history,
+                request.language,
+                user_message=request.message
+            )
+            return await pipeline.run(
+                user_message=request.message,
+                session=session,
+                language=request.language,
+                defer_audio=request.defer_audio,
+                # Patient-specific turns never use the response cache
+                cacheable=request.patient_id is None,
+                audio_variant=audio_variant
+            )
+    
+    if triage is not None:
+        # Emergency: answer with the pre-synthesized instruction right away
+        # and let the detailed answer finish in the background
+        logger.warning(f"Emergency detected in conversation {conversation_id}, using fast path")
+        emergency.start_followup(conversation_id, run_turn())
+        instruction = emergency.instruction(request.language)
+        return ConversationResponse(
+            text_response=instruction["text"],
+            audio_url=instruction["audio_url"],
+            conversation_id=conversation_id,
+            language=request.language,
+            medical_context={**triage.to_dict(), "requires_followup": True, "fast_path": True},
+            timings=timings.as_dict(),
+            followup_url=f"/api/conversation/{conversation_id}/followup"
+        )
+    
+    # Gemini, then TTS overlapped with analysis and session bookkeeping
+    result = await run_turn()
+    
+    return ConversationResponse(
+        text_response=result.text,
+        audio_url=result.audio_url,
+        audio_pending=result.audio_pending,
+        audio_format=result.audio_format,
+        conversation_id=result.conversation_id,
+        language=request.language,
+        medical_context=result.medical_context,
+        timings=result.timings
+    )
+
 @app.post("/api/conversation", response_model=ConversationResponse)
-async def create_conversation(request: ConversationRequest):
+async def create_conversation(
+    request: ConversationRequest,
+    http_request: Request,
+    pipeline=Depends(get_pipeline),
+    session_store=Depends(get_session_store),
+    emergency=Depends(get_emergency_responder),
+    idempotency=Depends(get_idempotency_store),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Main conversation endpoint
-    Processes user message, generates AI response, and returns voice audio
+    Processes user message, generates AI response, and returns voice audio.
+    With an Idempotency-Key header, retries of the same request join the
+    attempt in flight or get its stored response instead of a second turn.
     """
     try:
         logger.info(f"Received conversation request in language: {request.language}")
         
-        # Import services (lazy loading to avoid startup issues)
-        from services.gemini_service import GeminiService
-        from services.elevenlabs_service import ElevenLabsService
+        def turn():
+            return run_conversation_turn(request, pipeline, session_store, emergency)
         
-        # Initialize services
-        gemini_service = GeminiService()
-        elevenlabs_service = ElevenLabsService()
+        if idempotency_key:
+            from services.single_flight import IdempotencyConflict
+            
+            fingerprint = hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+            try:
+                return await run_until_disconnected(
+                    http_request,
+                    idempotency.run(idempotency_key, fingerprint, turn)
+                )
+            except IdempotencyConflict as e:
+                raise HTTPException(status_code=422, detail=str(e))
         
-        # Generate AI response using Gemini
-        ai_response = await gemini_service.generate_medical_response(
-            user_message=request.message,
-            conversation_history=request.conversation_history,
-            language=request.language
-        )
-        
-        # Generate voice audio using ElevenLabs
-        audio_data = {"audio_url": None}
-        try:
-            audio_data = await elevenlabs_service.text_to_speech(
-                text=ai_response["text"],
-                language=request.language
-            )
-        except Exception as e:
-            logger.error(f"Failed to generate speech: {str(e)}")
-            # Continue without audio
-        
-        # Return response
-        return ConversationResponse(
-            text_response=ai_response["text"],
-            audio_url=audio_data["audio_url"],
-            conversation_id=ai_response.get("conversation_id", "default"),
-            language=request.language,
-            medical_context=ai_response.get("medical_context")
-        )
+        return await run_until_disconnected(http_request, turn())
         
+    except (HTTPException, AdmissionRejected):
+        raise
     except Exception as e:
         logger.error(f"Error in conversation endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/report")
-async def generate_report(request: ReportRequest):
-    """Generate medical report from conversation"""
+# How long GET /api/conversation/{id}/followup waits for the detailed answer
+FOLLOWUP_WAIT_SECONDS = float(os.getenv("FOLLOWUP_WAIT_SECONDS", 60))
+
+@app.get("/api/conversation/{conversation_id}/followup", response_model=ConversationResponse)
+async def get_conversation_followup(
+    conversation_id: str,
+    http_request: Request,
+    emergency=Depends(get_emergency_responder)
+):
+    """Detailed answer for a turn that was answered from the emergency fast path"""
     try:
-        from services.gemini_service import GeminiService
-        service = GeminiService()
-        report = await service.generate_consultation_report(request.conversation_history)
-        return {"report": report}
+        result = await run_until_disconnected(
+            http_request,
+            emergency.get_followup(conversation_id, timeout=FOLLOWUP_WAIT_SECONDS)
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Follow-up answer is not ready yet")
+    except (HTTPException, AdmissionRejected):
+        raise
     except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
+        logger.error(f"Error in follow-up endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    if result is None:
+        raise HTTPException(status_code=404, detail="No follow-up for this conversation")
+
+    return ConversationResponse(
+        text_response=result.text,
+        audio_url=result.audio_url,
+        audio_pending=result.audio_pending,
+        audio_format=result.audio_format,
+        conversation_id=result.conversation_id,
+        language=result.language,
+        medical_context=result.medical_context,
+        timings=result.timings
+    )
+
+def format_sse(event: dict) -> str:
+    """Encode an event dictionary as a Server-Sent Events frame"""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@app.post("/api/conversation/stream")
+async def stream_conversation(
+    request: ConversationRequest,
+    gemini_service=Depends(get_gemini_service),
+    elevenlabs_service=Depends(get_elevenlabs_service),
+    session_store=Depends(get_session_store),
+    greetings=Depends(get_greeting_store),
+    report_jobs=Depends(get_report_jobs)
+):
+    """
+    Streaming conversation endpoint (Server-Sent Events)
+    Streams text deltas as Gemini produces them and audio per sentence, each
+    chunk playable on its own (MP3 unless audio_format asks otherwise)
+    """
+    logger.info(f"Received streaming conversation request in language: {request.language}")
+
+    from services.conversation_stream import stream_conversation_turn
+    from services.session_store import load_or_create_session
+
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+
+    async def load_session():
+        return await load_or_create_session(
+            session_store,
+            conversation_id,
+            request.conversation_history,
+            request.language,
+            user_message=request.message
+        )
+
+    # Read-only look for the admission check; the turn reloads it under the lock
+    session = await load_session()
+
+    triage = gemini_service.triage.scan(request.message, request.language)
+    if gemini_service.limiter is not None and (
+        greetings is None or not greetings.will_greet(session, request.message, request.language, triage)
+    ):
+        # Refuse with a real 429/503 now rather than an error event after the 200
+        from services.admission import turn_priority
+        gemini_service.limiter.check(turn_priority(triage))
+
+    audio_variant = None
+    if elevenlabs_service is not None:
+        audio_variant = elevenlabs_service.audio_variant(request.audio_format, request.audio_quality)
+
+    async def event_source():
+        try:
+            async with session_store.lock(conversation_id):
+                session = await load_session()
+                async for event in stream_conversation_turn(
+                    gemini_service,
+                    elevenlabs_service,
+                    user_message=request.message,
+                    language=request.language,
+                    session=session,
+                    cacheable=request.patient_id is None,
+                    greetings=greetings,
+                    audio_variant=audio_variant
+                ):
+                    # Don't store the canned reply used when Gemini failed
+                    if event["event"] == "done" and not event["data"]["fallback"]:
+                        session.record_turn(request.message, event["data"]["text"])
+                        await session_store.save(session)
+                        report_jobs.schedule_update(session.conversation_id)
+                    yield format_sse(event)
+        except AdmissionRejected as e:
+            yield format_sse({
+                "event": "error",
+                "data": {"detail": str(e), "status": e.status_code, "retry_after": e.retry_after}
+            })
+        except Exception as e:
+            logger.error(f"Error in streaming conversation endpoint: {str(e)}")
+            yield format_sse({"event": "error", "data": {"detail": str(e)}})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def submit_report_job(request: ReportRequest, report_jobs, session_store):
+    """
+    Queue the report for a request
+
+    A server-side session reports from its incrementally maintained state;
+    otherwise the client's history is sent as a full transcript.
+    """
+    from services.reports import ReportQueueFull
+
+    session = None
+    if request.conversation_id:
+        session = await session_store.get(request.conversation_id)
+
+    try:
+        if session is not None and session.history:
+            return report_jobs.submit_session(session)
+        if not request.conversation_history:
+            raise HTTPException(status_code=400, detail="The conversation is empty")
+        return report_jobs.submit(request.conversation_history)
+    except ReportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+@app.post("/api/report/jobs", status_code=202)
+async def create_report_job(
+    request: ReportRequest,
+    report_jobs=Depends(get_report_jobs),
+    session_store=Depends(get_session_store)
+):
+    """
+    Queue a medical report for a conversation
+    Poll the returned status_url or subscribe to events_url (Server-Sent Events).
+    Requests for a transcript that already has a job get that job back.
+    """
+    job = await submit_report_job(request, report_jobs, session_store)
+    return {
+        **job.to_dict(),
+        "status_url": f"/api/report/jobs/{job.job_id}",
+        "events_url": f"/api/report/jobs/{job.job_id}/events"
+    }
+
+@app.get("/api/report/jobs/{job_id}")
+async def get_report_job(job_id: str, report_jobs=Depends(get_report_jobs)):
+    """Status of a report job, with the report once it is done"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job.to_dict()
+
+@app.get("/api/report/jobs/{job_id}/events")
+async def stream_report_job(job_id: str, report_jobs=Depends(get_report_jobs)):
+    """
+    Report job progress (Server-Sent Events)
+    Sends status events while the job waits or runs, then report or error
+    """
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+
+    async def event_source():
+        async for state in report_jobs.watch(job):
+            if state["status"] == "done":
+                event = "report"
+            elif state["status"] == "failed":
+                event = "error"
+            else:
+                event = "status"
+            yield format_sse({"event": event, "data": state})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/conversation/{conversation_id}/report")
+async def get_conversation_report(conversation_id: str, session_store=Depends(get_session_store)):
+    """
+    The session's report as last updated in the background (no model call)
+    up_to_date is false while the latest turns are still being folded in.
+    """
+    session = await session_store.get(conversation_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {
+        "conversation_id": conversation_id,
+        "report": session.report,
+        "up_to_date": session.report is not None and session.reported_count >= len(session.history)
+    }
+
+@app.post("/api/report")
+async def generate_report(
+    request: ReportRequest,
+    http_request: Request,
+    report_jobs=Depends(get_report_jobs),
+    session_store=Depends(get_session_store)
+):
+    """Generate medical report from conversation (waits for the report job)"""
+    job = await submit_report_job(request, report_jobs, session_store)
+    await run_until_disconnected(http_request, report_jobs.wait(job))
+    if job.status == "failed":
+        if job.retry_after is not None:
+            raise HTTPException(status_code=503, detail=job.error, headers={"Retry-After": str(job.retry_after)})
+        raise HTTPException(status_code=500, detail=job.error)
+    return {"report": job.report.model_dump(), "job_id": job.job_id}
+
 @app.post("/api/voice-input")
-async def process_voice_input(audio: UploadFile = File(...), language: str = "en"):
+async def process_voice_input(
+    audio: UploadFile = File(...),
+    language: str = "en",
+    speech_service=Depends(get_speech_service)
+):
     """
     Process voice input from user
-    Converts speech to text and processes the conversation
+    Decodes the upload as it is read, drops silence and converts speech to text
     """
+    from services.audio_ingest import create_audio_ingest, IngestLimitExceeded, AudioDecodeError
+    
+    require_speech_language(speech_service, language)
     try:
         logger.info(f"Received voice input in language: {language}")
         
-        # Import services
-        from services.speech_service import SpeechService
-        
-        # Initialize speech service
-        speech_service = SpeechService()
-        
-        # Read audio file
-        audio_content = await audio.read()
-        
-        # Convert speech to text
-        transcription = await speech_service.speech_to_text(
-            audio_content=audio_content,
-            language=language
-        )
+        # Decode and VAD-filter the upload chunk by chunk, feeding speech to STT as it comes
+        ingest = create_audio_ingest()
+        transcription = await speech_service.transcribe_stream(ingest.voiced_pcm(audio), language)
         
         return {
             "transcription": transcription,
-            "language": language
+            "language": language,
+            "duration_seconds": round(ingest.duration_seconds, 2),
+            "speech_seconds": round(ingest.speech_seconds, 2)
         }
         
+    except IngestLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Error in voice input endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/voice-input/batch")
+async def process_voice_input_batch(
+    files: List[UploadFile] = File(...),
+    language: str = "en",
+    batch=Depends(get_batch_transcriber)
+):
+    """
+    Transcribe many recordings (or zip archives of recordings) at once
+    Streams one NDJSON line per file as results complete, then a summary line
+    """
+    logger.info(f"Received batch voice input with {len(files)} uploads in language: {language}")
+    require_speech_language(batch.speech_service, language)
+    
+    uploads, rejected = await batch.read_uploads(files)
+    
+    async def results():
+        completed = failed = 0
+        try:
+            async for result in batch.transcribe(uploads, language, rejected):
+                if "error" in result:
+                    failed += 1
+                else:
+                    completed += 1
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.error(f"Error in batch voice input endpoint: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
+        yield json.dumps({"summary": {"transcribed": completed, "failed": failed}}) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/session")
+async def voice_session(
+    websocket: WebSocket,
+    language: str = "en",
+    conversation_id: Optional[str] = None,
+    audio_format: str = "mp3",
+    audio_quality: str = "high"
+):
+    """
+    Full-duplex voice consultation
+    One connection per consultation; see services/voice_session.py for the protocol.
+    audio_format/audio_quality pick the binary audio frames (e.g. pcm/low,
+    16 kHz raw PCM, for telephony bridges).
+    """
+    from services.voice_session import VoiceSession
+    from services.audio_ingest import create_vad
+
+    services = websocket.app.state.services
+    await websocket.accept()
+
+    if services.gemini is None:
+        await websocket.send_json({"type": "error", "detail": "Gemini service is not configured"})
+        await websocket.close(code=1011)
+        return
+    if services.speech is None or not services.speech.supports(language):
+        # 1013: try again later, the WebSocket counterpart of a 503
+        if services.speech is None:
+            detail = "Speech-to-text is not configured"
+        else:
+            detail = f"Speech-to-text is not available for language: {language}"
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=1013)
+        return
+
+    session = VoiceSession(
+        websocket,
+        gemini_service=services.gemini,
+        elevenlabs_service=services.elevenlabs,
+        speech_service=services.speech,
+        session_store=services.sessions,
+        language=language,
+        conversation_id=conversation_id,
+        greetings=services.greetings,
+        reports=services.reports,
+        audio_variant=services.elevenlabs.audio_variant(audio_format, audio_quality) if services.elevenlabs else None,
+        vad=create_vad()
+    )
+    logger.info(f"Voice session {session.conversation_id} opened in language: {language}")
+    try:
+        await session.run()
+    except Exception as e:
+        logger.error(f"Error in voice session: {str(e)}")
+    finally:
+        logger.info(f"Voice session {session.conversation_id} closed")
+
+# Size of the body chunks used when streaming audio
+AUDIO_CHUNK_BYTES = 64 * 1024
+
+# How long GET /api/audio/{id} waits for deferred audio that is still being synthesized
+AUDIO_WAIT_SECONDS = float(os.getenv("AUDIO_WAIT_SECONDS", 30))
+
+@app.get("/api/audio/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    """
+    Serve synthesized audio by id
+    Supports Range requests (206) and ETag revalidation (304)
+    """
+    from services.audio_store import parse_range_header
+
+    services = request.app.state.services
+    # Deferred audio may still be synthesizing; wait for it briefly. Expired
+    # artifacts stay gone even when the TTS cache still holds their audio.
+    artifact = await services.audio_store.wait_for(audio_id, timeout=AUDIO_WAIT_SECONDS)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+
+    max_age = max(0, int(artifact.expires_at - time.time()))
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": artifact.etag,
+        "Cache-Control": f"private, max-age={max_age}",
+        "Expires": formatdate(artifact.expires_at, usegmt=True)
+    }
+
+    if request.headers.get("if-none-match") == artifact.etag:
+        return Response(status_code=304, headers=headers)
+
+    # A stale If-Range validator means the client must refetch the whole body
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != artifact.etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range_header(range_header, artifact.size)
+    except ValueError:
+        return Response(
+            status_code=416,
+            headers={**headers, "Content-Range": f"bytes */{artifact.size}"}
+        )
+
+    status_code = 200
+    start, end = 0, artifact.size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{artifact.size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    view = memoryview(artifact.data)[start:end + 1]
+
+    async def body():
+        for offset in range(0, len(view), AUDIO_CHUNK_BYTES):
+            yield bytes(view[offset:offset + AUDIO_CHUNK_BYTES])
+
+    return StreamingResponse(
+        body(),
+        status_code=status_code,
+        media_type=artifact.content_type,
+        headers=headers
+    )
+
+@app.get("/api/tts/cache")
+async def get_tts_cache_stats(request: Request):
+    """TTS cache hit/miss metrics"""
+    cache = request.app.state.services.tts_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/api/gemini/cache")
+async def get_gemini_cache_stats(request: Request):
+    """Gemini response cache hit/miss metrics"""
+    gemini = request.app.state.services.gemini
+    if gemini is None or gemini.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **gemini.response_cache.stats()}
+
+class GreetingRefreshRequest(BaseModel):
+    # Ask Gemini for new wording; otherwise the current texts are re-synthesized
+    regenerate: bool = False
+    variants: int = 2
+
+@app.post("/api/admin/greetings/refresh")
+async def refresh_greetings(
+    request: GreetingRefreshRequest,
+    http_request: Request,
+    _=Depends(require_admin)
+):
+    """Rebuild the pre-rendered greetings (and their audio)"""
+    services = http_request.app.state.services
+    if services.greetings is None:
+        raise HTTPException(status_code=503, detail="Greetings are not configured")
+    if request.regenerate and services.gemini is None:
+        raise HTTPException(status_code=503, detail="Gemini service is not configured")
+
+    counts = await services.greetings.refresh(
+        services.gemini if request.regenerate else None,
+        variants=max(1, min(request.variants, 5))
+    )
+    return {"languages": counts}
+
+@app.get("/api/single-flight")
+async def get_single_flight_stats(request: Request):
+    """Coalesced upstream calls and idempotent request replays"""
+    services = request.app.state.services
+    return {
+        "upstream": services.single_flight.stats(),
+        "idempotency": services.idempotency.stats()
+    }
+
+@app.get("/api/admission")
+async def get_admission_stats(request: Request):
+    """Per-upstream slots in use, queue depth by priority and shed calls"""
+    return request.app.state.services.admission.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of this process (stage latencies, upstream errors, cache hit rates)"""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+class ProfilerStartRequest(BaseModel):
+    interval_ms: float = 10
+
+@app.get("/api/admin/profiler")
+async def get_profiler_status(http_request: Request, _=Depends(require_admin)):
+    """Sampling profiler state"""
+    return http_request.app.state.services.profiler.stats()
+
+@app.post("/api/admin/profiler/start")
+async def start_profiler(request: ProfilerStartRequest, http_request: Request, _=Depends(require_admin)):
+    """Start sampling stacks (discards the previous profile)"""
+    profiler = http_request.app.state.services.profiler
+    if not profiler.start(max(1.0, request.interval_ms)):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.stats()
+
+@app.post("/api/admin/profiler/stop")
+async def stop_profiler(http_request: Request, _=Depends(require_admin)):
+    """Stop sampling; the profile stays available at /api/admin/profiler/profile"""
+    profiler = http_request.app.state.services.profiler
+    if not profiler.stop():
+        raise HTTPException(status_code=409, detail="Profiler is not running")
+    return profiler.stats()
+
+@app.get("/api/admin/profiler/profile")
+async def get_profile(http_request: Request, _=Depends(require_admin)):
+    """Collapsed stacks ("frame;frame;... count"), as read by flamegraph.pl or speedscope"""
+    profile = http_request.app.state.services.profiler.collapsed()
+    return Response(profile, media_type="text/plain; charset=utf-8")
+
 @app.get("/api/languages")
 async def get_supported_languages():
     """Get list of supported languages"""
@@ -0,0 +1,346 @@
+"""
+Admission Control - Per-Upstream Concurrency and Rate Limits
+Bounded priority queues in front of Gemini, ElevenLabs and speech-to-text;
+work that cannot start within its queue deadline is shed with a retry hint
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+EMERGENCY, URGENT, NORMAL, BACKGROUND = 0, 1, 2, 3
+PRIORITY_NAMES = {EMERGENCY: "emergency", URGENT: "urgent", NORMAL: "normal", BACKGROUND: "background"}
+
+# Priority of the upstream calls made by the current task (and tasks it spawns)
+_priority: ContextVar[int] = ContextVar("admission_priority", default=NORMAL)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def priority(level: int):
+    """Run a block's upstream calls at a priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_task_priority(level: int):
+    """Set the priority for the rest of the current task (e.g. a background worker)"""
+    _priority.set(level)
+
+
+def turn_priority(triage_result) -> int:
+    """Priority of a conversation turn from the triage of the user's message"""
+    if triage_result.is_emergency:
+        return EMERGENCY
+    if triage_result.is_urgent:
+        return URGENT
+    return NORMAL
+
+
+class AdmissionRejected(Exception):
+    """Upstream work shed by admission control; answered with 429/503 and Retry-After"""
+
+    def __init__(self, upstream: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{upstream} is at capacity ({reason}), retry in {retry_after}s")
+        self.upstream = upstream
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until tokens are available, if no one else takes any"""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "future", "timer", "state", "enqueued_at")
+
+    def __init__(self, priority: int, future: asyncio.Future):
+        self.priority = priority
+        self.future = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # queued -> granted | rejected | gone (caller left)
+        self.state = "queued"
+        self.enqueued_at = time.monotonic()
+
+
+class UpstreamLimiter:
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        rate: float = 0.0,
+        burst: Optional[float] = None,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0
+    ):
+        """
+        Initialize the limiter
+
+        Args:
+            name: Upstream name used in errors and metrics
+            concurrency: Calls allowed in flight at once
+            rate: Calls started per second (token bucket); 0 disables it
+            burst: Bucket size (default: one second of rate)
+            max_queue: Calls allowed to wait; a higher-priority arrival
+                displaces the newest lowest-priority waiter when full
+            queue_timeout: Longest a call may wait before it is shed
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+
+        self._active = 0
+        self._queued = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = 0
+        self._dead = 0
+        self._refill_timer: Optional[asyncio.TimerHandle] = None
+        # Moving average of how long a call holds its slot
+        self._avg_hold: Optional[float] = None
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected: Dict[str, int] = {"rate_limit": 0, "queue_full": 0, "displaced": 0, "deadline": 0}
+
+    def _retry_after(self, extra_wait: float = 0.0) -> int:
+        hold = self._avg_hold or 1.0
+        seconds = max(extra_wait, hold * (self._queued + 1) / self.concurrency)
+        return max(1, min(60, math.ceil(seconds)))
+
+    def _reject(self, reason: str, status_code: int, extra_wait: float = 0.0) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(self.name, reason.replace("_", " "), status_code, self._retry_after(extra_wait))
+
+    def _live_waiters(self):
+        return (waiter for _, _, waiter in self._heap if waiter.state == "queued")
+
+    def check(self, level: Optional[int] = None):
+        """
+        Raise AdmissionRejected if a call at this priority would be shed right away
+
+        Lets an endpoint refuse work before it commits to a response (e.g.
+        before opening an event stream).
+        """
+        level = current_priority() if level is None else level
+        if self._bucket is not None:
+            ahead = sum(1 for waiter in self._live_waiters() if waiter.priority <= level)
+            wait = self._bucket.wait_time(ahead + 1)
+            if wait > self.queue_timeout:
+                raise self._reject("rate_limit", 429, wait)
+        if self._queued >= self.max_queue and not any(w.priority > level for w in self._live_waiters()):
+            raise self._reject("queue_full", 503)
+
+    async def acquire(self, level: Optional[int] = None):
+        """Wait for a slot (and a rate token); raises AdmissionRejected when shed"""
+        level = current_priority() if level is None else level
+        if self._queued == 0 and self._active < self.concurrency and (self._bucket is None or self._bucket.try_take()):
+            self._active += 1
+            self.admitted += 1
+            return
+
+        self.check(level)
+        if self._queued >= self.max_queue:
+            self._displace()
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(level, loop.create_future())
+        self._sequence += 1
+        heapq.heappush(self._heap, (level, self._sequence, waiter))
+        self._queued += 1
+        self.queued_total += 1
+        waiter.timer = loop.call_later(self.queue_timeout, self._expire, waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except BaseException:
+            if waiter.state == "granted":
+                # Granted while the caller was being cancelled
+                self.release(0.0)
+            elif waiter.state == "queued":
+                self._forget(waiter, "gone")
+            raise
+
+    def has_capacity(self) -> bool:
+        """True when a call would start right away (no one waiting, a slot free)"""
+        return self._queued == 0 and self._active < self.concurrency
+
+    def release(self, held_seconds: float):
+        self._active -= 1
+        self._avg_hold = held_seconds if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, level: Optional[int] = None):
+        """Hold a slot for the duration of the block"""
+        await self.acquire(level)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _dispatch(self):
+        while self._heap and self._active < self.concurrency:
+            waiter = self._heap[0][2]
+            if waiter.state != "queued":
+                heapq.heappop(self._heap)
+                self._dead -= 1
+                continue
+            if self._bucket is not None and not self._bucket.try_take():
+                self._arm_refill()
+                return
+            heapq.heappop(self._heap)
+            waiter.state = "granted"
+            waiter.timer.cancel()
+            self._queued -= 1
+            self._active += 1
+            self.admitted += 1
+            waiter.future.set_result(None)
+
+    def _arm_refill(self):
+        if self._refill_timer is None:
+            delay = self._bucket.wait_time(1)
+            self._refill_timer = asyncio.get_running_loop().call_later(delay, self._on_refill)
+
+    def _on_refill(self):
+        self._refill_timer = None
+        self._dispatch()
+
+    def _forget(self, waiter: _Waiter, state: str):
+        waiter.state = state
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+        self._queued -= 1
+        self._dead += 1
+        if self._dead > self.max_queue:
+            # Drop entries of waiters that left, so the heap stays bounded
+            self._heap = [entry for entry in self._heap if entry[2].state == "queued"]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def _expire(self, waiter: _Waiter):
+        if waiter.state != "queued":
+            return
+        self._forget(waiter, "rejected")
+        waiter.future.set_exception(self._reject("deadline", 503))
+
+    def _displace(self):
+        # The newest of the lowest-priority waiters makes room
+        _, _, victim = max((entry for entry in self._heap if entry[2].state == "queued"), key=lambda entry: entry[:2])
+        self._forget(victim, "rejected")
+        victim.future.set_exception(self._reject("displaced", 503))
+
+    def stats(self) -> Dict:
+        queued_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for waiter in self._live_waiters():
+            queued_by_priority[PRIORITY_NAMES[waiter.priority]] += 1
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": self._queued,
+            "queued_by_priority": queued_by_priority,
+            "admitted": self.admitted,
+            "waited": self.queued_total,
+            "rejected": dict(self.rejected),
+            "rate_tokens": round(self._bucket.tokens, 2) if self._bucket is not None else None
+        }
+
+
+def admit(limiter: Optional[UpstreamLimiter]):
+    """limiter.slot(), or a no-op when the upstream is not limited"""
+    return limiter.slot() if limiter is not None else nullcontext()
+
+
+class AdmissionController:
+    """The limiters of all upstreams"""
+
+    def __init__(self, limiters: Dict[str, UpstreamLimiter]):
+        self.limiters = limiters
+
+    def limiter(self, name: str) -> Optional[UpstreamLimiter]:
+        return self.limiters.get(name)
+
+    def stats(self) -> Dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+    def metric_families(self) -> List[Tuple]:
+        """Per-upstream gauges and rejection counters for /metrics"""
+        active, queued, admitted, rejected = [], [], [], []
+        for name, limiter in self.limiters.items():
+            stats = limiter.stats()
+            active.append(({"upstream": name}, stats["active"]))
+            queued.append(({"upstream": name}, stats["queued"]))
+            admitted.append(({"upstream": name}, stats["admitted"]))
+            for reason, count in stats["rejected"].items():
+                rejected.append(({"upstream": name, "reason": reason}, count))
+        return [
+            ("medivoice_admission_active", "gauge", "Upstream calls holding a slot", active),
+            ("medivoice_admission_queued", "gauge", "Upstream calls waiting for a slot", queued),
+            ("medivoice_admission_admitted_total", "counter", "Upstream calls admitted", admitted),
+            ("medivoice_admission_rejected_total", "counter", "Upstream calls shed, by reason", rejected)
+        ]
+
+
+def _limiter_from_env(name: str, prefix: str, concurrency: int, max_queue: int) -> UpstreamLimiter:
+    burst = os.getenv(f"{prefix}_RATE_BURST")
+    return UpstreamLimiter(
+        name,
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        rate=float(os.getenv(f"{prefix}_RATE_LIMIT", 0)),
+        burst=float(burst) if burst else None,
+        max_queue=int(os.getenv(f"{prefix}_QUEUE_SIZE", max_queue)),
+        queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", 10))
+    )
+
+
+def create_admission() -> AdmissionController:
+    """Build the limiters from the environment (none when ADMISSION_ENABLED is off)"""
+    if os.getenv("ADMISSION_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return AdmissionController({})
+    return AdmissionController({
+        "gemini": _limiter_from_env("gemini", "GEMINI", concurrency=32, max_queue=200),
+        "elevenlabs": _limiter_from_env("elevenlabs", "ELEVENLABS", concurrency=10, max_queue=100),
+        "stt": _limiter_from_env("stt", "STT", concurrency=8, max_queue=50)
+    })
@@ -0,0 +1,192 @@
+"""
+Audio Codecs - Negotiable TTS Output Formats
+Maps a requested format and quality tier to an ElevenLabs output format,
+transcoding locally (Opus) in a worker pool where ElevenLabs has no match
+"""
+
+import io
+import os
+import shutil
+import asyncio
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional
+
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+class AudioVariant:
+    """One concrete output: what to ask ElevenLabs for and what to send the client"""
+
+    def __init__(
+        self,
+        audio_format: str,
+        quality: str,
+        upstream_format: str,
+        content_type: str,
+        suffix: str = "",
+        bitrate_kbps: Optional[int] = None,
+        sample_rate: Optional[int] = None
+    ):
+        self.format = audio_format
+        self.quality = quality
+        self.upstream_format = upstream_format
+        self.content_type = content_type
+        # Appended to the cache key to form the audio id; tells /api/audio the content type
+        self.suffix = suffix
+        self.bitrate_kbps = bitrate_kbps
+        self.sample_rate = sample_rate
+
+    @property
+    def transcoded(self) -> bool:
+        return self.format in ("opus", "webm")
+
+    @property
+    def is_default(self) -> bool:
+        return self is DEFAULT_VARIANT
+
+    def cache_variant(self) -> Dict[str, str]:
+        """Extra make_cache_key fields (none for the default, so existing keys stay valid)"""
+        if self.is_default:
+            return {}
+        return {"format": self.format, "quality": self.quality}
+
+
+def _pcm_variant(quality: str, sample_rate: int) -> AudioVariant:
+    return AudioVariant(
+        "pcm", quality, f"pcm_{sample_rate}",
+        f"audio/pcm;rate={sample_rate};encoding=s16le;channels=1",
+        suffix=f".pcm{sample_rate}", sample_rate=sample_rate
+    )
+
+
+def _opus_variant(audio_format: str, quality: str, sample_rate: int, bitrate_kbps: int) -> AudioVariant:
+    container = "ogg" if audio_format == "opus" else "webm"
+    return AudioVariant(
+        audio_format, quality, f"pcm_{sample_rate}",
+        f"audio/{container};codecs=opus",
+        suffix=f".{container}", bitrate_kbps=bitrate_kbps, sample_rate=sample_rate
+    )
+
+
+VARIANTS: Dict[str, Dict[str, AudioVariant]] = {
+    "mp3": {
+        "low": AudioVariant("mp3", "low", "mp3_22050_32", "audio/mpeg", bitrate_kbps=32, sample_rate=22050),
+        "standard": AudioVariant("mp3", "standard", "mp3_44100_64", "audio/mpeg", bitrate_kbps=64, sample_rate=44100),
+        "high": AudioVariant("mp3", "high", "mp3_44100_128", "audio/mpeg", bitrate_kbps=128, sample_rate=44100)
+    },
+    # Opus accepts 8/12/16/24/48 kHz input; ElevenLabs PCM comes at 16 or 24 kHz
+    "opus": {
+        "low": _opus_variant("opus", "low", 16000, 16),
+        "standard": _opus_variant("opus", "standard", 24000, 24),
+        "high": _opus_variant("opus", "high", 24000, 32)
+    },
+    "webm": {
+        "low": _opus_variant("webm", "low", 16000, 16),
+        "standard": _opus_variant("webm", "standard", 24000, 24),
+        "high": _opus_variant("webm", "high", 24000, 32)
+    },
+    "pcm": {
+        "low": _pcm_variant("low", 16000),
+        "standard": _pcm_variant("standard", 22050),
+        "high": _pcm_variant("high", 24000)
+    }
+}
+
+# What every client got before formats were negotiable
+DEFAULT_VARIANT = VARIANTS["mp3"]["high"]
+
+_CONTENT_TYPES = {variant.suffix: variant.content_type for tiers in VARIANTS.values() for variant in tiers.values()}
+
+
+def split_audio_id(audio_id: str):
+    """(cache key, content type) of an audio id; ids without a suffix are MP3"""
+    key, dot, extension = audio_id.partition(".")
+    return key, _CONTENT_TYPES.get(dot + extension, "audio/mpeg")
+
+
+@lru_cache(maxsize=None)
+def _compression_level_supported() -> bool:
+    """soundfile 0.13+ takes the encoder's compression level as an argument"""
+    import soundfile
+    return "compression_level" in inspect.signature(soundfile.SoundFile).parameters
+
+
+def _encode_ogg_opus(pcm: bytes, sample_rate: int, bitrate_kbps: int) -> bytes:
+    import soundfile
+
+    options = {}
+    if _compression_level_supported():
+        # For Opus libsndfile maps level 0..1 linearly onto roughly 256..6 kbps
+        options["compression_level"] = min(1.0, max(0.0, (256 - bitrate_kbps) / 250))
+
+    buffer = io.BytesIO()
+    with soundfile.SoundFile(buffer, "w", sample_rate, 1, format="OGG", subtype="OPUS", **options) as f:
+        f.buffer_write(pcm[:len(pcm) - len(pcm) % 2], dtype="int16")
+    return buffer.getvalue()
+
+
+def _encode_webm_opus(pcm: bytes, sample_rate: int, bitrate_kbps: int) -> bytes:
+    from pydub import AudioSegment
+
+    segment = AudioSegment(pcm[:len(pcm) - len(pcm) % 2], frame_rate=sample_rate, sample_width=2, channels=1)
+    buffer = io.BytesIO()
+    segment.export(
+        buffer,
+        format="webm",
+        codec="libopus",
+        bitrate=f"{bitrate_kbps}k",
+        parameters=["-application", "voip"]
+    )
+    return buffer.getvalue()
+
+
+def _ogg_opus_available() -> bool:
+    try:
+        import soundfile
+        return "OPUS" in soundfile.available_subtypes("OGG")
+    except (ImportError, OSError):
+        return False
+
+
+class AudioTranscoder:
+    def __init__(self, max_workers: int = 2):
+        """
+        Initialize the transcoder
+
+        Args:
+            max_workers: Encodes run in parallel (blocking, kept off the event loop)
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcode")
+        self.formats = set()
+        if _ogg_opus_available():
+            self.formats.add("opus")
+            if not _compression_level_supported():
+                logger.warning("soundfile is older than 0.13; Opus is encoded at the default bitrate for every quality")
+        # WebM needs the ffmpeg binary pydub drives
+        if shutil.which("ffmpeg"):
+            self.formats.add("webm")
+        logger.info(f"Audio transcoder ready for: {', '.join(sorted(self.formats)) or 'nothing'}")
+
+    def supports(self, audio_format: str) -> bool:
+        return audio_format in self.formats
+
+    async def transcode(self, pcm: bytes, variant: AudioVariant) -> bytes:
+        """Encode 16-bit mono PCM at variant.sample_rate into the variant's format"""
+        encode = _encode_ogg_opus if variant.format == "opus" else _encode_webm_opus
+        with stage("audio_transcode"):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, encode, pcm, variant.sample_rate, variant.bitrate_kbps
+            )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_audio_transcoder() -> AudioTranscoder:
+    """Build the transcoder from the environment"""
+    return AudioTranscoder(max_workers=int(os.getenv("AUDIO_TRANSCODE_WORKERS", min(4, os.cpu_count() or 1))))
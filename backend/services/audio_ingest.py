@@ -0,0 +1,453 @@
+"""
+Audio Ingest - Streaming Decode and Voice Activity Detection
+Reads uploaded audio chunk by chunk, decodes it to 16 kHz mono PCM as it
+arrives and drops silence before it reaches speech-to-text
+"""
+
+import os
+import shutil
+import struct
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+from .stt_engines import SAMPLE_RATE, SAMPLE_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the upload per step
+READ_CHUNK_BYTES = 64 * 1024
+
+# Voiced PCM handed to speech-to-text per step (0.5 seconds)
+EMIT_SAMPLES = SAMPLE_RATE // 2
+
+# Decoded samples held between the decoder and the VAD (1 second)
+RING_CAPACITY = SAMPLE_RATE
+
+
+class IngestLimitExceeded(Exception):
+    """The upload is larger or longer than allowed"""
+
+
+class AudioDecodeError(Exception):
+    """The upload is not audio this server can decode"""
+
+
+class PCMRingBuffer:
+    """Fixed-size int16 ring buffer; allocated once and reused for the whole upload"""
+
+    def __init__(self, capacity: int):
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return len(self._buffer) - self._size
+
+    def write(self, samples: np.ndarray) -> int:
+        """Copy as many samples as fit, returning how many were written"""
+        capacity = len(self._buffer)
+        count = min(len(samples), self.free)
+        end = (self._start + self._size) % capacity
+        first = min(count, capacity - end)
+        self._buffer[end:end + first] = samples[:first]
+        self._buffer[:count - first] = samples[first:count]
+        self._size += count
+        return count
+
+    def read(self, count: int) -> np.ndarray:
+        """Remove and return the oldest count samples"""
+        capacity = len(self._buffer)
+        count = min(count, self._size)
+        first = min(count, capacity - self._start)
+        out = np.concatenate((
+            self._buffer[self._start:self._start + first],
+            self._buffer[:count - first]
+        ))
+        self._start = (self._start + count) % capacity
+        self._size -= count
+        return out
+
+
+class StreamingResampler:
+    """Linear-interpolation resampler that carries its phase across blocks"""
+
+    def __init__(self, in_rate: int, out_rate: int = SAMPLE_RATE):
+        self.step = in_rate / out_rate
+        self._position = 0.0
+        self._last: Optional[np.ndarray] = None
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.step == 1.0 or not len(samples):
+            return samples
+        # The previous block's last sample is index 0 of this one
+        if self._last is not None:
+            samples = np.concatenate((self._last, samples))
+        positions = np.arange(self._position, len(samples) - 1, self.step)
+        out = np.interp(positions, np.arange(len(samples)), samples)
+
+        next_position = positions[-1] + self.step if len(positions) else self._position
+        self._position = next_position - (len(samples) - 1)
+        self._last = samples[-1:]
+        return out
+
+
+def _to_int16(samples: np.ndarray) -> np.ndarray:
+    return np.clip(samples * 32768.0, -32768, 32767).astype(np.int16)
+
+
+class WavDecoder:
+    """
+    Incremental RIFF/WAVE decoder
+
+    Parses the header as bytes arrive, then converts PCM (8/16/24/32-bit
+    integer or 32-bit float) to mono and resamples it to 16 kHz per block.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._header_done = False
+        self._format = None
+        self._remaining: Optional[int] = None
+        self._resampler: Optional[StreamingResampler] = None
+
+    async def feed(self, data: bytes) -> np.ndarray:
+        self._pending.extend(data)
+        if not self._header_done and not self._parse_header():
+            return np.zeros(0, dtype=np.int16)
+        return self._decode_available()
+
+    async def close(self) -> np.ndarray:
+        if not self._header_done:
+            raise AudioDecodeError("Truncated WAV header")
+        return np.zeros(0, dtype=np.int16)
+
+    def _parse_header(self) -> bool:
+        offset = 12
+        while len(self._pending) >= offset + 8:
+            chunk_id = bytes(self._pending[offset:offset + 4])
+            chunk_size = struct.unpack_from("<I", self._pending, offset + 4)[0]
+            body = offset + 8
+
+            if chunk_id == b"data":
+                if self._format is None:
+                    raise AudioDecodeError("WAV data chunk before fmt chunk")
+                # Streamed WAVs leave the size as 0 or 0xFFFFFFFF
+                self._remaining = None if chunk_size in (0, 0xFFFFFFFF) else chunk_size
+                del self._pending[:body]
+                self._header_done = True
+                return True
+
+            if len(self._pending) < body + chunk_size:
+                return False
+            if chunk_id == b"fmt ":
+                self._parse_format(bytes(self._pending[body:body + chunk_size]))
+            offset = body + chunk_size + (chunk_size & 1)
+        return False
+
+    def _parse_format(self, fmt: bytes):
+        tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", fmt)
+        if tag == 0xFFFE and len(fmt) >= 26:
+            # WAVE_FORMAT_EXTENSIBLE: the real tag starts the subformat GUID
+            tag = struct.unpack_from("<H", fmt, 24)[0]
+        if (tag, bits) not in ((1, 8), (1, 16), (1, 24), (1, 32), (3, 32)) or not channels or not rate:
+            raise AudioDecodeError(f"Unsupported WAV encoding (format {tag}, {bits}-bit)")
+        self._format = (tag, channels, bits // 8)
+        self._resampler = StreamingResampler(rate)
+
+    def _decode_available(self) -> np.ndarray:
+        tag, channels, width = self._format
+        available = len(self._pending)
+        if self._remaining is not None:
+            available = min(available, self._remaining)
+        usable = available - available % (channels * width)
+        if not usable:
+            return np.zeros(0, dtype=np.int16)
+
+        raw = bytes(self._pending[:usable])
+        del self._pending[:usable]
+        if self._remaining is not None:
+            self._remaining -= usable
+
+        if tag == 3:
+            samples = np.frombuffer(raw, dtype="<f4").astype(np.float32)
+        elif width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif width == 2:
+            samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+        elif width == 3:
+            triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+            values = np.where(values & 0x800000, values - 0x1000000, values)
+            samples = values.astype(np.float32) / 8388608
+        else:
+            samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+        return _to_int16(self._resampler.process(samples))
+
+
+class FFmpegDecoder:
+    """
+    Decoder for compressed formats (webm/opus, ogg, mp3, m4a)
+
+    Pipes the upload through ffmpeg (the converter pydub uses) and reads back
+    16 kHz mono s16le PCM while input is still being written.
+    """
+
+    def __init__(self, binary: str):
+        self.binary = binary
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._output = bytearray()
+        self._stderr = b""
+
+    async def _start(self):
+        self._process = await asyncio.create_subprocess_exec(
+            self.binary, "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self._reader = asyncio.create_task(self._read_stdout())
+
+    async def _read_stdout(self):
+        while True:
+            data = await self._process.stdout.read(READ_CHUNK_BYTES)
+            if not data:
+                break
+            self._output.extend(data)
+
+    def _take_output(self) -> np.ndarray:
+        usable = len(self._output) - len(self._output) % SAMPLE_WIDTH
+        samples = np.frombuffer(bytes(self._output[:usable]), dtype="<i2")
+        del self._output[:usable]
+        return samples
+
+    async def feed(self, data: bytes) -> np.ndarray:
+        if self._process is None:
+            await self._start()
+        try:
+            self._process.stdin.write(data)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up on the input; close() reports why
+            pass
+        return self._take_output()
+
+    async def close(self) -> np.ndarray:
+        if self._process is None:
+            return np.zeros(0, dtype=np.int16)
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        await self._reader
+        self._stderr = await self._process.stderr.read()
+        if await self._process.wait() != 0:
+            raise AudioDecodeError(f"Could not decode audio: {self._stderr.decode(errors='replace').strip()[:200]}")
+        return self._take_output()
+
+    async def abort(self):
+        """Kill ffmpeg when ingestion stops early"""
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+class EnergyVAD:
+    """
+    Frame-energy voice activity detector
+
+    A 30 ms frame is speech when its level is above both threshold_db and
+    the running noise floor plus margin_db. A short pre-roll before and a
+    hangover after each speech run are kept so word edges are not clipped.
+    """
+
+    def __init__(
+        self,
+        threshold_db: float = -45.0,
+        margin_db: float = 10.0,
+        frame_ms: int = 30,
+        preroll_ms: int = 150,
+        hangover_ms: int = 300
+    ):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.frame_samples = SAMPLE_RATE * frame_ms // 1000
+        self._preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._hangover_frames = max(1, hangover_ms // frame_ms)
+        self._hangover = 0
+        # Start just low enough that threshold_db alone decides the first frames
+        self._noise_db = threshold_db - margin_db
+        # Consecutive speech frames up to the last one processed (pre-roll and hangover excluded)
+        self.speech_run = 0
+
+    def process(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """Return the audio to keep for this frame (possibly with pre-roll), or None"""
+        rms = np.sqrt(np.mean(frame.astype(np.float32) ** 2))
+        level_db = 20 * np.log10(rms / 32768 + 1e-10)
+
+        is_speech = level_db > max(self.threshold_db, self._noise_db + self.margin_db)
+        self.speech_run = self.speech_run + 1 if is_speech else 0
+        if not is_speech:
+            # Track the noise floor on non-speech frames only
+            self._noise_db = 0.95 * self._noise_db + 0.05 * level_db
+
+        if is_speech:
+            kept = list(self._preroll) + [frame]
+            self._preroll.clear()
+            self._hangover = self._hangover_frames
+            return np.concatenate(kept)
+        if self._hangover:
+            self._hangover -= 1
+            return frame
+        self._preroll.append(frame)
+        return None
+
+
+def filter_speech(samples: np.ndarray, vad: EnergyVAD) -> np.ndarray:
+    """Run a whole decoded clip through the VAD, returning only the kept audio"""
+    kept = []
+    for offset in range(0, len(samples), vad.frame_samples):
+        frame = vad.process(samples[offset:offset + vad.frame_samples])
+        if frame is not None:
+            kept.append(frame)
+    return np.concatenate(kept) if kept else np.zeros(0, dtype=np.int16)
+
+
+def contains_speech(samples: np.ndarray, vad: EnergyVAD, min_frames: int = 1) -> bool:
+    """
+    Run samples through the VAD, returning whether speech lasted min_frames
+
+    Runs of speech frames carry over between calls, so a stream can be fed
+    in chunks shorter than min_frames.
+    """
+    speech = False
+    for offset in range(0, len(samples), vad.frame_samples):
+        # Keep feeding after a hit so the VAD's state follows the whole stream
+        vad.process(samples[offset:offset + vad.frame_samples])
+        speech = speech or vad.speech_run >= min_frames
+    return speech
+
+
+class AudioIngest:
+    def __init__(self, max_bytes: int, max_seconds: float, vad: Optional[EnergyVAD] = None):
+        """
+        Initialize one ingestion
+
+        Args:
+            max_bytes: Largest accepted upload
+            max_seconds: Longest accepted decoded duration
+            vad: Voice activity detector (None keeps all audio)
+        """
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.vad = vad
+
+        self.bytes_read = 0
+        self.samples_decoded = 0
+        self.samples_kept = 0
+        self._ring = PCMRingBuffer(RING_CAPACITY)
+        self._out = bytearray()
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.samples_decoded / SAMPLE_RATE
+
+    @property
+    def speech_seconds(self) -> float:
+        return self.samples_kept / SAMPLE_RATE
+
+    @staticmethod
+    def _decoder_for(head: bytes):
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            return WavDecoder()
+
+        binary = shutil.which("ffmpeg") or shutil.which("avconv")
+        if binary is None:
+            raise AudioDecodeError("Only WAV audio is supported (ffmpeg is not installed)")
+        return FFmpegDecoder(binary)
+
+    async def voiced_pcm(self, upload) -> AsyncIterator[bytes]:
+        """Yield 16 kHz mono 16-bit PCM of the speech in an UploadFile, in ~0.5 s chunks"""
+        decoder = None
+        try:
+            while True:
+                data = await upload.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                self.bytes_read += len(data)
+                if self.bytes_read > self.max_bytes:
+                    raise IngestLimitExceeded(f"Audio upload is larger than {self.max_bytes / (1024 * 1024):g} MB")
+
+                if decoder is None:
+                    decoder = self._decoder_for(data)
+                for chunk in self._push(await decoder.feed(data)):
+                    yield chunk
+
+            if decoder is None:
+                raise AudioDecodeError("Empty audio upload")
+            for chunk in self._push(await decoder.close()):
+                yield chunk
+            decoder = None
+            for chunk in self._drain(final=True):
+                yield chunk
+        finally:
+            if isinstance(decoder, FFmpegDecoder):
+                await decoder.abort()
+
+    def _push(self, samples: np.ndarray):
+        self.samples_decoded += len(samples)
+        if self.samples_decoded > self.max_seconds * SAMPLE_RATE:
+            raise IngestLimitExceeded(f"Audio is longer than {self.max_seconds:g} seconds")
+
+        written = 0
+        while written < len(samples):
+            written += self._ring.write(samples[written:])
+            yield from self._drain()
+
+    def _drain(self, final: bool = False):
+        frame_samples = self.vad.frame_samples if self.vad is not None else EMIT_SAMPLES
+        while len(self._ring) >= frame_samples or (final and len(self._ring)):
+            frame = self._ring.read(frame_samples)
+            kept = self.vad.process(frame) if self.vad is not None else frame
+            if kept is not None:
+                self.samples_kept += len(kept)
+                self._out.extend(kept.astype("<i2").tobytes())
+
+            if len(self._out) >= EMIT_SAMPLES * SAMPLE_WIDTH:
+                yield bytes(self._out)
+                self._out.clear()
+
+        if final and self._out:
+            yield bytes(self._out)
+            self._out.clear()
+
+
+def create_vad() -> Optional[EnergyVAD]:
+    """Build a voice activity detector from the environment (None when disabled)"""
+    if os.getenv("VAD_ENABLED", "true").lower() in ("1", "true", "yes"):
+        return EnergyVAD(threshold_db=float(os.getenv("VAD_THRESHOLD_DB", -45)))
+    return None
+
+
+def create_audio_ingest() -> AudioIngest:
+    """Build an ingestion for one upload from the environment"""
+    return AudioIngest(
+        max_bytes=int(float(os.getenv("VOICE_INPUT_MAX_MB", 10)) * 1024 * 1024),
+        max_seconds=float(os.getenv("VOICE_INPUT_MAX_SECONDS", 120)),
+        vad=create_vad()
+    )
@@ -0,0 +1,164 @@
+"""
+Audio Store - Short-Lived Audio Artifacts Served by URL
+Holds synthesized audio for GET /api/audio/{id} so responses carry a URL
+instead of a base64 payload
+"""
+
+import os
+import time
+import asyncio
+import uuid
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AudioArtifact:
+    """One stored audio payload"""
+
+    def __init__(self, artifact_id: str, data: bytes, content_type: str, ttl_seconds: float):
+        self.id = artifact_id
+        self.data = data
+        self.content_type = content_type
+        self.etag = f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+        self.created_at = time.time()
+        self.expires_at = self.created_at + ttl_seconds
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) >= self.expires_at
+
+
+class AudioArtifactStore:
+    def __init__(self, ttl_seconds: float = 900, max_bytes: int = 128 * 1024 * 1024):
+        """
+        Initialize the store
+
+        Args:
+            ttl_seconds: How long an artifact stays fetchable
+            max_bytes: Memory budget; the oldest artifacts are dropped first
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._artifacts: "OrderedDict[str, AudioArtifact]" = OrderedDict()
+        self._bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def put(
+        self,
+        data: bytes,
+        content_type: str = "audio/mpeg",
+        artifact_id: Optional[str] = None
+    ) -> AudioArtifact:
+        """Store audio and return its artifact (re-putting an id refreshes its expiry)"""
+        artifact_id = artifact_id or uuid.uuid4().hex
+        self._remove(artifact_id)
+
+        artifact = AudioArtifact(artifact_id, data, content_type, self.ttl_seconds)
+        self._artifacts[artifact_id] = artifact
+        self._bytes += artifact.size
+        self._evict()
+
+        waiter = self._pending.pop(artifact_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(artifact)
+        return artifact
+
+    def reserve(self, artifact_id: str):
+        """Announce an artifact that is still being synthesized"""
+        if artifact_id not in self._artifacts and artifact_id not in self._pending:
+            self._pending[artifact_id] = asyncio.get_running_loop().create_future()
+
+    def fail(self, artifact_id: str):
+        """Give up on a reserved artifact; waiters get None"""
+        waiter = self._pending.pop(artifact_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait_for(self, artifact_id: str, timeout: float) -> Optional[AudioArtifact]:
+        """Return the artifact, waiting up to timeout if it is still being synthesized"""
+        artifact = self.get(artifact_id)
+        if artifact is not None:
+            return artifact
+
+        waiter = self._pending.get(artifact_id)
+        if waiter is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get(self, artifact_id: str) -> Optional[AudioArtifact]:
+        artifact = self._artifacts.get(artifact_id)
+        if artifact is None:
+            return None
+        if artifact.is_expired():
+            self._remove(artifact_id)
+            return None
+        return artifact
+
+    def _remove(self, artifact_id: str):
+        artifact = self._artifacts.pop(artifact_id, None)
+        if artifact is not None:
+            self._bytes -= artifact.size
+
+    def _evict(self):
+        now = time.time()
+        # Artifacts are stored in insertion order, so expired ones are at the front
+        while self._artifacts:
+            oldest = next(iter(self._artifacts.values()))
+            if not oldest.is_expired(now) and self._bytes <= self.max_bytes:
+                break
+            self._remove(oldest.id)
+
+    def stats(self) -> Dict:
+        return {
+            "artifacts": len(self._artifacts),
+            "bytes": self._bytes,
+            "pending": len(self._pending)
+        }
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" header into an inclusive (start, end)
+
+    Returns None when there is no usable Range header (serve the whole
+    body) and raises ValueError when the range cannot be satisfied.
+    Multi-range requests are answered with the whole body.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - length), size - 1
+
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Malformed range: {range_header}")
+
+    if start >= size or end < start:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return start, min(end, size - 1)
+
+
+def create_audio_store() -> AudioArtifactStore:
+    """Build the audio store from the environment"""
+    return AudioArtifactStore(
+        ttl_seconds=float(os.getenv("AUDIO_TTL_SECONDS", 900)),
+        max_bytes=int(float(os.getenv("AUDIO_STORE_MB", 128)) * 1024 * 1024)
+    )
@@ -0,0 +1,320 @@
+"""
+Batch Transcription - Offline Transcription of Many Recordings
+Decodes uploaded recordings in a process pool, groups clips of similar
+length and transcribes each group in one worker call, reporting per-file
+results as soon as they are ready
+"""
+
+import io
+import os
+import zlib
+import asyncio
+import logging
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .stt_engines import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Bytes read from an upload per step
+READ_CHUNK_BYTES = 64 * 1024
+
+# Ways a zip member can fail to inflate (bad data, encryption, unknown method)
+MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError)
+
+
+def decode_clip(data: bytes, max_seconds: float, vad_threshold_db: Optional[float]) -> Dict:
+    """
+    Decode one recording to speech-only 16 kHz mono PCM
+
+    Runs in a worker process, so it takes and returns plain picklable values.
+    """
+    from .speech_service import decode_audio
+    from .audio_ingest import EnergyVAD, filter_speech
+
+    try:
+        samples = np.frombuffer(decode_audio(data), dtype="<i2")
+    except Exception as e:
+        return {"error": f"Could not decode audio: {str(e)}"}
+
+    duration = len(samples) / SAMPLE_RATE
+    if duration > max_seconds:
+        return {"error": f"Audio is longer than {max_seconds:g} seconds"}
+
+    if vad_threshold_db is not None:
+        samples = filter_speech(samples, EnergyVAD(threshold_db=vad_threshold_db))
+
+    return {
+        "pcm": samples.astype("<i2").tobytes(),
+        "duration_seconds": round(duration, 2),
+        "speech_seconds": round(len(samples) / SAMPLE_RATE, 2)
+    }
+
+
+def _too_large(max_file_bytes: int) -> str:
+    return f"File is larger than {max_file_bytes / (1024 * 1024):g} MB"
+
+
+def expand_archives(
+    files: List[Tuple[str, bytes]],
+    max_files: int,
+    max_file_bytes: int
+) -> Tuple[List[Tuple[str, bytes]], List[Dict]]:
+    """
+    Replace zip archives with their members (blocking)
+
+    Returns the recordings to transcribe and per-file errors for entries
+    that were rejected (too large, or past the file limit). Members are
+    never inflated past the file limit or more than one byte past the size
+    limit, whatever sizes the archive declares.
+    """
+    recordings: List[Tuple[str, bytes]] = []
+    rejected: List[Dict] = []
+    limit_error = f"Batch is limited to {max_files} files"
+
+    for name, data in files:
+        if not data.startswith(ZIP_MAGIC):
+            if len(recordings) >= max_files:
+                rejected.append({"filename": name, "error": limit_error})
+            elif len(data) > max_file_bytes:
+                rejected.append({"filename": name, "error": _too_large(max_file_bytes)})
+            else:
+                recordings.append((name, data))
+            continue
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile:
+            rejected.append({"filename": name, "error": "Invalid zip archive"})
+            continue
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                member = f"{name}/{info.filename}"
+                if len(recordings) >= max_files:
+                    rejected.append({"filename": member, "error": limit_error})
+                    continue
+                if info.file_size > max_file_bytes:
+                    rejected.append({"filename": member, "error": _too_large(max_file_bytes)})
+                    continue
+                # The declared size can lie; stop inflating just past the limit
+                try:
+                    with archive.open(info) as f:
+                        content = f.read(max_file_bytes + 1)
+                except MEMBER_ERRORS:
+                    rejected.append({"filename": member, "error": "Invalid zip archive member"})
+                    continue
+                if len(content) > max_file_bytes:
+                    rejected.append({"filename": member, "error": _too_large(max_file_bytes)})
+                else:
+                    recordings.append((member, content))
+
+    return recordings, rejected
+
+
+class BatchTranscriber:
+    def __init__(
+        self,
+        speech_service,
+        max_workers: Optional[int] = None,
+        batch_size: int = 8,
+        bucket_seconds: float = 5.0,
+        max_files: int = 100,
+        max_file_bytes: int = 10 * 1024 * 1024,
+        max_seconds: float = 120,
+        vad_threshold_db: Optional[float] = -45.0
+    ):
+        """
+        Initialize the batch transcriber
+
+        Args:
+            speech_service: SpeechService whose engine and worker pool run STT
+            max_workers: Decode processes (default: CPU count)
+            batch_size: Clips transcribed per engine call
+            bucket_seconds: Width of the speech-length buckets clips are grouped by
+            max_files: Recordings accepted per batch (after expanding archives)
+            max_file_bytes: Largest accepted recording
+            max_seconds: Longest accepted recording
+            vad_threshold_db: VAD threshold (None keeps silence)
+        """
+        self.speech_service = speech_service
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.bucket_seconds = bucket_seconds
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_seconds = max_seconds
+        self.vad_threshold_db = vad_threshold_db
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Started on first use so processes that never see a batch don't pay for it
+        if self._pool is None:
+            # Never fork the server: its event loop, threads and sockets would be copied
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(method)
+            )
+        return self._pool
+
+    async def read_uploads(self, uploads) -> Tuple[List[Tuple[str, bytes]], List[Dict]]:
+        """
+        Read UploadFiles within the batch limits
+
+        Uploads past the file limit are not read. A recording stops being
+        read once it is larger than the size limit, a zip archive once it is
+        larger than the most its accepted members could add up to.
+
+        Returns:
+            (filename, content) pairs, and per-file errors for rejected uploads
+        """
+        files: List[Tuple[str, bytes]] = []
+        rejected: List[Dict] = []
+        for index, upload in enumerate(uploads):
+            name = upload.filename or f"file-{index}"
+            if index >= self.max_files:
+                rejected.append({"filename": name, "error": f"Batch is limited to {self.max_files} files"})
+                continue
+
+            content = bytearray()
+            limit = self.max_file_bytes
+            while True:
+                data = await upload.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                if not content and data.startswith(ZIP_MAGIC):
+                    limit = self.max_files * self.max_file_bytes
+                content += data
+                if len(content) > limit:
+                    break
+            if len(content) > limit:
+                rejected.append({"filename": name, "error": _too_large(limit)})
+            else:
+                files.append((name, bytes(content)))
+        return files, rejected
+
+    async def transcribe(
+        self,
+        files: List[Tuple[str, bytes]],
+        language: str = "en",
+        rejected: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Yield one result per recording, in completion order
+
+        Archives are expanded off the event loop. Decoding runs in the
+        process pool. Decoded clips are placed in buckets by speech length;
+        a bucket is transcribed when it holds batch_size clips, and the rest
+        once every decode has finished.
+
+        Args:
+            files: (filename, content) pairs, zip archives included
+            language: Language code
+            rejected: Errors for uploads already refused (see read_uploads),
+                reported after the recordings' indexes
+        """
+        loop = asyncio.get_running_loop()
+        recordings, expand_rejected = await loop.run_in_executor(
+            None, expand_archives, files, self.max_files, self.max_file_bytes
+        )
+        for index, entry in enumerate(expand_rejected + (rejected or [])):
+            yield {"index": len(recordings) + index, **entry}
+
+        pool = self._get_pool()
+        names = [name for name, _ in recordings]
+
+        pending: Dict[asyncio.Future, Tuple[str, object]] = {}
+        for index, (_, data) in enumerate(recordings):
+            future = loop.run_in_executor(pool, decode_clip, data, self.max_seconds, self.vad_threshold_db)
+            pending[future] = ("decode", index)
+
+        buckets: Dict[int, List[Tuple[int, Dict]]] = {}
+        decoding = len(recordings)
+
+        def start_batch(clips: List[Tuple[int, Dict]]):
+            task = asyncio.ensure_future(
+                self.speech_service.transcribe_batch([clip["pcm"] for _, clip in clips], language)
+            )
+            pending[task] = ("transcribe", clips)
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    kind, payload = pending.pop(future)
+
+                    if kind == "decode":
+                        decoding -= 1
+                        index = payload
+                        try:
+                            clip = future.result()
+                        except Exception as e:
+                            clip = {"error": f"Could not decode audio: {str(e)}"}
+                        if "error" in clip:
+                            yield {"index": index, "filename": names[index], "error": clip["error"]}
+                            continue
+
+                        bucket_key = int(clip["speech_seconds"] // self.bucket_seconds)
+                        bucket = buckets.setdefault(bucket_key, [])
+                        bucket.append((index, clip))
+                        if len(bucket) >= self.batch_size:
+                            start_batch(buckets.pop(bucket_key))
+                        continue
+
+                    clips = payload
+                    try:
+                        transcripts = future.result()
+                    except Exception as e:
+                        logger.error(f"Batch transcription failed: {str(e)}")
+                        transcripts = None
+                    for position, (index, clip) in enumerate(clips):
+                        result = {
+                            "index": index,
+                            "filename": names[index],
+                            "duration_seconds": clip["duration_seconds"],
+                            "speech_seconds": clip["speech_seconds"]
+                        }
+                        if transcripts is None:
+                            result["error"] = "Failed to transcribe audio"
+                        else:
+                            result["transcription"] = transcripts[position]
+                        yield result
+
+                # Nothing left to decode: flush the partially filled buckets
+                if decoding == 0 and buckets:
+                    for bucket in buckets.values():
+                        start_batch(bucket)
+                    buckets.clear()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """Stop the decode processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def create_batch_transcriber(speech_service) -> BatchTranscriber:
+    """Build the batch transcriber from the environment"""
+    vad_enabled = os.getenv("VAD_ENABLED", "true").lower() in ("1", "true", "yes")
+    workers = os.getenv("BATCH_DECODE_WORKERS")
+    return BatchTranscriber(
+        speech_service,
+        max_workers=int(workers) if workers else None,
+        batch_size=int(os.getenv("BATCH_STT_SIZE", 8)),
+        bucket_seconds=float(os.getenv("BATCH_BUCKET_SECONDS", 5)),
+        max_files=int(os.getenv("BATCH_MAX_FILES", 100)),
+        max_file_bytes=int(float(os.getenv("VOICE_INPUT_MAX_MB", 10)) * 1024 * 1024),
+        max_seconds=float(os.getenv("VOICE_INPUT_MAX_SECONDS", 120)),
+        vad_threshold_db=float(os.getenv("VAD_THRESHOLD_DB", -45)) if vad_enabled else None
+    )
@@ -0,0 +1,206 @@
+"""
+Conversation Stream - Incremental Text and Voice Delivery
+Streams Gemini text deltas and voices each finished sentence while the rest
+of the answer is still being generated
+"""
+
+import asyncio
+import base64
+import logging
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from .text_chunking import SentenceChunker
+from .gemini_service import FallbackText
+from .admission import set_task_priority, turn_priority
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a queue
+_DONE = object()
+
+
+async def stream_conversation_turn(
+    gemini_service,
+    elevenlabs_service,
+    user_message: str,
+    conversation_history: Optional[List[Dict]] = None,
+    language: str = "en",
+    conversation_id: Optional[str] = None,
+    encode_audio: bool = True,
+    session=None,
+    cacheable: bool = False,
+    greetings=None,
+    audio_variant=None
+) -> AsyncIterator[Dict]:
+    """
+    Run one conversation turn as a stream of events
+
+    Events are dictionaries with an "event" name and a "data" payload:
+        text       -- {"delta"}: a piece of the model's answer
+        audio      -- {"sentence", "chunk", "format"}: base64 audio bytes for a sentence
+        audio_end  -- {"sentence", "text"}: a sentence finished playing out
+        triage     -- {"matches"}: emergency/urgency terms in the model output
+        done       -- {"conversation_id", "text", "medical_context", "language", "fallback"}
+
+    Text generation and speech synthesis run concurrently: as soon as a
+    sentence is complete it is handed to ElevenLabs while Gemini keeps
+    producing the next one. If ElevenLabs is unavailable, only text is sent.
+    With encode_audio=False audio chunks are left as raw bytes (for
+    transports that carry binary frames). A server-side session, when given,
+    supplies the history and conversation id. cacheable is passed on to
+    GeminiService (see its response cache). With a GreetingStore, a first
+    turn that is only a greeting or small talk is answered with a
+    pre-rendered greeting instead.
+    audio_variant picks the speech format (ElevenLabsService.audio_variant,
+    MP3 by default); transcoded formats such as Opus arrive as one
+    self-contained chunk per sentence, greetings are always MP3.
+    """
+    if session is not None:
+        conversation_id = session.conversation_id
+    conversation_id = conversation_id or str(uuid.uuid4())
+
+    if greetings is not None and session is not None:
+        greeting = greetings.greeting_for(session, user_message, language, gemini_service.triage.scan(user_message, language))
+        if greeting is not None:
+            async for event in _greeting_events(gemini_service, greeting, user_message, language, conversation_id, encode_audio):
+                yield event
+            return
+
+    events: asyncio.Queue = asyncio.Queue()
+    sentences: asyncio.Queue = asyncio.Queue()
+    parts: List[str] = []
+    fallback = False
+
+    async def emit_triage(matches):
+        if matches:
+            await events.put({
+                "event": "triage",
+                "data": {"matches": [m.to_dict() for m in matches]}
+            })
+
+    async def produce_text():
+        chunker = SentenceChunker()
+        output_triage = gemini_service.triage.stream(language)
+        try:
+            async for delta in gemini_service.stream_medical_response(
+                user_message=user_message,
+                conversation_history=conversation_history,
+                language=language,
+                session=session,
+                cacheable=cacheable
+            ):
+                nonlocal fallback
+                fallback = fallback or isinstance(delta, FallbackText)
+                parts.append(delta)
+                await events.put({"event": "text", "data": {"delta": delta}})
+                await emit_triage(output_triage.feed(delta))
+                for sentence in chunker.feed(delta):
+                    await sentences.put(sentence)
+
+            await emit_triage(output_triage.flush())
+            remainder = chunker.flush()
+            if remainder:
+                await sentences.put(remainder)
+        finally:
+            await sentences.put(_DONE)
+
+    async def produce_audio():
+        index = 0
+        variant = audio_variant
+        if variant is None and elevenlabs_service is not None:
+            variant = elevenlabs_service.audio_variant()
+        while True:
+            sentence = await sentences.get()
+            if sentence is _DONE:
+                break
+            if elevenlabs_service is None:
+                continue
+
+            try:
+                async for chunk in elevenlabs_service.stream_speech(sentence, language, variant=variant):
+                    await events.put({
+                        "event": "audio",
+                        "data": {
+                            "sentence": index,
+                            "chunk": base64.b64encode(chunk).decode("utf-8") if encode_audio else chunk,
+                            "format": variant.format
+                        }
+                    })
+                await events.put({"event": "audio_end", "data": {"sentence": index, "text": sentence}})
+            except Exception as e:
+                logger.error(f"Failed to stream speech for sentence {index}: {str(e)}")
+                # Continue without audio for this sentence
+            index += 1
+
+    async def supervise():
+        # Emergencies and urgent turns are admitted to Gemini and ElevenLabs first
+        set_task_priority(turn_priority(gemini_service.triage.scan(user_message, language)))
+        try:
+            await asyncio.gather(produce_text(), produce_audio())
+        finally:
+            await events.put(_DONE)
+
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while True:
+            event = await events.get()
+            if event is _DONE:
+                break
+            yield event
+
+        # Surface errors from the producers
+        await supervisor
+
+        full_text = "".join(parts)
+        yield {
+            "event": "done",
+            "data": {
+                "conversation_id": conversation_id,
+                "text": full_text,
+                "medical_context": (
+                    {"error": True} if fallback
+                    else gemini_service._analyze_medical_context(user_message, full_text, language)
+                ),
+                "language": language,
+                # The canned apology: callers don't record it as the assistant's answer
+                "fallback": fallback
+            }
+        }
+    finally:
+        if not supervisor.done():
+            supervisor.cancel()
+
+
+async def _greeting_events(
+    gemini_service,
+    greeting: Dict,
+    user_message: str,
+    language: str,
+    conversation_id: str,
+    encode_audio: bool
+) -> AsyncIterator[Dict]:
+    """The events of a turn answered with a pre-rendered greeting"""
+    text = greeting["text"]
+    yield {"event": "text", "data": {"delta": text}}
+    if greeting["audio"] is not None:
+        chunk = greeting["audio"]
+        yield {
+            "event": "audio",
+            "data": {
+                "sentence": 0,
+                "chunk": base64.b64encode(chunk).decode("utf-8") if encode_audio else chunk,
+                "format": "mp3"
+            }
+        }
+        yield {"event": "audio_end", "data": {"sentence": 0, "text": text}}
+    yield {
+        "event": "done",
+        "data": {
+            "conversation_id": conversation_id,
+            "text": text,
+            "medical_context": gemini_service._analyze_medical_context(user_message, text, language),
+            "language": language,
+            "fallback": False
+        }
+    }
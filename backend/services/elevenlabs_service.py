@@ -4,22 +4,78 @@ Handles text-to-speech conversion using ElevenLabs API
 """
 
 import os
-from elevenlabs.client import ElevenLabs
+from elevenlabs.client import AsyncElevenLabs
 from elevenlabs import VoiceSettings
 import logging
 import base64
-from typing import Dict
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from .tts_cache import TTSCache, make_cache_key
+from .audio_store import AudioArtifactStore
+from .single_flight import SingleFlight
+from .metrics import instrument, stage
+from .admission import UpstreamLimiter
+from .resilience import UpstreamPolicy
+from .audio_codecs import AudioTranscoder, AudioVariant, DEFAULT_VARIANT, VARIANTS
 
 logger = logging.getLogger(__name__)
 
 class ElevenLabsService:
-    def __init__(self):
-        """Initialize ElevenLabs service"""
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[TTSCache] = None,
+        audio_store: Optional[AudioArtifactStore] = None,
+        single_flight: Optional[SingleFlight] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        transcoder: Optional[AudioTranscoder] = None,
+        resilience: Optional[UpstreamPolicy] = None
+    ):
+        """
+        Initialize ElevenLabs service
+
+        Args:
+            http_client: Optional shared HTTP client so connections are pooled
+                and kept alive across requests
+            cache: Optional content-addressed cache for synthesized audio
+            audio_store: Optional store that serves audio by URL instead of
+                inlining it as base64
+            single_flight: Coalesces identical concurrent syntheses (shared
+                with GeminiService)
+            limiter: Admission control for ElevenLabs calls (cache hits skip
+                it), used when no resilience policy is given
+            transcoder: Encodes formats ElevenLabs cannot produce (Opus);
+                without it those requests fall back to MP3
+            resilience: Deadlines, retries, hedging and circuit breaker for
+                ElevenLabs calls (holds the limiter)
+        """
         api_key = os.getenv("ELEVENLABS_API_KEY")
         if not api_key:
             raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
         
-        self.client = ElevenLabs(api_key=api_key)
+        # ELEVENLABS_BASE_URL points the client at another API host (e.g. the benchmark stand-in)
+        self.client = AsyncElevenLabs(
+            api_key=api_key,
+            httpx_client=http_client,
+            base_url=os.getenv("ELEVENLABS_BASE_URL") or None
+        )
+        self.cache = cache
+        self.audio_store = audio_store
+        self.single_flight = single_flight or SingleFlight()
+        self.resilience = resilience or UpstreamPolicy("elevenlabs", timeout=20.0, limiter=limiter)
+        self.limiter = self.resilience.limiter
+        self.transcoder = transcoder
+        
+        # Multilingual model and shared voice settings
+        self.model_id = "eleven_multilingual_v2"
+        self.voice_settings = VoiceSettings(
+            stability=0.4,  # Lower stability = more expressive/variable
+            similarity_boost=0.75,
+            style=0.6,      # Higher style = more natural intonation
+            use_speaker_boost=True
+        )
         
         # Voice configurations for different languages
         # Using multilingual voices from ElevenLabs
@@ -66,11 +122,127 @@ class ElevenLabsService:
             }
         }
     
+    def audio_variant(self, audio_format: str = "mp3", quality: str = "high") -> AudioVariant:
+        """
+        The output for a requested format and quality tier
+        
+        Formats that need a local encoder this deployment lacks (Opus
+        without libsndfile, WebM without ffmpeg) fall back to MP3 at the
+        same tier.
+        """
+        tiers = VARIANTS.get(audio_format, VARIANTS["mp3"])
+        variant = tiers.get(quality, tiers["high"])
+        if variant.transcoded and (self.transcoder is None or not self.transcoder.supports(variant.format)):
+            logger.debug(f"No {variant.format} encoder available, sending MP3 instead")
+            variant = VARIANTS["mp3"][variant.quality]
+        return variant
+    
+    def cache_key(
+        self,
+        text: str,
+        language: str = "en",
+        voice_id: str = None,
+        variant: AudioVariant = DEFAULT_VARIANT
+    ) -> str:
+        """Content address of the audio for text in a given voice and output format"""
+        voice_config = self.voice_configs.get(language, self.voice_configs["en"])
+        return make_cache_key(
+            text,
+            voice_id or voice_config["voice_id"],
+            self.model_id,
+            self.voice_settings.dict(),
+            **variant.cache_variant()
+        )
+    
+    def audio_id(
+        self,
+        text: str,
+        language: str = "en",
+        voice_id: str = None,
+        variant: AudioVariant = DEFAULT_VARIANT
+    ) -> str:
+        """Artifact id for /api/audio; the suffix names the format (none for MP3)"""
+        return self.cache_key(text, language, voice_id, variant) + variant.suffix
+    
+    async def stream_speech(
+        self,
+        text: str,
+        language: str = "en",
+        voice_id: str = None,
+        variant: AudioVariant = DEFAULT_VARIANT
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream synthesized audio chunks as ElevenLabs produces them
+        
+        Cached audio is yielded in one piece, even while the ElevenLabs
+        circuit is open; fresh audio is cached once the stream completes.
+        The deadline covers the first chunk and each gap between chunks.
+        Transcoded formats (Opus) are encoded from the whole PCM response
+        and yielded as one self-contained file.
+        """
+        key = self.cache_key(text, language, voice_id, variant)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        # Get voice configuration for language
+        voice_config = self.voice_configs.get(language, self.voice_configs["en"])
+        selected_voice_id = voice_id or voice_config["voice_id"]
+        
+        logger.info(f"Generating speech for language: {language} with voice: {voice_config['name']}")
+        
+        # Generate audio using ElevenLabs
+        chunks = []
+        with stage("elevenlabs_convert", upstream="elevenlabs"):
+            async for chunk in self.resilience.stream(lambda: self.client.text_to_speech.convert(
+                voice_id=selected_voice_id,
+                text=text,
+                model_id=self.model_id,
+                voice_settings=self.voice_settings,
+                output_format=variant.upstream_format
+            )):
+                if self.cache is not None or variant.transcoded:
+                    chunks.append(chunk)
+                if not variant.transcoded:
+                    yield chunk
+        
+        if variant.transcoded:
+            chunks = [await self.transcoder.transcode(b"".join(chunks), variant)]
+            yield chunks[0]
+        
+        if self.cache is not None:
+            await self.cache.put(key, b"".join(chunks))
+    
+    async def synthesize(
+        self,
+        text: str,
+        language: str = "en",
+        voice_id: str = None,
+        variant: AudioVariant = DEFAULT_VARIANT
+    ) -> bytes:
+        """
+        Synthesize speech and return the encoded audio bytes (MP3 by default)
+        
+        Chunks are streamed from the async client and joined once, so the
+        event loop is never blocked and no intermediate copies are made.
+        Concurrent requests for the same audio share one synthesis.
+        """
+        async def collect() -> bytes:
+            chunks = [chunk async for chunk in self.stream_speech(text, language, voice_id, variant)]
+            return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+        
+        key = self.cache_key(text, language, voice_id, variant)
+        return await self.single_flight.do(f"tts:{key}", collect)
+    
+    @instrument("text_to_speech")
     async def text_to_speech(
         self,
         text: str,
         language: str = "en",
-        voice_id: str = None
+        voice_id: str = None,
+        variant: AudioVariant = DEFAULT_VARIANT
     ) -> Dict:
         """
         Convert text to speech using ElevenLabs
@@ -79,44 +251,38 @@ class ElevenLabsService:
             text: Text to convert to speech
             language: Language code
             voice_id: Optional specific voice ID to use
+            variant: Output format and quality (see audio_variant)
             
         Returns:
-            Dictionary with audio data and metadata
+            Dictionary with audio data and metadata. With an audio store,
+            audio_url is a /api/audio/{id} URL instead of inline base64.
         """
         try:
-            # Get voice configuration for language
             voice_config = self.voice_configs.get(language, self.voice_configs["en"])
-            selected_voice_id = voice_id or voice_config["voice_id"]
+            audio_bytes = await self.synthesize(text, language, voice_id, variant)
+            size_bytes = len(audio_bytes)
             
-            logger.info(f"Generating speech for language: {language} with voice: {voice_config['name']}")
-            
-            # Generate audio using ElevenLabs
-            audio_generator = self.client.text_to_speech.convert(
-                voice_id=selected_voice_id,
-                text=text,
-                model_id="eleven_multilingual_v2",  # Multilingual model
-                voice_settings=VoiceSettings(
-                    stability=0.4,  # Lower stability = more expressive/variable
-                    similarity_boost=0.75,
-                    style=0.6,      # Higher style = more natural intonation
-                    use_speaker_boost=True
+            if self.audio_store is not None:
+                # Content-addressed id, so repeated utterances share one URL
+                artifact = self.audio_store.put(
+                    audio_bytes,
+                    variant.content_type,
+                    artifact_id=self.audio_id(text, language, voice_id, variant)
                 )
-            )
-            
-            # Collect audio bytes
-            audio_bytes = b""
-            for chunk in audio_generator:
-                audio_bytes += chunk
-            
-            # Convert to base64 for easy transmission
-            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+                audio_url = f"/api/audio/{artifact.id}"
+            else:
+                # Convert to base64 for easy transmission (raw bytes are not kept)
+                with stage("audio_base64"):
+                    audio_url = f"data:{variant.content_type};base64,{base64.b64encode(audio_bytes).decode('utf-8')}"
+            del audio_bytes
             
             return {
-                "audio_url": f"data:audio/mpeg;base64,{audio_base64}",
-                "audio_bytes": audio_bytes,
+                "audio_url": audio_url,
+                "size_bytes": size_bytes,
                 "language": language,
                 "voice_name": voice_config["name"],
-                "format": "mp3"
+                "format": variant.format,
+                "content_type": variant.content_type
             }
             
         except Exception as e:
@@ -126,7 +292,7 @@ class ElevenLabsService:
     async def get_available_voices(self) -> Dict:
         """Get list of available voices from ElevenLabs"""
         try:
-            voices = self.client.voices.get_all()
+            voices = await self.client.voices.get_all()
             return {
                 "voices": [
                     {
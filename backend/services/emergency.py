@@ -0,0 +1,127 @@
+"""
+Emergency Fast Path - Pre-Rendered Emergency Instructions
+Answers messages the triage engine flags as emergencies immediately, with
+instructions synthesized at startup, while the detailed Gemini answer is
+produced in the background
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from .triage import TriageEngine, TriageResult
+
+logger = logging.getLogger(__name__)
+
+# Keep finished follow-up answers around for clients that fetch them late
+FOLLOWUP_TTL_SECONDS = 600
+
+EMERGENCY_INSTRUCTIONS = {
+    "en": "This may be a medical emergency. Call your local emergency number right now. If you are alone, unlock your door and stay on the line with the operator. I am preparing more detailed guidance for you.",
+    "es": "Esto puede ser una emergencia médica. Llame ahora mismo al número de emergencias local. Si está solo, abra la puerta y no cuelgue con el operador. Estoy preparando indicaciones más detalladas.",
+    "hi": "यह एक मेडिकल इमरजेंसी हो सकती है। अभी तुरंत अपने स्थानीय आपातकालीन नंबर पर कॉल करें। अगर आप अकेले हैं, तो दरवाज़ा खोल दें और ऑपरेटर से बात करते रहें। मैं आपके लिए विस्तृत मार्गदर्शन तैयार कर रहा हूँ।",
+    "ar": "قد تكون هذه حالة طبية طارئة. اتصل برقم الطوارئ المحلي الآن. إذا كنت وحدك، افتح الباب وابقَ على الخط مع المُشغّل. أنا أُعدّ لك إرشادات أكثر تفصيلاً.",
+    "zh": "这可能是医疗紧急情况。请立即拨打当地急救电话。如果您独自一人，请打开门锁并保持与接线员通话。我正在为您准备更详细的指导。",
+    "fr": "Il peut s'agir d'une urgence médicale. Appelez immédiatement le numéro d'urgence local. Si vous êtes seul, déverrouillez votre porte et restez en ligne avec l'opérateur. Je prépare des conseils plus détaillés.",
+    "de": "Dies könnte ein medizinischer Notfall sein. Rufen Sie sofort die örtliche Notrufnummer an. Wenn Sie allein sind, entriegeln Sie die Tür und bleiben Sie am Telefon. Ich bereite ausführlichere Hinweise für Sie vor.",
+    "pt": "Isto pode ser uma emergência médica. Ligue agora mesmo para o número de emergência local. Se estiver sozinho, destranque a porta e fique na linha com o atendente. Estou preparando orientações mais detalhadas.",
+    "ru": "Возможно, это неотложное состояние. Немедленно позвоните по местному номеру экстренной помощи. Если вы один, откройте дверь и оставайтесь на линии с оператором. Я готовлю для вас более подробные рекомендации.",
+    "ja": "医療の緊急事態の可能性があります。今すぐ地域の緊急通報番号に電話してください。一人の場合は、ドアの鍵を開けて、オペレーターとの通話を続けてください。より詳しい案内を準備しています。"
+}
+
+
+class EmergencyResponder:
+    def __init__(self, triage: TriageEngine, elevenlabs_service=None, audio_store=None):
+        """
+        Initialize the fast path
+
+        Args:
+            triage: Shared triage engine
+            elevenlabs_service: Used once at startup to synthesize the instructions
+            audio_store: Where the instruction audio is served from
+        """
+        self.triage = triage
+        self.elevenlabs_service = elevenlabs_service
+        self.audio_store = audio_store
+
+        # Pre-synthesized instruction audio per language: (artifact id, bytes)
+        self._audio: Dict[str, tuple] = {}
+        # Detailed answers produced in the background, by conversation id
+        self._followups: Dict[str, asyncio.Task] = {}
+        self._followup_done_at: Dict[str, float] = {}
+
+    async def warm_up(self):
+        """Synthesize every instruction once (failures leave that language text-only)"""
+        if self.elevenlabs_service is None:
+            return
+
+        for language, text in EMERGENCY_INSTRUCTIONS.items():
+            try:
+                data = await self.elevenlabs_service.synthesize(text, language)
+            except Exception as e:
+                logger.error(f"Failed to pre-synthesize emergency audio for {language}: {str(e)}")
+                continue
+            self._audio[language] = (self.elevenlabs_service.cache_key(text, language), data)
+
+        logger.info(f"Emergency instructions ready with audio for: {', '.join(sorted(self._audio))}")
+
+    def detect(self, user_message: str, language: str = "en") -> Optional[TriageResult]:
+        """Return the triage result when the message is an emergency"""
+        result = self.triage.scan(user_message, language)
+        return result if result.is_emergency else None
+
+    def instruction(self, language: str = "en") -> Dict:
+        """Pre-rendered instruction text and audio URL for a language"""
+        if language not in EMERGENCY_INSTRUCTIONS:
+            language = "en"
+
+        audio_url = None
+        audio = self._audio.get(language)
+        if audio is not None and self.audio_store is not None:
+            audio_id, data = audio
+            # Re-putting refreshes the artifact's expiry without copying the bytes
+            self.audio_store.put(data, "audio/mpeg", artifact_id=audio_id)
+            audio_url = f"/api/audio/{audio_id}"
+
+        return {"text": EMERGENCY_INSTRUCTIONS[language], "audio_url": audio_url}
+
+    def start_followup(self, conversation_id: str, coro):
+        """Run the detailed answer in the background"""
+        self._expire_followups()
+        task = asyncio.create_task(coro)
+        self._followups[conversation_id] = task
+        task.add_done_callback(lambda task: self._on_followup_done(task, conversation_id))
+
+    def _on_followup_done(self, task: asyncio.Task, conversation_id: str):
+        self._followup_done_at[conversation_id] = time.time()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Emergency follow-up for {conversation_id} failed: {str(task.exception())}")
+
+    async def get_followup(self, conversation_id: str, timeout: float):
+        """
+        Wait for the detailed answer
+
+        Returns None if there is no follow-up for this conversation;
+        raises asyncio.TimeoutError if it is not ready within timeout.
+        """
+        task = self._followups.get(conversation_id)
+        if task is None:
+            return None
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+
+    def _expire_followups(self):
+        cutoff = time.time() - FOLLOWUP_TTL_SECONDS
+        for conversation_id, done_at in list(self._followup_done_at.items()):
+            if done_at < cutoff:
+                self._followup_done_at.pop(conversation_id, None)
+                self._followups.pop(conversation_id, None)
+
+    async def close(self):
+        """Cancel follow-ups that are still running"""
+        for task in self._followups.values():
+            task.cancel()
+        if self._followups:
+            await asyncio.gather(*self._followups.values(), return_exceptions=True)
+        self._followups.clear()
+        self._followup_done_at.clear()
@@ -4,16 +4,48 @@ Handles conversation with Google Gemini for medical consultations
 """
 
 import os
+import asyncio
 import google.generativeai as genai
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 import logging
 import uuid
 
+from .triage import TriageEngine
+from .prompt_builder import create_prompt_builder
+from .session_store import SessionState
+from .response_cache import ResponseCache, make_context_key
+from .single_flight import SingleFlight, make_flight_key
+from .metrics import instrument, stage
+from .admission import AdmissionRejected, UpstreamLimiter
+from .resilience import CircuitOpen, UpstreamPolicy
+from .reports import REPORT_PROMPT, REPORT_UPDATE_PROMPT, ConsultationReport, format_transcript, parse_report
+
 logger = logging.getLogger(__name__)
 
+class FallbackText(str):
+    """The canned apology streamed in place of an answer Gemini did not produce"""
+
 class GeminiService:
-    def __init__(self):
-        """Initialize Gemini AI service"""
+    def __init__(
+        self,
+        triage: Optional[TriageEngine] = None,
+        response_cache: Optional[ResponseCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        resilience: Optional[UpstreamPolicy] = None
+    ):
+        """
+        Initialize Gemini AI service
+        
+        Args:
+            triage: Shared precompiled triage engine (one is built if omitted)
+            response_cache: Opt-in cache of answers for repetitive opening turns
+            single_flight: Coalesces identical concurrent generations (shared with ElevenLabsService)
+            limiter: Admission control for Gemini calls (concurrency, rate,
+                priority queue), used when no resilience policy is given
+            resilience: Deadlines, retries, hedging and circuit breaker for
+                Gemini calls (holds the limiter)
+        """
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
@@ -23,13 +55,75 @@ class GeminiService:
         # Use Gemini 2.0 Flash for fast, intelligent responses
         self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
         
-    def _get_system_prompt(self, conversation_history: List[Dict]) -> str:
+        self.triage = triage or TriageEngine()
+        
+        # Token-budgeted history with a rolling summary; renderings are cached across turns
+        self.prompt_builder = create_prompt_builder(self.triage)
+        
+        self.response_cache = response_cache
+        self.single_flight = single_flight or SingleFlight()
+        # Only turns this early in a consultation are cacheable
+        self.cache_max_history = int(os.getenv("GEMINI_CACHE_MAX_HISTORY", 2))
+        
+        # Per-call deadlines so a hung generation never holds a request open
+        self.response_timeout = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 30))
+        self.report_timeout = float(os.getenv("GEMINI_REPORT_TIMEOUT_SECONDS", 60))
+        self.resilience = resilience or UpstreamPolicy("gemini", timeout=self.response_timeout, limiter=limiter)
+        self.limiter = self.resilience.limiter
+        
+    @instrument("gemini_generate", upstream="gemini")
+    async def _generate(self, prompt: str, timeout: float):
+        """
+        Run a generation on the SDK's async API with a deadline
+        
+        Cancelling the awaiting task (e.g. the client disconnected) cancels
+        the underlying gRPC call as well. The deadline applies per attempt
+        and starts once admission control lets the call through; transient
+        failures are retried with backoff. Shed calls raise AdmissionRejected,
+        and CircuitOpen while Gemini is failing.
+        """
+        return await self.resilience.call(lambda: self.model.generate_content_async(prompt), timeout=timeout)
+
+    def _cache_context(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict]],
+        language: str,
+        session,
+        cacheable: bool
+    ) -> Optional[str]:
+        """
+        Response cache context key, or None when this turn must not be cached
+        
+        Only turns without patient-specific context qualify: the caller
+        allows it (no patient record), the history is still short, and the
+        message is not an emergency.
+        """
+        if self.response_cache is None or not cacheable:
+            return None
+        history = session.history if session is not None else (conversation_history or [])
+        if len(history) > self.cache_max_history:
+            return None
+        if self.triage.scan(user_message, language).is_emergency:
+            return None
+        
+        has_ai_spoken = any(msg.get("role") in ("assistant", "model") for msg in history)
+        state = "consultation" if has_ai_spoken else "greeting"
+        return make_context_key(state, language, history)
+
+    def _get_system_prompt(
+        self,
+        conversation_history: List[Dict],
+        has_greeted: Optional[bool] = None
+    ) -> str:
         """
         Get the appropriate system prompt based on conversation state
+        
+        A session's has_greeted flag, when known, avoids rescanning the history.
         """
         # Check if AI has already greeted/spoken
-        has_ai_spoken = False
-        if conversation_history:
+        has_ai_spoken = bool(has_greeted)
+        if has_greeted is None and conversation_history:
             for msg in conversation_history:
                 if msg.get("role") == "model" or msg.get("role") == "assistant":
                     has_ai_spoken = True
@@ -84,94 +178,196 @@ EXAMPLE RESPONSE:
         self,
         user_message: str,
         conversation_history: Optional[List[Dict]] = None,
-        language: str = "en"
+        language: str = "en",
+        session=None,
+        analyze: bool = True,
+        cacheable: bool = False
     ) -> Dict:
         """
         Generate medical response using Gemini
+        
+        When a server-side session is given, its stored history, greeting
+        flag and summary are used instead of conversation_history. With
+        analyze=False the medical context analysis is left to the caller
+        (medical_context is None), so it can overlap with other work.
+        cacheable=True lets an early, non-patient-specific turn use the
+        response cache.
         """
+        conversation_id = session.conversation_id if session else str(uuid.uuid4())
         try:
-            # Build conversation context with DYNAMIC prompt
-            conversation_context = self._build_conversation_context(
-                user_message, 
-                conversation_history,
-                language
-            )
-            
-            # Generate response
-            response = self.model.generate_content(conversation_context)
+            cache_context = self._cache_context(user_message, conversation_history, language, session, cacheable)
+            response_text = None
+            if cache_context is not None:
+                response_text = self.response_cache.get(cache_context, user_message)
             
-            # Extract response text
-            response_text = response.text
+            if response_text is None:
+                # Build conversation context with DYNAMIC prompt
+                conversation_context = self._build_conversation_context(
+                    user_message, 
+                    conversation_history,
+                    language,
+                    session
+                )
+                
+                # Generate response without blocking the event loop; a double
+                # submit with the identical prompt shares the in-flight call
+                response = await self.single_flight.do(
+                    make_flight_key("gemini", conversation_context),
+                    lambda: self._generate(conversation_context, self.response_timeout)
+                )
+                
+                # Extract response text
+                response_text = response.text
+                if cache_context is not None:
+                    self.response_cache.put(cache_context, user_message, response_text)
             
             # Analyze medical context (severity, urgency, etc.)
-            medical_context = self._analyze_medical_context(user_message, response_text)
+            medical_context = None
+            if analyze:
+                medical_context = self._analyze_medical_context(user_message, response_text, language)
             
             return {
                 "text": response_text,
-                "conversation_id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
                 "medical_context": medical_context,
                 "language": language
             }
             
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini response timed out after {self.response_timeout}s")
+            return self._fallback_response(language, conversation_id)
+        except CircuitOpen as e:
+            # Fail fast with the canned reply instead of waiting on a sick upstream
+            logger.warning(str(e))
+            return self._fallback_response(language, conversation_id)
+        except AdmissionRejected:
+            # Shed load is reported to the client (429/503), not papered over
+            raise
         except Exception as e:
             logger.error(f"Error generating Gemini response: {str(e)}")
-            # Fallback response
-            return {
-                "text": "I apologize, but I'm having trouble processing your request right now. Please try again, or if this is urgent, please contact a healthcare professional immediately.",
-                "conversation_id": str(uuid.uuid4()),
-                "medical_context": {"error": True},
-                "language": language
-            }
+            return self._fallback_response(language, conversation_id)
 
-    async def generate_consultation_report(self, conversation_history: List[Dict]) -> Dict:
+    async def stream_medical_response(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict]] = None,
+        language: str = "en",
+        session=None,
+        cacheable: bool = False
+    ) -> AsyncIterator[str]:
         """
-        Generate a structured medical report from conversation history
+        Stream the medical response as text deltas
+
+        The fallback text (a FallbackText) is yielded instead if Gemini
+        fails before producing any output (or at once while its circuit is
+        open). A response cache hit is yielded as one delta. Raises
+        AdmissionRejected when the call is shed.
         """
+        produced = False
+        parts: List[str] = []
         try:
-            # Create a transcript string
-            transcript = "\n".join([f"{msg['role'].upper()}: {msg['content']}" for msg in conversation_history])
-            
-            prompt = f"""
-            Analyze this medical consultation transcript and generate a structured summary report.
-            
-            TRANSCRIPT:
-            {transcript}
-            
-            OUTPUT IN JSON FORMAT ONLY:
-            {{
-                "patient_symptoms": "Summary of symptoms reported",
-                "diagnosis": "Likely diagnosis provided",
-                "medications": ["List of medications prescribed"],
-                "lifestyle_advice": "Diet and lifestyle recommendations given",
-                "precautions": "Safety warnings and precautions mentioned",
-                "follow_up": "When to seek further care"
-            }}
-            """
-            
-            response = self.model.generate_content(prompt)
-            # Clean up response to ensure valid JSON (remove markdown code blocks if present)
-            text = response.text.strip()
-            if text.startswith("```json"):
-                text = text[7:-3]
-            elif text.startswith("```"):
-                text = text[3:-3]
-                
-            return text  # It's a JSON string, user can parse it
-            
+            cache_context = self._cache_context(user_message, conversation_history, language, session, cacheable)
+            if cache_context is not None:
+                cached = self.response_cache.get(cache_context, user_message)
+                if cached is not None:
+                    yield cached
+                    return
+
+            conversation_context = self._build_conversation_context(
+                user_message,
+                conversation_history,
+                language,
+                session
+            )
+
+            async def deltas():
+                response = await self.model.generate_content_async(conversation_context, stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+
+            # The deadline covers the first delta and each gap between deltas
+            with stage("gemini_stream", upstream="gemini"):
+                async for text in self.resilience.stream(deltas, timeout=self.response_timeout):
+                    produced = True
+                    parts.append(text)
+                    yield text
+
+            if cache_context is not None:
+                self.response_cache.put(cache_context, user_message, "".join(parts))
+
+        except CircuitOpen as e:
+            logger.warning(str(e))
+            yield FallbackText(self._fallback_response(language)["text"])
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            logger.error(f"Error generating report: {str(e)}")
-            return '{"error": "Failed to generate report"}'
+            logger.error(f"Error streaming Gemini response: {str(e)}")
+            if not produced:
+                yield FallbackText(self._fallback_response(language)["text"])
+
+    def _fallback_response(self, language: str, conversation_id: Optional[str] = None) -> Dict:
+        """Fallback response used when Gemini fails or times out"""
+        return {
+            "text": "I apologize, but I'm having trouble processing your request right now. Please try again, or if this is urgent, please contact a healthcare professional immediately.",
+            "conversation_id": conversation_id or str(uuid.uuid4()),
+            "medical_context": {"error": True},
+            "language": language
+        }
+
+    async def generate_consultation_report(
+        self,
+        conversation_history: Optional[List[Dict]] = None,
+        transcript: Optional[str] = None
+    ) -> ConsultationReport:
+        """
+        Generate a structured medical report from conversation history
+
+        An already rendered transcript (see reports.format_transcript) can be
+        passed instead of the history. Raises asyncio.TimeoutError or
+        ReportParseError when no report could be produced.
+        """
+        if transcript is None:
+            transcript = format_transcript(conversation_history or [])
+
+        try:
+            response = await self._generate(REPORT_PROMPT.format(transcript=transcript), self.report_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Report generation timed out after {self.report_timeout}s")
+            raise
+        return parse_report(response.text)
     
+    async def update_consultation_report(self, report: ConsultationReport, transcript: str) -> ConsultationReport:
+        """
+        Fold new consultation messages into an existing report
+
+        Only the new messages are sent, so the cost does not grow with the
+        length of the consultation. Raises like generate_consultation_report.
+        """
+        prompt = REPORT_UPDATE_PROMPT.format(report=report.model_dump_json(indent=2), transcript=transcript)
+        try:
+            response = await self._generate(prompt, self.report_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Report update timed out after {self.report_timeout}s")
+            raise
+        return parse_report(response.text)
+    
+    @instrument("prompt_build")
     def _build_conversation_context(
         self,
         user_message: str,
         conversation_history: Optional[List[Dict]],
-        language: str
+        language: str,
+        session=None
     ) -> str:
         """Build full conversation context for Gemini"""
         
+        # Prefer the server-side session state over the client's history
+        if session is None:
+            session = SessionState.from_history(None, conversation_history, language)
+        
         # Get DYNAMIC system prompt based on history state
-        current_system_prompt = self._get_system_prompt(conversation_history)
+        current_system_prompt = self._get_system_prompt(session.history, session.has_greeted)
         
         # Language-specific instruction
         language_instruction = ""
@@ -190,51 +386,34 @@ EXAMPLE RESPONSE:
             lang_name = language_map.get(language, "the user's language")
             language_instruction = f"\n\nIMPORTANT: Respond in {lang_name}. The user is communicating in {lang_name}."
         
-        # Build context
-        context = current_system_prompt + language_instruction + "\n\nConversation:\n"
+        # Fit the history into the token budget (older messages fold into the summary)
+        summary, history_lines = self.prompt_builder.fit_history(session)
         
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-10:]:  # Last 10 messages
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                context += f"\n{role.capitalize()}: {content}"
+        # Build context
+        parts = [current_system_prompt, language_instruction]
+        if summary:
+            parts.append(f"\n\nEarlier in this consultation:\n{summary}")
+        parts.append("\n\nConversation:\n")
+        parts.extend(history_lines)
         
         # Add current message
-        context += f"\n\nUser: {user_message}\n\nAssistant:"
+        parts.append(f"\n\nUser: {user_message}\n\nAssistant:")
         
-        return context
+        return "".join(parts)
     
-    def _analyze_medical_context(self, user_message: str, ai_response: str) -> Dict:
+    def _analyze_medical_context(self, user_message: str, ai_response: str, language: str = "en") -> Dict:
         """
         Analyze medical context for urgency and severity
-        This is a simplified version - in production, use more sophisticated analysis
+        Keyword triage of the user message (severity) and the model output
         """
-        
-        # Emergency keywords
-        emergency_keywords = [
-            "chest pain", "can't breathe", "severe bleeding", "unconscious",
-            "stroke", "heart attack", "suicide", "overdose", "severe pain",
-            "difficulty breathing", "choking"
-        ]
-        
-        # High urgency keywords
-        urgent_keywords = [
-            "fever", "vomiting", "diarrhea", "pain", "bleeding", "injury",
-            "infection", "rash", "swelling"
-        ]
-        
-        user_lower = user_message.lower()
-        
-        # Check for emergency
-        is_emergency = any(keyword in user_lower for keyword in emergency_keywords)
-        
-        # Check for urgency
-        is_urgent = any(keyword in user_lower for keyword in urgent_keywords)
+        user_triage = self.triage.scan(user_message, language)
+        response_triage = self.triage.scan(ai_response, language)
         
         return {
-            "is_emergency": is_emergency,
-            "is_urgent": is_urgent,
+            "is_emergency": user_triage.is_emergency,
+            "is_urgent": user_triage.is_urgent,
             "requires_followup": True,
-            "severity": "high" if is_emergency else "medium" if is_urgent else "low"
+            "severity": user_triage.severity,
+            "matches": [m.to_dict() for m in user_triage.matches],
+            "response_matches": [m.to_dict() for m in response_triage.matches]
         }
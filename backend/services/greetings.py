@@ -0,0 +1,271 @@
+"""
+Greetings - Pre-Rendered First Turn
+Keeps a few greeting variants per language, with synthesized audio, so the
+first turn of a consultation needs neither Gemini nor ElevenLabs
+"""
+
+import os
+import re
+import json
+import random
+import asyncio
+import logging
+import tempfile
+from typing import Dict, List, Optional
+
+from .admission import BACKGROUND, set_task_priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GREETINGS = {
+    "en": [
+        "Hello! I'm Dr. MediVoice. How can I help you today?",
+        "Hi there, I'm Dr. MediVoice. What brings you in today?"
+    ],
+    "es": [
+        "¡Hola! Soy el Dr. MediVoice. ¿En qué puedo ayudarle hoy?",
+        "Hola, soy el Dr. MediVoice. ¿Qué le trae por aquí hoy?"
+    ],
+    "hi": [
+        "नमस्ते! मैं डॉ. मेडीवॉइस हूँ। आज मैं आपकी कैसे मदद कर सकता हूँ?",
+        "नमस्ते, मैं डॉ. मेडीवॉइस हूँ। बताइए, आज आपको क्या परेशानी है?"
+    ],
+    "ar": [
+        "مرحباً! أنا الدكتور ميدي فويس. كيف يمكنني مساعدتك اليوم؟",
+        "أهلاً، أنا الدكتور ميدي فويس. ما الذي يزعجك اليوم؟"
+    ],
+    "zh": [
+        "您好！我是MediVoice医生。今天有什么可以帮您的？",
+        "你好，我是MediVoice医生。今天哪里不舒服？"
+    ],
+    "fr": [
+        "Bonjour ! Je suis le Dr MediVoice. Comment puis-je vous aider aujourd'hui ?",
+        "Bonjour, je suis le Dr MediVoice. Qu'est-ce qui vous amène aujourd'hui ?"
+    ],
+    "de": [
+        "Hallo! Ich bin Dr. MediVoice. Wie kann ich Ihnen heute helfen?",
+        "Guten Tag, ich bin Dr. MediVoice. Was führt Sie heute zu mir?"
+    ],
+    "pt": [
+        "Olá! Eu sou o Dr. MediVoice. Como posso ajudar você hoje?",
+        "Oi, eu sou o Dr. MediVoice. O que traz você aqui hoje?"
+    ],
+    "ru": [
+        "Здравствуйте! Я доктор MediVoice. Чем я могу вам помочь сегодня?",
+        "Добрый день, я доктор MediVoice. Что вас беспокоит?"
+    ],
+    "ja": [
+        "こんにちは！MediVoice医師です。今日はどうされましたか？",
+        "こんにちは、MediVoice医師です。本日はどのようなご相談でしょうか？"
+    ]
+}
+
+# Words a first message may consist of and still be only a greeting or small talk
+SMALL_TALK_WORDS = {
+    "en": set(
+        "hello hi hey hiya howdy greetings good morning afternoon evening day doctor doc dr medivoice there "
+        "how are you doing is it going what whats s up nice to meet thanks thank ok okay yes yeah i im m "
+        "fine well great and can could help me please need some advice question"
+    .split()),
+    "es": set(
+        "hola buenos buenas días dias tardes noches doctor doctora qué que tal cómo como está esta estás estas "
+        "usted gracias sí si vale bien muy puede ayudarme ayuda me por favor necesito"
+    .split()),
+    "hi": set("नमस्ते नमस्कार हेलो हाय डॉक्टर साहब जी आप कैसे हैं है धन्यवाद शुक्रिया ठीक हाँ मदद चाहिए मुझे".split()),
+    "ar": set("مرحبا مرحباً أهلا أهلاً السلام عليكم صباح مساء الخير النور دكتور يا كيف حالك شكرا شكراً نعم ممكن مساعدة".split()),
+    "fr": set(
+        "bonjour bonsoir salut coucou docteur comment allez vous ça ca va merci oui bien très tres "
+        "pouvez m aider aide s il vous plaît plait"
+    .split()),
+    "de": set(
+        "hallo guten morgen tag abend servus moin grüß gott herr frau doktor wie geht es ihnen dir danke ja gut "
+        "sehr können sie mir helfen bitte"
+    .split()),
+    "pt": set(
+        "olá ola oi bom dia boa tarde noite doutor doutora tudo bem como vai você voce está esta obrigado obrigada "
+        "sim pode me ajudar ajuda por favor"
+    .split()),
+    "ru": set("здравствуйте привет добрый день утро вечер доброе доктор как дела вы поживаете спасибо да хорошо помогите мне пожалуйста".split())
+}
+
+# Languages written without spaces: phrases removed until nothing is left
+SMALL_TALK_PHRASES = {
+    "zh": ["早上好", "下午好", "晚上好", "您好", "你好", "哈喽", "医生", "大夫", "谢谢", "在吗", "请问", "嗨", "您", "你"],
+    "ja": [
+        "よろしくお願いします", "おはようございます", "ありがとうございます", "こんにちは", "こんばんは",
+        "お願いします", "よろしく", "ありがとう", "おはよう", "ドクター", "先生", "はい"
+    ]
+}
+
+# Longer first messages are assumed to describe a concern
+SMALL_TALK_MAX_WORDS = 8
+
+_WORD = re.compile(r"\w+")
+
+
+def is_small_talk(message: str, language: str = "en") -> bool:
+    """Whether a message is only a greeting or small talk (no concern described yet)"""
+    text = message.casefold()
+    if language in SMALL_TALK_PHRASES:
+        for phrase in SMALL_TALK_PHRASES[language]:
+            text = text.replace(phrase, " ")
+        return not _WORD.search(text)
+
+    words = _WORD.findall(text)
+    vocabulary = SMALL_TALK_WORDS.get(language, SMALL_TALK_WORDS["en"])
+    return 0 < len(words) <= SMALL_TALK_MAX_WORDS and all(word in vocabulary for word in words)
+
+
+LANGUAGE_NAMES = {
+    "en": "English", "es": "Spanish", "hi": "Hindi", "ar": "Arabic", "zh": "Chinese",
+    "fr": "French", "de": "German", "pt": "Portuguese", "ru": "Russian", "ja": "Japanese"
+}
+
+
+class Greeting:
+    """One greeting variant"""
+
+    def __init__(self, text: str, audio_id: Optional[str] = None, audio: Optional[bytes] = None):
+        self.text = text
+        self.audio_id = audio_id
+        self.audio = audio
+
+
+class GreetingStore:
+    def __init__(self, elevenlabs_service=None, audio_store=None, path: Optional[str] = None):
+        """
+        Initialize the store
+
+        Args:
+            elevenlabs_service: Synthesizes the variants (audio is reused from the TTS cache)
+            audio_store: Where greeting audio is served from
+            path: JSON file the variant texts are loaded from and saved to
+        """
+        self.elevenlabs_service = elevenlabs_service
+        self.audio_store = audio_store
+        self.path = path
+        self._greetings: Dict[str, List[Greeting]] = {}
+
+    async def warm_up(self):
+        """Load the variants from disk (or the built-in set) and synthesize them"""
+        # Runs as its own task; conversation turns go first
+        set_task_priority(BACKGROUND)
+        texts = await asyncio.to_thread(self._load) or DEFAULT_GREETINGS
+        self._greetings = await self._render(texts)
+        logger.info(f"Greetings ready for: {', '.join(sorted(self._greetings))}")
+
+    async def refresh(self, gemini_service=None, variants: int = 2) -> Dict[str, int]:
+        """
+        Rebuild every variant, optionally asking Gemini for new wording
+
+        Languages Gemini fails on keep their current texts. The result
+        replaces the served set at once and is saved to disk.
+        """
+        texts = {language: [g.text for g in greetings] for language, greetings in self._greetings.items()}
+        texts = texts or dict(DEFAULT_GREETINGS)
+
+        if gemini_service is not None:
+            generated = await asyncio.gather(
+                *(self._generate(gemini_service, language, variants) for language in LANGUAGE_NAMES),
+                return_exceptions=True
+            )
+            for language, result in zip(LANGUAGE_NAMES, generated):
+                if isinstance(result, Exception) or not result:
+                    logger.error(f"Failed to generate greetings for {language}: {result}")
+                    continue
+                texts[language] = result
+
+        self._greetings = await self._render(texts)
+        await asyncio.to_thread(self._save, texts)
+        return {language: len(greetings) for language, greetings in self._greetings.items()}
+
+    async def _generate(self, gemini_service, language: str, variants: int) -> List[str]:
+        prompt = (
+            f"You are Dr. MediVoice, a friendly and empathetic AI doctor. Write {variants} different "
+            f"short greetings in {LANGUAGE_NAMES[language]} that greet the patient warmly once and ask "
+            "ONE open-ended question about their concern. Do not give medical advice. "
+            "Return only a JSON array of strings."
+        )
+        response = await gemini_service._generate(prompt, gemini_service.response_timeout)
+        text = response.text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        greetings = json.loads(text)
+        return [g.strip() for g in greetings if isinstance(g, str) and g.strip()][:variants]
+
+    async def _render(self, texts: Dict[str, List[str]]) -> Dict[str, List[Greeting]]:
+        rendered: Dict[str, List[Greeting]] = {}
+        for language, variants in texts.items():
+            for text in variants:
+                greeting = Greeting(text)
+                if self.elevenlabs_service is not None:
+                    try:
+                        greeting.audio = await self.elevenlabs_service.synthesize(text, language)
+                        greeting.audio_id = self.elevenlabs_service.cache_key(text, language)
+                    except Exception as e:
+                        # Without audio this variant is left out
+                        logger.error(f"Failed to synthesize greeting for {language}: {str(e)}")
+                        continue
+                rendered.setdefault(language, []).append(greeting)
+        return rendered
+
+    def _load(self) -> Optional[Dict[str, List[str]]]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load greetings from {self.path}: {str(e)}")
+            return None
+
+    def _save(self, texts: Dict[str, List[str]]):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(texts, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def will_greet(self, session, user_message: str, language: str, triage) -> bool:
+        """
+        Whether this turn is answered with a greeting
+
+        Only the first turn of a session gets one, and only when the message
+        is a greeting or small talk with nothing for triage to flag; a first
+        message that already describes a concern goes to Gemini.
+        """
+        return (
+            not session.has_greeted
+            and not triage.matches
+            and bool(self._greetings.get(language))
+            and is_small_talk(user_message, language)
+        )
+
+    def greeting_for(self, session, user_message: str, language: str, triage) -> Optional[Dict]:
+        """The greeting that answers this turn (see will_greet), or None"""
+        if not self.will_greet(session, user_message, language, triage):
+            return None
+        return self.pick(language)
+
+    def pick(self, language: str = "en") -> Optional[Dict]:
+        """A ready greeting for the language, or None (the caller falls back to Gemini)"""
+        variants = self._greetings.get(language)
+        if not variants:
+            return None
+        greeting = random.choice(variants)
+
+        audio_url = None
+        if greeting.audio is not None and self.audio_store is not None:
+            # Re-putting refreshes the artifact's expiry without copying the bytes
+            self.audio_store.put(greeting.audio, "audio/mpeg", artifact_id=greeting.audio_id)
+            audio_url = f"/api/audio/{greeting.audio_id}"
+        return {"text": greeting.text, "audio_url": audio_url, "audio": greeting.audio}
+
+    def stats(self) -> Dict[str, int]:
+        return {language: len(greetings) for language, greetings in self._greetings.items()}
+
+
+def create_greeting_store(elevenlabs_service=None, audio_store=None) -> GreetingStore:
+    """Build the greeting store from the environment"""
+    path = os.getenv("GREETINGS_PATH", os.path.join(tempfile.gettempdir(), "medivoice", "greetings.json"))
+    return GreetingStore(elevenlabs_service, audio_store, path or None)
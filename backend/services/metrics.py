@@ -0,0 +1,373 @@
+"""
+Metrics - Hot-Path Instrumentation
+Stage histograms, in-flight gauges and upstream error counters, rendered in
+the Prometheus text format, plus per-request Server-Timing
+"""
+
+import os
+import time
+import inspect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers a JSON render (sub-millisecond) up to a slow report generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    """Value that goes up and down (e.g. calls in flight)"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (non-cumulative), sum, count
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metrics
+
+    Collectors are called at scrape time and return extra
+    (name, kind, documentation, [(labels, value)]) families, so components
+    that already keep their own counters (caches, queues) need no changes.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple]]):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[Tuple]]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# One registry per process (each uvicorn worker exposes its own)
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "medivoice_stage_duration_seconds",
+    "Duration of instrumented hot-path stages",
+    ["stage"]
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "medivoice_stage_in_flight",
+    "Instrumented stages currently running",
+    ["stage"]
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "medivoice_upstream_errors_total",
+    "Failed calls to Gemini, ElevenLabs and speech-to-text",
+    ["upstream", "error"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "medivoice_http_request_duration_seconds",
+    "Time to the response headers, by route",
+    ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "medivoice_http_requests_in_flight",
+    "HTTP requests being handled"
+)
+
+# Stage durations of the current request, for the Server-Timing header. Tasks
+# spawned by the request copy the context, so their stages land here as well.
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+@contextmanager
+def stage(name: str, upstream: Optional[str] = None):
+    """
+    Time a block as a named stage
+
+    With upstream set, exceptions raised inside the block (timeouts
+    included) count as errors of that upstream.
+    """
+    STAGE_IN_FLIGHT.inc(stage=name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Cancellation (client went away) is a BaseException and not counted
+        if upstream is not None:
+            UPSTREAM_ERRORS.inc(upstream=upstream, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_IN_FLIGHT.dec(stage=name)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def instrument(name: str, upstream: Optional[str] = None):
+    """Decorator form of stage() for plain and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name, upstream):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, upstream):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(stages: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing value; repeated stages are summed with their count"""
+    durations: Dict[str, List[float]] = {}
+    for name, elapsed in stages:
+        durations.setdefault(name, []).append(elapsed)
+    entries = []
+    for name, values in durations.items():
+        entry = f"{name};dur={sum(values) * 1000:.1f}"
+        if len(values) > 1:
+            entry += f';desc="x{len(values)}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request durations by route
+
+    With server_timing on, stages that completed before the response
+    headers were sent are reported in a Server-Timing header (for streamed
+    responses that is the work done before the first byte).
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stages: List[Tuple[str, float]] = []
+        token = _request_stages.set(stages)
+        status = {"code": 500}
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"])
+            )
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing:
+                    value = server_timing_header(stages, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+                record()
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            record()
+            _request_stages.reset(token)
+
+
+def stats_families(prefix: str, stats: Dict, counters: Iterable[str] = ()) -> List[Tuple]:
+    """
+    Numeric entries of a component's stats() as metric families
+
+    Keys listed in counters become "<prefix>_<key>_total" counters, the
+    rest "<prefix>_<key>" gauges.
+    """
+    counters = set(counters)
+    families = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            families.append((f"{prefix}_{key}_total", "counter", f"{prefix} {key}", [({}, value)]))
+        else:
+            families.append((f"{prefix}_{key}", "gauge", f"{prefix} {key}", [({}, value)]))
+    return families
+
+
+def server_timing_enabled() -> bool:
+    return os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
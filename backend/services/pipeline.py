@@ -0,0 +1,241 @@
+"""
+Turn Pipeline - Overlapped Post-Generation Stages
+Starts speech synthesis the moment the answer text is final and runs the
+medical context analysis and session bookkeeping alongside it
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+from .admission import priority, turn_priority
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """Wall-clock duration of each pipeline stage, in milliseconds"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            **self.stages,
+            "total": round((time.perf_counter() - self._started) * 1000, 2)
+        }
+
+
+class TurnResult:
+    """Outcome of one conversation turn"""
+
+    def __init__(
+        self,
+        text: str,
+        conversation_id: str,
+        medical_context: Optional[Dict],
+        audio_url: Optional[str],
+        audio_pending: bool,
+        timings: Dict[str, float],
+        language: str = "en",
+        audio_format: str = "mp3"
+    ):
+        self.text = text
+        self.conversation_id = conversation_id
+        self.medical_context = medical_context
+        self.audio_url = audio_url
+        self.audio_pending = audio_pending
+        self.timings = timings
+        self.language = language
+        self.audio_format = audio_format
+
+
+class TurnPipeline:
+    def __init__(
+        self,
+        gemini_service,
+        elevenlabs_service,
+        audio_store,
+        session_store,
+        greetings=None,
+        reports=None
+    ):
+        """Initialize the pipeline over the shared services"""
+        self.gemini_service = gemini_service
+        self.elevenlabs_service = elevenlabs_service
+        self.audio_store = audio_store
+        self.session_store = session_store
+        self.greetings = greetings
+        self.reports = reports
+
+        # Deferred syntheses still running after their response was sent
+        self._background: Set[asyncio.Task] = set()
+
+    async def run(
+        self,
+        user_message: str,
+        session,
+        language: str = "en",
+        defer_audio: bool = False,
+        cacheable: bool = False,
+        audio_variant=None
+    ) -> TurnResult:
+        """
+        Run one turn
+
+        Gemini -> [TTS || analysis || session bookkeeping] -> result
+
+        With defer_audio=True the result is returned as soon as the text
+        and analysis are ready; audio_url then points at an artifact that
+        GET /api/audio/{id} serves once synthesis finishes. cacheable is
+        passed on to GeminiService (see its response cache). audio_variant
+        picks the speech format (ElevenLabsService.audio_variant; MP3 when
+        omitted).
+
+        The first turn of a session is answered with a pre-rendered
+        greeting when one is ready for the language and the message is only
+        a greeting or small talk (see GreetingStore.will_greet). Upstream
+        calls run at the priority of the message's triage (emergencies
+        first). Greetings are pre-rendered and always MP3.
+        """
+        triage = self.gemini_service.triage.scan(user_message, language)
+        with priority(turn_priority(triage)):
+            return await self._run(user_message, session, language, defer_audio, cacheable, audio_variant, triage)
+
+    async def _run(
+        self,
+        user_message: str,
+        session,
+        language: str,
+        defer_audio: bool,
+        cacheable: bool,
+        audio_variant,
+        triage
+    ) -> TurnResult:
+        timings = StageTimings()
+        if audio_variant is None and self.elevenlabs_service is not None:
+            audio_variant = self.elevenlabs_service.audio_variant()
+
+        if self.greetings is not None:
+            greeting = self.greetings.greeting_for(session, user_message, language, triage)
+            if greeting is not None:
+                return await self._greet(user_message, session, language, greeting, timings)
+
+        with timings.stage("gemini"):
+            ai_response = await self.gemini_service.generate_medical_response(
+                user_message=user_message,
+                language=language,
+                session=session,
+                analyze=False,
+                cacheable=cacheable
+            )
+        text = ai_response["text"]
+        fallback_context = ai_response.get("medical_context")
+
+        # Start speech synthesis immediately
+        tts_task = None
+        audio_url = None
+        if self.elevenlabs_service is not None:
+            tts_task = asyncio.create_task(self._synthesize(text, language, audio_variant, timings))
+            if defer_audio:
+                audio_id = self.elevenlabs_service.audio_id(text, language, variant=audio_variant)
+                self.audio_store.reserve(audio_id)
+                audio_url = f"/api/audio/{audio_id}"
+                tts_task.add_done_callback(lambda task: self._on_deferred_done(task, audio_id))
+                self._background.add(tts_task)
+                tts_task.add_done_callback(self._background.discard)
+
+        async def analyze():
+            with timings.stage("analysis"):
+                if fallback_context is not None:
+                    return fallback_context
+                return self.gemini_service._analyze_medical_context(user_message, text, language)
+
+        async def record():
+            with timings.stage("session"):
+                # Don't store the canned reply used when Gemini failed
+                if fallback_context is None:
+                    session.record_turn(user_message, text)
+                    await self.session_store.save(session)
+                    if self.reports is not None:
+                        self.reports.schedule_update(session.conversation_id)
+
+        if tts_task is not None and not defer_audio:
+            medical_context, _, audio_url = await asyncio.gather(analyze(), record(), tts_task)
+        else:
+            medical_context, _ = await asyncio.gather(analyze(), record())
+
+        result = TurnResult(
+            text=text,
+            conversation_id=session.conversation_id,
+            medical_context=medical_context,
+            audio_url=audio_url,
+            audio_pending=bool(defer_audio and tts_task is not None and not tts_task.done()),
+            timings=timings.as_dict(),
+            language=language,
+            audio_format=audio_variant.format if audio_variant is not None else "mp3"
+        )
+        logger.info(f"Turn {session.conversation_id} stage timings (ms): {result.timings}")
+        return result
+
+    async def _greet(
+        self,
+        user_message: str,
+        session,
+        language: str,
+        greeting: Dict,
+        timings: StageTimings
+    ) -> TurnResult:
+        with timings.stage("greeting"):
+            text = greeting["text"]
+            medical_context = self.gemini_service._analyze_medical_context(user_message, text, language)
+            session.record_turn(user_message, text)
+        with timings.stage("session"):
+            await self.session_store.save(session)
+            if self.reports is not None:
+                self.reports.schedule_update(session.conversation_id)
+
+        result = TurnResult(
+            text=text,
+            conversation_id=session.conversation_id,
+            medical_context=medical_context,
+            audio_url=greeting["audio_url"],
+            audio_pending=False,
+            timings=timings.as_dict(),
+            language=language
+        )
+        logger.info(f"Turn {session.conversation_id} answered with a greeting (ms): {result.timings}")
+        return result
+
+    async def _synthesize(self, text: str, language: str, variant, timings: StageTimings) -> Optional[str]:
+        with timings.stage("tts"):
+            try:
+                audio_data = await self.elevenlabs_service.text_to_speech(text=text, language=language, variant=variant)
+                return audio_data["audio_url"]
+            except Exception as e:
+                logger.error(f"Failed to generate speech: {str(e)}")
+                # Continue without audio
+                return None
+
+    def _on_deferred_done(self, task: asyncio.Task, audio_id: str):
+        if task.cancelled() or task.result() is None:
+            self.audio_store.fail(audio_id)
+
+    async def close(self):
+        """Cancel deferred syntheses that are still running"""
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        self._background.clear()
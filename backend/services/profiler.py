@@ -0,0 +1,125 @@
+"""
+Sampling Profiler - Runtime-Toggleable Stack Sampler
+Periodically captures every thread's stack and aggregates them in the
+collapsed format flame graph tools read
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = 10, max_stacks: int = 20000, max_depth: int = 64):
+        """
+        Initialize the profiler (stopped)
+
+        Args:
+            interval_ms: Time between samples
+            max_stacks: Distinct stacks kept; further new stacks are dropped
+            max_depth: Frames kept per stack (innermost first)
+        """
+        self.interval_ms = interval_ms
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+        self.dropped = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None) -> bool:
+        """Start sampling from a clean slate; False if already running"""
+        if self.running:
+            return False
+        if interval_ms is not None:
+            self.interval_ms = interval_ms
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.dropped = 0
+        self.started_at = time.time()
+        self.stopped_at = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval_ms} ms interval)")
+        return True
+
+    def stop(self) -> bool:
+        """Stop sampling (the collected stacks are kept); False if not running"""
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped_at = time.time()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        interval = self.interval_ms / 1000
+        while not self._stop.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = self._collapse(names.get(thread_id, str(thread_id)), frame)
+                    if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                        self.dropped += 1
+                        continue
+                    self._stacks[stack] += 1
+                self.samples += 1
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    def collapsed(self) -> str:
+        """One "thread;outer;...;inner count" line per distinct stack"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> Dict:
+        end = self.stopped_at or time.time()
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "dropped": self.dropped,
+            "seconds": round(end - self.started_at, 1) if self.started_at else 0.0
+        }
+
+
+def create_profiler() -> SamplingProfiler:
+    """Build the profiler from the environment (PROFILER_ENABLED starts it at boot)"""
+    profiler = SamplingProfiler(
+        interval_ms=float(os.getenv("PROFILER_INTERVAL_MS", 10)),
+        max_stacks=int(os.getenv("PROFILER_MAX_STACKS", 20000))
+    )
+    if os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes"):
+        profiler.start()
+    return profiler
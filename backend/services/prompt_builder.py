@@ -0,0 +1,303 @@
+"""
+Prompt Builder - Token-Budgeted Conversation Context
+Fits the consultation history into a token budget: recent messages are kept
+(older model answers compacted), and messages that no longer fit are folded
+into a rolling summary of what the patient has already told us
+"""
+
+import os
+import re
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .triage import URGENT, TriageEngine
+
+logger = logging.getLogger(__name__)
+
+# CJK/kana characters are roughly a token each; other words about 4 characters per token
+_TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|\w+|[^\w\s]")
+
+# Longest patient statement kept per entry in the rolling summary
+SUMMARY_ENTRY_CHARS = 200
+
+# Advice entries kept in the summary (the most recent ones), and their length
+SUMMARY_ADVICE_ENTRIES = 3
+SUMMARY_ADVICE_CHARS = 120
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s")
+
+# Facts pulled from English statements; other languages rely on the kept statements
+_DURATION_PATTERN = re.compile(
+    r"\b(?:for|since|past|last)?\s*(?:\d+|a|an|one|two|three|four|five|six|seven|few|several|couple of)\s+"
+    r"(?:minutes?|hours?|days?|nights?|weeks?|months?|years?)(?:\s+ago)?"
+    r"|\bsince\s+(?:yesterday|last\s+\w+|this\s+morning|this\s+week|\w+day)\b",
+    re.IGNORECASE
+)
+_SEVERITY_PATTERN = re.compile(
+    r"\b\d{1,2}\s*(?:/|out of)\s*10\b|\b(?:mild|moderate|severe|unbearable|worst)\b",
+    re.IGNORECASE
+)
+
+# Everyday symptoms picked out of folded patient messages, on top of the
+# triage red flags. Matched like triage keywords (English for every language,
+# negated mentions skipped), so "no fever" is not summarized as a fever.
+SYMPTOM_TERMS: Dict[str, List[str]] = {
+    "en": [
+        "headache", "headaches", "migraine", "migraines", "cough", "coughing", "fever", "chills",
+        "dizziness", "dizzy", "lightheaded", "nausea", "nauseous", "vomiting", "diarrhea", "constipation", "fatigue", "tired", "weakness",
+        "sore throat", "runny nose", "stuffy nose", "congestion", "sneezing", "shortness of breath",
+        "wheezing", "back pain", "stomach ache", "stomachache", "abdominal pain", "heartburn",
+        "palpitations", "rash", "itching", "itchy", "swelling", "numbness", "tingling", "insomnia",
+        "anxiety", "joint pain", "muscle pain", "earache", "blurred vision", "loss of appetite",
+        "weight loss", "night sweats"
+    ],
+    "es": [
+        "dolor de cabeza", "migraña", "tos", "fiebre", "escalofríos", "mareo", "mareos", "náuseas",
+        "vómitos", "diarrea", "estreñimiento", "cansancio", "fatiga", "debilidad", "dolor de garganta",
+        "congestión", "estornudos", "falta de aire", "dolor de espalda", "dolor de estómago",
+        "dolor abdominal", "acidez", "palpitaciones", "sarpullido", "picazón", "hinchazón",
+        "entumecimiento", "hormigueo", "insomnio", "ansiedad", "sudores nocturnos"
+    ],
+    "fr": [
+        "mal de tête", "maux de tête", "migraine", "toux", "fièvre", "frissons", "vertiges",
+        "étourdissements", "nausées", "vomissements", "diarrhée", "constipation", "fatigue",
+        "faiblesse", "mal de gorge", "nez qui coule", "nez bouché", "essoufflement", "mal de dos",
+        "mal au ventre", "douleur abdominale", "brûlures d'estomac", "palpitations", "éruption",
+        "démangeaisons", "gonflement", "engourdissement", "fourmillements", "insomnie", "anxiété"
+    ],
+    "de": [
+        "kopfschmerzen", "migräne", "husten", "fieber", "schüttelfrost", "schwindel", "übelkeit",
+        "erbrechen", "durchfall", "verstopfung", "müdigkeit", "erschöpfung", "schwäche",
+        "halsschmerzen", "schnupfen", "kurzatmigkeit", "rückenschmerzen", "bauchschmerzen",
+        "magenschmerzen", "sodbrennen", "herzrasen", "herzklopfen", "ausschlag", "juckreiz",
+        "schwellung", "taubheit", "kribbeln", "schlaflosigkeit", "angst", "nachtschweiß"
+    ],
+    "pt": [
+        "dor de cabeça", "enxaqueca", "tosse", "febre", "calafrios", "tontura", "náusea", "enjoo",
+        "vômito", "diarreia", "prisão de ventre", "cansaço", "fadiga", "fraqueza", "dor de garganta",
+        "nariz escorrendo", "congestão", "falta de ar", "dor nas costas", "dor de barriga",
+        "dor abdominal", "azia", "palpitações", "coceira", "inchaço", "dormência", "formigamento",
+        "insônia", "ansiedade", "suores noturnos"
+    ],
+    "ru": [
+        "головная боль", "голова болит", "мигрень", "кашель", "температура", "озноб",
+        "головокружение", "тошнота", "рвота", "диарея", "понос", "запор", "усталость", "слабость",
+        "боль в горле", "горло болит", "насморк", "одышка", "боль в спине", "боль в животе",
+        "живот болит", "изжога", "сердцебиение", "сыпь", "зуд", "отек", "онемение", "бессонница",
+        "тревога"
+    ],
+    "zh": [
+        "头痛", "头疼", "偏头痛", "咳嗽", "发烧", "发热", "发冷", "头晕", "眩晕", "恶心", "呕吐", "腹泻",
+        "便秘", "疲劳", "乏力", "喉咙痛", "嗓子疼", "流鼻涕", "鼻塞", "气短", "背痛", "腰痛", "肚子疼",
+        "胃痛", "腹痛", "烧心", "心悸", "皮疹", "瘙痒", "肿胀", "麻木", "失眠", "焦虑", "盗汗"
+    ],
+    "ja": [
+        "頭痛", "頭が痛い", "咳", "せき", "発熱", "熱がある", "寒気", "めまい", "吐き気", "嘔吐", "下痢",
+        "便秘", "疲れ", "だるい", "倦怠感", "喉の痛み", "喉が痛い", "鼻水", "鼻づまり", "息切れ", "腰痛",
+        "背中の痛み", "腹痛", "お腹が痛い", "胃痛", "胸やけ", "動悸", "発疹", "かゆみ", "腫れ", "しびれ",
+        "不眠", "不安", "寝汗"
+    ],
+    "hi": [
+        "सिरदर्द", "सिर दर्द", "खांसी", "बुखार", "ठंड लगना", "चक्कर", "मतली", "जी मिचलाना", "उल्टी",
+        "दस्त", "कब्ज", "थकान", "कमजोरी", "गले में खराश", "नाक बहना", "सांस फूलना", "पीठ दर्द",
+        "कमर दर्द", "पेट दर्द", "सीने में जलन", "धड़कन", "खुजली", "सूजन", "सुन्न", "झुनझुनी",
+        "अनिद्रा", "घबराहट"
+    ],
+    "ar": [
+        "صداع", "سعال", "كحة", "حمى", "قشعريرة", "دوخة", "دوار", "غثيان", "قيء", "إسهال", "إمساك",
+        "تعب", "إرهاق", "ضعف", "التهاب الحلق", "سيلان الأنف", "ضيق في التنفس", "ألم في الظهر",
+        "ألم في البطن", "مغص", "حرقة المعدة", "خفقان", "طفح جلدي", "حكة", "تورم", "تنميل", "أرق", "قلق"
+    ]
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of text without a network round trip
+
+    Errs on the high side for Latin scripts so budgets are not overrun.
+    """
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        count += 1 if length <= 4 else (length + 3) // 4
+    return count
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text after roughly max_tokens tokens"""
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        count += 1 if length <= 4 else (length + 3) // 4
+        if count > max_tokens:
+            return text[:match.start()].rstrip() + " …"
+    return text
+
+
+def empty_summary() -> Dict[str, List[str]]:
+    return {"symptoms": [], "durations": [], "severity": [], "statements": [], "advice": []}
+
+
+def _add_unique(values: List[str], new_values: List[str]):
+    seen = {value.casefold() for value in values}
+    for value in new_values:
+        value = " ".join(value.split())
+        if value and value.casefold() not in seen:
+            values.append(value)
+            seen.add(value.casefold())
+
+
+def _outermost(matches) -> List[str]:
+    """Terms of matches not contained in a longer one (e.g. "pain" inside "back pain")"""
+    terms, end = [], -1
+    for match in sorted(matches, key=lambda m: (m.start, -m.end)):
+        if match.end > end:
+            terms.append(match.term)
+            end = match.end
+    return terms
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        triage=None,
+        history_tokens: int = 1500,
+        summary_tokens: int = 300,
+        answer_tokens: int = 150,
+        min_recent_messages: int = 2,
+        cache_entries: int = 4096
+    ):
+        """
+        Initialize the builder
+
+        Args:
+            triage: Shared TriageEngine, used to pick red flags out of folded messages
+            history_tokens: Budget for the summary plus the verbatim history
+            summary_tokens: Budget for the rolling summary
+            answer_tokens: Older model answers are compacted to this many tokens
+            min_recent_messages: Messages always kept verbatim, even over budget
+            cache_entries: Size of the per-message rendering cache
+        """
+        self.triage = triage
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.answer_tokens = answer_tokens
+        self.min_recent_messages = min_recent_messages
+        self.cache_entries = cache_entries
+        # Same matcher as triage, over SYMPTOM_TERMS
+        self.symptoms = TriageEngine({language: {URGENT: terms} for language, terms in SYMPTOM_TERMS.items()})
+
+        # (content hash, role, compact) -> (rendered line, tokens); shared by all sessions
+        self._renderings: "OrderedDict[Tuple[str, str, bool], Tuple[str, int]]" = OrderedDict()
+
+    def render_message(self, msg: Dict, compact: bool = False) -> Tuple[str, int]:
+        """Render one history message as a prompt line, with its token count"""
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        # Older model answers are compacted; patient messages are always kept whole
+        compact = compact and role in ("assistant", "model")
+        key = (hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest(), role, compact)
+
+        cached = self._renderings.get(key)
+        if cached is not None:
+            self._renderings.move_to_end(key)
+            return cached
+
+        if compact:
+            content = truncate_tokens(content, self.answer_tokens)
+        line = f"\n{role.capitalize()}: {content}"
+        rendered = (line, estimate_tokens(line))
+
+        self._renderings[key] = rendered
+        if len(self._renderings) > self.cache_entries:
+            self._renderings.popitem(last=False)
+        return rendered
+
+    def fold(self, summary: Dict[str, List[str]], msg: Dict, language: str = "en"):
+        """Fold a message that left the prompt into the rolling summary"""
+        content = msg.get("content", "").strip()
+        if not content:
+            return
+
+        if msg.get("role", "user") == "user":
+            found = self.symptoms.scan(content, language).matches
+            if self.triage is not None:
+                found = self.triage.scan(content, language).matches + found
+            _add_unique(summary["symptoms"], _outermost(found))
+            _add_unique(summary["durations"], [m.group(0).strip() for m in _DURATION_PATTERN.finditer(content)])
+            _add_unique(summary["severity"], [m.group(0).strip() for m in _SEVERITY_PATTERN.finditer(content)])
+            summary["statements"].append(content[:SUMMARY_ENTRY_CHARS])
+        else:
+            # Keep the gist of what was already advised so it is not repeated
+            first_line = next((line.strip() for line in content.splitlines() if line.strip()), "")
+            first_sentence = _SENTENCE_END.split(first_line, maxsplit=1)[0]
+            _add_unique(summary["advice"], [first_sentence[:SUMMARY_ADVICE_CHARS]])
+            del summary["advice"][:-SUMMARY_ADVICE_ENTRIES]
+
+        # Statements go first when the summary outgrows its budget; facts stay
+        while summary["statements"] and estimate_tokens(self.render_summary(summary)) > self.summary_tokens:
+            summary["statements"].pop(0)
+
+    @staticmethod
+    def render_summary(summary: Dict[str, List[str]]) -> str:
+        if not summary:
+            return ""
+        lines = []
+        if summary.get("symptoms"):
+            lines.append(f"- Symptoms mentioned: {', '.join(summary['symptoms'])}")
+        if summary.get("durations"):
+            lines.append(f"- Duration: {', '.join(summary['durations'])}")
+        if summary.get("severity"):
+            lines.append(f"- Severity: {', '.join(summary['severity'])}")
+        lines.extend(f"- Patient said: {statement}" for statement in summary.get("statements", []))
+        lines.extend(f"- Already advised: {advice}" for advice in summary.get("advice", []))
+        return "\n".join(lines)
+
+    def fit_history(self, session) -> Tuple[str, List[str]]:
+        """
+        Fit the session history into the token budget
+
+        Messages that do not fit are folded into session.summary (and
+        session.summarized_count advances), so each message is summarized
+        once and later turns start from the folded state.
+
+        Returns:
+            The rendered summary and the rendered history lines
+        """
+        messages = session.context_messages()
+        last_answer = max(
+            (i for i, msg in enumerate(messages) if msg.get("role") in ("assistant", "model")),
+            default=-1
+        )
+        # Only the latest model answer is sent verbatim
+        rendered = [self.render_message(msg, compact=i != last_answer) for i, msg in enumerate(messages)]
+
+        summary_text = self.render_summary(session.summary)
+        total = estimate_tokens(summary_text) + sum(tokens for _, tokens in rendered)
+
+        folded = 0
+        while total > self.history_tokens and len(rendered) - folded > self.min_recent_messages:
+            total -= rendered[folded][1]
+            self.fold(session.summary, messages[folded], session.language)
+            folded += 1
+
+        if folded:
+            session.summarized_count += folded
+            summary_text = self.render_summary(session.summary)
+            logger.info(f"Folded {folded} messages of {session.conversation_id} into the summary")
+
+        return summary_text, [line for line, _ in rendered[folded:]]
+
+
+def create_prompt_builder(triage=None) -> PromptBuilder:
+    """Build the prompt builder from the environment"""
+    return PromptBuilder(
+        triage=triage,
+        history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", 1500)),
+        summary_tokens=int(os.getenv("PROMPT_SUMMARY_TOKENS", 300)),
+        answer_tokens=int(os.getenv("PROMPT_ANSWER_TOKENS", 150)),
+        min_recent_messages=int(os.getenv("PROMPT_MIN_RECENT_MESSAGES", 2))
+    )
@@ -0,0 +1,234 @@
+"""
+Service Registry - Shared Service Lifecycle
+Builds the AI service clients once per process and closes them on shutdown
+"""
+
+import os
+import asyncio
+import logging
+from typing import List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    def __init__(self):
+        """Initialize an empty registry (services are built in startup)"""
+        self.gemini = None
+        self.elevenlabs = None
+        self.speech = None
+        self.batch = None
+        self.triage = None
+        self.sessions = None
+        self.tts_cache = None
+        self.audio_store = None
+        self.pipeline = None
+        self.emergency = None
+        self.greetings = None
+        self.reports = None
+        self.single_flight = None
+        self.idempotency = None
+        self.profiler = None
+        self.admission = None
+        self.transcoder = None
+        self.resilience = None
+        self._warmup_tasks: List[asyncio.Task] = []
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """Build the pooled keep-alive HTTP client shared by upstream SDKs"""
+        max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 20))
+        keepalive_expiry = float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", 30))
+
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+
+    async def startup(self):
+        """
+        Build every service once
+
+        A service whose API key is missing is left as None so the rest of
+        the application can still start; the matching dependency reports it.
+        """
+        from .gemini_service import GeminiService
+        from .elevenlabs_service import ElevenLabsService
+        from .speech_service import SpeechService, LANGUAGE_CODES
+        from .stt_engines import create_stt_engine
+        from .batch_transcription import create_batch_transcriber
+        from .session_store import create_session_store, InMemorySessionStore
+        from .tts_cache import create_tts_cache
+        from .audio_store import create_audio_store
+        from .pipeline import TurnPipeline
+        from .triage import TriageEngine
+        from .emergency import EmergencyResponder
+        from .response_cache import create_response_cache
+        from .greetings import create_greeting_store
+        from .reports import create_report_jobs
+        from .single_flight import SingleFlight, create_idempotency_store
+        from .metrics import REGISTRY
+        from .profiler import create_profiler
+        from .admission import create_admission
+        from .audio_codecs import create_audio_transcoder
+        from .resilience import create_resilience
+
+        # Compiled once, shared by every request
+        self.triage = TriageEngine()
+        # One coalescing layer for both upstreams, so its stats cover all calls
+        self.single_flight = SingleFlight()
+        self.idempotency = create_idempotency_store()
+        # Per-upstream concurrency/rate limits with priority queues
+        self.admission = create_admission()
+        # Deadlines, retries, hedging and circuit breakers, over the limiters
+        self.resilience = create_resilience(self.admission)
+
+        try:
+            self.gemini = GeminiService(
+                triage=self.triage,
+                response_cache=create_response_cache(),
+                single_flight=self.single_flight,
+                resilience=self.resilience.policy("gemini")
+            )
+        except ValueError as e:
+            logger.warning(f"Gemini service not available: {str(e)}")
+
+        self._http_client = self._build_http_client()
+        self.tts_cache = create_tts_cache()
+        self.audio_store = create_audio_store()
+        # Worker pool for output formats ElevenLabs cannot produce (Opus)
+        self.transcoder = create_audio_transcoder()
+        try:
+            self.elevenlabs = ElevenLabsService(
+                http_client=self._http_client,
+                cache=self.tts_cache,
+                audio_store=self.audio_store,
+                single_flight=self.single_flight,
+                transcoder=self.transcoder,
+                resilience=self.resilience.policy("elevenlabs")
+            )
+        except ValueError as e:
+            logger.warning(f"ElevenLabs service not available: {str(e)}")
+
+        try:
+            short_codes = {code: language for language, code in LANGUAGE_CODES.items()}
+            self.speech = SpeechService(create_stt_engine(short_codes), resilience=self.resilience.policy("stt"))
+            self.batch = create_batch_transcriber(self.speech)
+        except ValueError as e:
+            logger.warning(f"Speech-to-text not available: {str(e)}")
+
+        try:
+            self.sessions = create_session_store()
+        except ValueError as e:
+            logger.warning(f"Session store not available, keeping sessions in memory: {str(e)}")
+            self.sessions = InMemorySessionStore()
+        self.greetings = create_greeting_store(self.elevenlabs, self.audio_store)
+
+        if self.gemini is not None:
+            self.reports = create_report_jobs(self.gemini, self.sessions)
+            self.reports.start()
+            self.pipeline = TurnPipeline(
+                self.gemini,
+                self.elevenlabs,
+                self.audio_store,
+                self.sessions,
+                greetings=self.greetings,
+                reports=self.reports
+            )
+
+        self.emergency = EmergencyResponder(self.triage, self.elevenlabs, self.audio_store)
+        # Synthesize the emergency instructions and greetings without holding
+        # up startup (with the disk cache tier this is a cache read after the
+        # first boot); until then first turns go to Gemini as before
+        self._warmup_tasks = [
+            asyncio.create_task(self.emergency.warm_up()),
+            asyncio.create_task(self.greetings.warm_up())
+        ]
+
+        self.profiler = create_profiler()
+        REGISTRY.add_collector(self._collect_metrics)
+
+        logger.info("Service registry started")
+
+    def _collect_metrics(self):
+        """Cache, queue and coalescing stats as metric families (read at scrape time)"""
+        from .metrics import stats_families
+
+        families = []
+        if self.tts_cache is not None:
+            families += stats_families("medivoice_tts_cache", self.tts_cache.stats(), counters=("hits_memory", "hits_disk", "misses"))
+        if self.gemini is not None and self.gemini.response_cache is not None:
+            families += stats_families(
+                "medivoice_gemini_cache",
+                self.gemini.response_cache.stats(),
+                counters=("hits_exact", "hits_similar", "misses", "stores")
+            )
+        if self.audio_store is not None:
+            families += stats_families("medivoice_audio_store", self.audio_store.stats())
+        if self.single_flight is not None:
+            families += stats_families("medivoice_single_flight", self.single_flight.stats(), counters=("calls", "coalesced", "abandoned"))
+        if self.reports is not None:
+            families += stats_families("medivoice_reports", self.reports.stats(), counters=("generated", "reused", "session_updates"))
+        if self.admission is not None:
+            families += self.admission.metric_families()
+        if self.resilience is not None:
+            families += self.resilience.metric_families()
+        return families
+
+    async def shutdown(self):
+        """Release pooled connections held by the services"""
+        from .metrics import REGISTRY
+
+        REGISTRY.remove_collector(self._collect_metrics)
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+        for task in self._warmup_tasks:
+            task.cancel()
+        await asyncio.gather(*self._warmup_tasks, return_exceptions=True)
+        self._warmup_tasks = []
+
+        if self.emergency is not None:
+            await self.emergency.close()
+            self.emergency = None
+
+        if self.reports is not None:
+            await self.reports.close()
+            self.reports = None
+
+        if self.pipeline is not None:
+            await self.pipeline.close()
+            self.pipeline = None
+
+        if self.sessions is not None:
+            await self.sessions.close()
+            self.sessions = None
+
+        if self.batch is not None:
+            self.batch.close()
+            self.batch = None
+
+        if self.speech is not None:
+            self.speech.close()
+
+        if self.transcoder is not None:
+            self.transcoder.close()
+            self.transcoder = None
+
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+        self.gemini = None
+        self.elevenlabs = None
+        self.speech = None
+        self.greetings = None
+
+        logger.info("Service registry stopped")
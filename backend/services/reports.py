@@ -0,0 +1,445 @@
+"""
+Reports - Consultation Report Jobs
+Runs report generations on a bounded worker pool, parses the model output
+into a ConsultationReport and reuses results for identical transcripts.
+Server-side sessions keep a report that is brought up to date in the
+background after every assistant turn, from the new messages only.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from pydantic import BaseModel, field_validator
+
+from .admission import BACKGROUND, AdmissionRejected, set_task_priority
+
+logger = logging.getLogger(__name__)
+
+REPORT_PROMPT = """
+Analyze this medical consultation transcript and generate a structured summary report.
+
+TRANSCRIPT:
+{transcript}
+
+OUTPUT IN JSON FORMAT ONLY:
+{{
+    "patient_symptoms": "Summary of symptoms reported",
+    "diagnosis": "Likely diagnosis provided",
+    "medications": ["List of medications prescribed"],
+    "lifestyle_advice": "Diet and lifestyle recommendations given",
+    "precautions": "Safety warnings and precautions mentioned",
+    "follow_up": "When to seek further care"
+}}
+"""
+
+REPORT_UPDATE_PROMPT = """
+You maintain the structured summary report of an ongoing medical consultation.
+
+CURRENT REPORT:
+{report}
+
+NEW MESSAGES:
+{transcript}
+
+Update the report with the new messages. Keep what is still true, add new
+symptoms, medications and advice, and correct anything the new messages
+contradict.
+
+OUTPUT THE COMPLETE UPDATED REPORT IN THE SAME JSON FORMAT ONLY.
+"""
+
+
+class ReportParseError(ValueError):
+    """The model output could not be read as a report"""
+
+
+class ReportQueueFull(Exception):
+    """Too many report generations are waiting"""
+
+
+class ConsultationReport(BaseModel):
+    patient_symptoms: str = ""
+    diagnosis: str = ""
+    medications: List[str] = []
+    lifestyle_advice: str = ""
+    precautions: str = ""
+    follow_up: str = ""
+
+    @field_validator("patient_symptoms", "diagnosis", "lifestyle_advice", "precautions", "follow_up", mode="before")
+    @classmethod
+    def _join_lists(cls, value):
+        # The model sometimes answers a text field with a list of points
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return " ".join(str(item) for item in value)
+        return value
+
+    @field_validator("medications", mode="before")
+    @classmethod
+    def _split_medications(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return value
+
+
+def format_transcript(conversation_history: List[Dict]) -> str:
+    """Render a conversation history as the transcript the report prompt uses"""
+    return "\n".join(f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}" for msg in conversation_history)
+
+
+def parse_report(text: str) -> ConsultationReport:
+    """Parse model output (possibly wrapped in prose or a code fence) into a report"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ReportParseError("No JSON object in the model output")
+    try:
+        return ConsultationReport.model_validate(json.loads(text[start:end + 1]))
+    except ValueError as e:
+        raise ReportParseError(f"Invalid report JSON: {str(e)}") from e
+
+
+class ReportJob:
+    """One report generation and its result"""
+
+    def __init__(self, key: str, transcript: Optional[str] = None, conversation_id: Optional[str] = None):
+        self.job_id = str(uuid.uuid4())
+        # Transcript hash, or conversation and turn for a session's report
+        self.key = key
+        self.transcript = transcript
+        self.conversation_id = conversation_id
+        self.status = "queued"
+        self.report: Optional[ConsultationReport] = None
+        self.error: Optional[str] = None
+        # Set when the job was shed by admission control: seconds to wait before retrying
+        self.retry_after: Optional[int] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Replaced on every status change; watchers wait on the one they saw
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _set_status(self, status: str):
+        self.status = status
+        if self.finished:
+            self.finished_at = time.time()
+            # Not needed once the report exists
+            self.transcript = None
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "report": self.report.model_dump() if self.report is not None else None,
+            "error": self.error,
+            "retry_after": self.retry_after,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class ReportJobManager:
+    def __init__(
+        self,
+        gemini_service,
+        session_store=None,
+        workers: int = 2,
+        max_queue: int = 100,
+        max_jobs: int = 1000,
+        ttl_seconds: float = 3600
+    ):
+        """
+        Initialize the job manager
+
+        Args:
+            gemini_service: Generates the reports
+            session_store: Enables the incremental per-session reports
+            workers: Reports generated concurrently (and, separately, session updates)
+            max_queue: Jobs allowed to wait for a worker before submit fails
+            max_jobs: Jobs (and cached reports) kept for lookup
+            ttl_seconds: How long a finished report is kept and reused
+        """
+        self.gemini_service = gemini_service
+        self.session_store = session_store
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+        # Job key -> job of the latest queued, running or done generation
+        self._by_key: Dict[str, str] = {}
+        self._workers: List[asyncio.Task] = []
+
+        # Conversation id -> running session update; ids with turns added since it started
+        self._updates: Dict[str, asyncio.Task] = {}
+        self._dirty: Set[str] = set()
+        self._update_slots = asyncio.Semaphore(workers)
+        # Conversation id -> why its last update was shed by admission control
+        self._rejections: Dict[str, AdmissionRejected] = {}
+
+        self.reused = 0
+        self.generated = 0
+        self.updated = 0
+
+    def start(self):
+        """Start the worker tasks"""
+        for _ in range(self.workers - len(self._workers)):
+            self._workers.append(asyncio.create_task(self._work()))
+
+    def submit(self, conversation_history: List[Dict]) -> ReportJob:
+        """
+        Queue a report for a transcript
+
+        A transcript that already has a queued, running or finished (and
+        unexpired) job gets that job back instead of a new generation.
+        """
+        transcript = format_transcript(conversation_history)
+        key = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+        return self._submit(key, transcript=transcript)
+
+    def submit_session(self, session) -> ReportJob:
+        """
+        Report for a server-side session
+
+        When the session's report already covers the whole history the job
+        is finished on return; otherwise it waits for the background update,
+        which only sends the messages added since the last one.
+        """
+        if self.session_store is None:
+            return self.submit(session.history)
+        if session.report is not None and session.reported_count >= len(session.history):
+            self._expire()
+            job = ReportJob(f"{session.conversation_id}:{len(session.history)}", conversation_id=session.conversation_id)
+            job.report = ConsultationReport.model_validate(session.report)
+            job._set_status("done")
+            self._register(job)
+            return job
+
+        key = f"{session.conversation_id}:{len(session.history)}:{session.updated_at}"
+        return self._submit(key, conversation_id=session.conversation_id)
+
+    def _submit(self, key: str, transcript: Optional[str] = None, conversation_id: Optional[str] = None) -> ReportJob:
+        self._expire()
+        job_id = self._by_key.get(key)
+        if job_id is not None and job_id in self._jobs:
+            self.reused += 1
+            self._jobs.move_to_end(job_id)
+            return self._jobs[job_id]
+
+        job = ReportJob(key, transcript=transcript, conversation_id=conversation_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise ReportQueueFull("Too many reports are being generated, try again later")
+
+        self._register(job)
+        self._by_key[key] = job.job_id
+        return job
+
+    def _register(self, job: ReportJob):
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._remove(next(iter(self._jobs)))
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: ReportJob) -> ReportJob:
+        """Wait until the job has finished"""
+        while not job.finished:
+            await job._changed.wait()
+        return job
+
+    async def watch(self, job: ReportJob) -> AsyncIterator[Dict]:
+        """Yield the job's state now and after every status change, until it finishes"""
+        while True:
+            changed = job._changed
+            yield job.to_dict()
+            if job.finished:
+                return
+            await changed.wait()
+
+    async def _work(self):
+        # Reports queue behind conversation turns for Gemini
+        set_task_priority(BACKGROUND)
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ReportJob):
+        job._set_status("running")
+        try:
+            if job.conversation_id is not None:
+                job.report = await self._session_report(job.conversation_id)
+            else:
+                job.report = await self.gemini_service.generate_consultation_report(transcript=job.transcript)
+                self.generated += 1
+            job._set_status("done")
+        except asyncio.CancelledError:
+            job.error = "Report generation was cancelled"
+            job._set_status("failed")
+            raise
+        except AdmissionRejected as e:
+            logger.warning(f"Report job {job.job_id} was shed: {str(e)}")
+            job.error = str(e)
+            job.retry_after = e.retry_after
+            job._set_status("failed")
+        except Exception as e:
+            logger.error(f"Report job {job.job_id} failed: {str(e)}")
+            job.error = "Failed to generate report"
+            job._set_status("failed")
+
+        if job.status == "failed" and self._by_key.get(job.key) == job.job_id:
+            # A later request for the same transcript should try again
+            del self._by_key[job.key]
+
+    async def _session_report(self, conversation_id: str) -> ConsultationReport:
+        # Shielded: the update belongs to the session, not to this job
+        await asyncio.shield(self.schedule_update(conversation_id))
+        session = await self.session_store.get(conversation_id)
+        if session is None:
+            raise LookupError(f"Session {conversation_id} has expired")
+        if session.report is None or session.reported_count < len(session.history):
+            rejection = self._rejections.pop(conversation_id, None)
+            if rejection is not None:
+                raise rejection
+            raise RuntimeError(f"Report of {conversation_id} could not be brought up to date")
+        return ConsultationReport.model_validate(session.report)
+
+    def schedule_update(self, conversation_id: str) -> Optional[asyncio.Task]:
+        """
+        Bring a session's report up to date in the background
+
+        Called after each assistant turn. Turns that arrive while an update
+        for the conversation is running are folded into one more pass.
+        """
+        if self.session_store is None:
+            return None
+        task = self._updates.get(conversation_id)
+        if task is not None and not task.done():
+            self._dirty.add(conversation_id)
+            return task
+
+        task = asyncio.create_task(self._run_updates(conversation_id))
+        self._updates[conversation_id] = task
+        task.add_done_callback(lambda _: self._on_update_done(conversation_id, task))
+        return task
+
+    def _on_update_done(self, conversation_id: str, task: asyncio.Task):
+        if self._updates.get(conversation_id) is task:
+            del self._updates[conversation_id]
+
+    async def _run_updates(self, conversation_id: str):
+        set_task_priority(BACKGROUND)
+        while True:
+            self._dirty.discard(conversation_id)
+            try:
+                async with self._update_slots:
+                    await self._update_session(conversation_id)
+                self._rejections.pop(conversation_id, None)
+            except AdmissionRejected as e:
+                # Kept so a report job waiting on this update can pass the retry hint on
+                self._rejections[conversation_id] = e
+                while len(self._rejections) > self.max_jobs:
+                    self._rejections.pop(next(iter(self._rejections)))
+                logger.warning(f"Report update for {conversation_id} was shed: {str(e)}")
+            except Exception as e:
+                # The next update retries with the larger delta
+                logger.error(f"Report update for {conversation_id} failed: {str(e)}")
+            if conversation_id not in self._dirty:
+                return
+
+    async def _update_session(self, conversation_id: str):
+        session = await self.session_store.get(conversation_id)
+        if session is None:
+            return
+        start = session.reported_count
+        delta = session.history[start:]
+        # Position of the end of the delta that does not move when history is trimmed
+        end = session.trimmed_count + start + len(delta)
+        if not delta:
+            return
+
+        transcript = format_transcript(delta)
+        if session.report is None:
+            report = await self.gemini_service.generate_consultation_report(transcript=transcript)
+        else:
+            report = await self.gemini_service.update_consultation_report(
+                ConsultationReport.model_validate(session.report),
+                transcript
+            )
+
+        # Re-read: turns may have been recorded (and old ones dropped) meanwhile
+        async with self.session_store.lock(conversation_id):
+            session = await self.session_store.get(conversation_id)
+            if session is None:
+                return
+            session.report = report.model_dump()
+            session.reported_count = max(0, min(len(session.history), end - session.trimmed_count))
+            await self.session_store.save(session)
+        self.updated += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            self._remove(job_id)
+
+    def _remove(self, job_id: str):
+        job = self._jobs.pop(job_id, None)
+        if job is not None and self._by_key.get(job.key) == job_id:
+            del self._by_key[job.key]
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "jobs": len(self._jobs),
+            "generated": self.generated,
+            "reused": self.reused,
+            "session_updates": self.updated,
+            "updating": len(self._updates)
+        }
+
+    async def close(self):
+        """Stop the workers and session updates (queued and running jobs fail)"""
+        tasks = self._workers + list(self._updates.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._updates.clear()
+
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.error = "Report generation was cancelled"
+            job._set_status("failed")
+
+
+def create_report_jobs(gemini_service, session_store=None) -> ReportJobManager:
+    """Build the report job manager from the environment"""
+    incremental = os.getenv("REPORT_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+    return ReportJobManager(
+        gemini_service,
+        session_store=session_store if incremental else None,
+        workers=int(os.getenv("REPORT_WORKERS", 2)),
+        max_queue=int(os.getenv("REPORT_QUEUE_SIZE", 100)),
+        ttl_seconds=float(os.getenv("REPORT_CACHE_TTL_SECONDS", 3600))
+    )
@@ -0,0 +1,421 @@
+"""
+Resilience - Deadlines, Retries, Hedging and Circuit Breakers
+One policy per upstream (Gemini, ElevenLabs, speech-to-text) around every
+call: a deadline per attempt, jittered retries of transient failures, an
+optional hedged second attempt once the first is slower than the p95, and a
+breaker that fails fast while the upstream is unhealthy
+"""
+
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from .admission import AdmissionRejected, UpstreamLimiter, admit
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth another attempt (google.api_core errors carry them as .code)
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Successful calls needed before their p95 is trusted as the hedge delay
+HEDGE_MIN_SAMPLES = 20
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Marks "use the policy's timeout" (None means no deadline)
+_DEFAULT = object()
+# First item of a stream that ended without producing any
+_EMPTY = object()
+
+# Cleanup of hedged attempts that finished after losing
+_cleanup_tasks: Set[asyncio.Task] = set()
+
+
+class CircuitOpen(AdmissionRejected):
+    """Call refused without trying while the upstream's breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(upstream, "circuit open", 503, retry_after)
+        self.args = (f"{upstream} is unavailable (circuit open), retry in {retry_after}s",)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient upstream failure: a timeout, a connection error, or a 429/5xx"""
+    if isinstance(error, AdmissionRejected):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    return isinstance(status, int) and status in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker (closed)
+
+        Args:
+            name: Upstream name used in errors and logs
+            failure_threshold: Consecutive transient failures that open it
+            reset_timeout: Seconds it stays open before one probe call is let
+                through (half open); the probe's outcome closes or reopens it
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._opened_at + self.reset_timeout - time.monotonic()))
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go to the upstream now"""
+        if self.state == OPEN:
+            if time.monotonic() < self._opened_at + self.reset_timeout:
+                raise CircuitOpen(self.name, self._retry_after())
+            self.state = HALF_OPEN
+            logger.info(f"{self.name} circuit half open, probing")
+        if self.state == HALF_OPEN:
+            if self._probing:
+                raise CircuitOpen(self.name, 1)
+            self._probing = True
+
+    def record_success(self):
+        """The upstream answered (an error that is not transient counts too)"""
+        self.failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            self.state = CLOSED
+            logger.info(f"{self.name} circuit closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            logger.warning(f"{self.name} circuit open for {self.reset_timeout}s after {self.failures} failures")
+
+    def release(self):
+        """The call ended without telling anything about the upstream (cancelled, shed)"""
+        self._probing = False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "retry_after": self._retry_after() if self.state == OPEN else 0
+        }
+
+
+async def _aclose(iterator):
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception as e:
+            logger.debug(f"Error closing upstream stream: {str(e)}")
+
+
+def _discard_loser(discard, task: asyncio.Task):
+    # A losing hedged attempt that still succeeded may hold resources (an open stream)
+    if task.cancelled() or task.exception() is not None or discard is None:
+        return
+    cleanup = asyncio.ensure_future(discard(task.result()))
+    _cleanup_tasks.add(cleanup)
+    cleanup.add_done_callback(_cleanup_tasks.discard)
+
+
+class UpstreamPolicy:
+    def __init__(
+        self,
+        name: str,
+        timeout: Optional[float] = 30.0,
+        retries: int = 0,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        hedge: bool = False,
+        hedge_ratio: float = 0.1,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[UpstreamLimiter] = None
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            name: Upstream name used in errors, logs and metrics
+            timeout: Deadline of one attempt, counted from admission (None: no deadline)
+            retries: Extra attempts after a transient failure
+            backoff_base: First backoff ceiling in seconds; it doubles per retry
+                and the actual sleep is uniformly random below it (full jitter)
+            backoff_max: Largest backoff ceiling
+            hedge: Start a second attempt when the first is slower than the
+                p95 of recent calls; the first result wins, the other is cancelled
+            hedge_ratio: Most hedges as a share of calls, so hedging cannot
+                double the load during an incident
+            breaker: Circuit breaker (a default one is built if omitted)
+            limiter: Admission control every attempt goes through
+        """
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self.breaker = breaker or CircuitBreaker(name)
+        self.limiter = limiter
+
+        # Duration of recent successful calls, for the hedge delay
+        self._latencies: deque = deque(maxlen=200)
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _backoff(self, retry: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def p95(self) -> Optional[float]:
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _may_hedge(self) -> bool:
+        if self.hedged >= self.hedge_ratio * self.calls:
+            return False
+        # Never queue a hedge behind other callers' first attempts
+        return self.limiter is None or self.limiter.has_capacity()
+
+    async def call(self, factory: Callable[[], Awaitable], timeout=_DEFAULT, retries: Optional[int] = None):
+        """
+        Await factory() under the policy
+
+        factory is called once per attempt. Raises CircuitOpen when the
+        breaker is open, AdmissionRejected when admission control sheds the
+        call, and otherwise the last attempt's error.
+        """
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+
+        async def attempt():
+            async with admit(self.limiter):
+                async with asyncio.timeout(timeout):
+                    return await factory()
+
+        return await self._run(attempt, retries)
+
+    async def stream(self, factory: Callable[[], AsyncIterator], timeout=_DEFAULT, retries: Optional[int] = None) -> AsyncIterator:
+        """
+        Iterate factory() under the policy
+
+        The deadline covers the first item and every gap between items. An
+        attempt that fails before its first item is retried (or hedged); one
+        that fails later is not, since part of its output was passed on.
+        The admission slot is held until the stream is closed.
+        """
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+
+        async def attempt():
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            started = time.monotonic()
+            iterator = None
+            try:
+                iterator = factory().__aiter__()
+                async with asyncio.timeout(timeout):
+                    first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = _EMPTY
+            except BaseException:
+                await self._close((None, iterator, started))
+                raise
+            return (first, iterator, started)
+
+        opened = await self._run(attempt, retries, discard=self._close)
+        first, iterator, _ = opened
+        try:
+            if first is _EMPTY:
+                return
+            yield first
+            while True:
+                try:
+                    async with asyncio.timeout(timeout):
+                        item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                yield item
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            await self._close(opened)
+
+    async def _close(self, opened: Tuple):
+        _, iterator, started = opened
+        await _aclose(iterator)
+        if self.limiter is not None:
+            self.limiter.release(time.monotonic() - started)
+
+    async def _run(self, attempt: Callable[[], Awaitable], retries: Optional[int], discard=None):
+        retries = self.retries if retries is None else retries
+        self.calls += 1
+        for retry in range(retries + 1):
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = await self._hedged(attempt, discard)
+            except AdmissionRejected:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if retry == retries or self.breaker.state == OPEN:
+                    raise
+                delay = self._backoff(retry)
+                logger.warning(
+                    f"{self.name} call failed ({type(e).__name__}), "
+                    f"retry {retry + 1}/{retries} in {delay * 1000:.0f} ms"
+                )
+                self.retried += 1
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                self._latencies.append(time.monotonic() - started)
+                return result
+
+    async def _hedged(self, attempt: Callable[[], Awaitable], discard):
+        delay = self.p95() if self.hedge and self.breaker.state == CLOSED else None
+        if delay is None:
+            return await attempt()
+
+        tasks: List[asyncio.Task] = [asyncio.ensure_future(attempt())]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._may_hedge():
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(partial(_discard_loser, discard))
+
+    def stats(self) -> Dict:
+        p95 = self.p95()
+        return {
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "hedge": self.hedge,
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "breaker": self.breaker.stats()
+        }
+
+
+class ResilienceController:
+    """The policies of all upstreams"""
+
+    def __init__(self, policies: Dict[str, UpstreamPolicy]):
+        self.policies = policies
+
+    def policy(self, name: str) -> Optional[UpstreamPolicy]:
+        return self.policies.get(name)
+
+    def breakers(self) -> Dict:
+        return {name: policy.breaker.stats() for name, policy in self.policies.items()}
+
+    def stats(self) -> Dict:
+        return {name: policy.stats() for name, policy in self.policies.items()}
+
+    def metric_families(self) -> List[Tuple]:
+        """Breaker states and retry/hedge counters for /metrics"""
+        states, opened, retried, hedged = [], [], [], []
+        for name, policy in self.policies.items():
+            for state in (CLOSED, OPEN, HALF_OPEN):
+                states.append(({"upstream": name, "state": state}, int(policy.breaker.state == state)))
+            opened.append(({"upstream": name}, policy.breaker.opened))
+            retried.append(({"upstream": name}, policy.retried))
+            hedged.append(({"upstream": name}, policy.hedged))
+        return [
+            ("medivoice_circuit_state", "gauge", "Circuit breaker state per upstream (1 = current)", states),
+            ("medivoice_circuit_opened_total", "counter", "Times the circuit breaker opened", opened),
+            ("medivoice_upstream_retries_total", "counter", "Upstream attempts retried after a transient failure", retried),
+            ("medivoice_upstream_hedges_total", "counter", "Hedged second attempts started", hedged)
+        ]
+
+
+def _policy_from_env(
+    name: str,
+    prefix: str,
+    limiter: Optional[UpstreamLimiter],
+    timeout: float,
+    retries: int
+) -> UpstreamPolicy:
+    return UpstreamPolicy(
+        name,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", timeout)),
+        retries=int(os.getenv(f"{prefix}_RETRIES", retries)),
+        backoff_base=float(os.getenv("RETRY_BACKOFF_MS", 200)) / 1000,
+        backoff_max=float(os.getenv("RETRY_BACKOFF_MAX_MS", 2000)) / 1000,
+        hedge=os.getenv(f"{prefix}_HEDGE", "false").lower() in ("1", "true", "yes"),
+        hedge_ratio=float(os.getenv("HEDGE_MAX_RATIO", 0.1)),
+        breaker=CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", 30))
+        ),
+        limiter=limiter
+    )
+
+
+def create_resilience(admission=None) -> ResilienceController:
+    """Build the per-upstream policies from the environment, over the admission limiters"""
+    def limiter(name: str) -> Optional[UpstreamLimiter]:
+        return admission.limiter(name) if admission is not None else None
+
+    return ResilienceController({
+        "gemini": _policy_from_env("gemini", "GEMINI", limiter("gemini"), timeout=30, retries=1),
+        "elevenlabs": _policy_from_env("elevenlabs", "ELEVENLABS", limiter("elevenlabs"), timeout=20, retries=2),
+        # Local engine: failures are rarely transient, so no retries by default
+        "stt": _policy_from_env("stt", "STT", limiter("stt"), timeout=30, retries=0)
+    })
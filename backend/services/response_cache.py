@@ -0,0 +1,202 @@
+"""
+Response Cache - Reuse of Gemini Answers for Repetitive Turns
+Exact-match tier plus a character n-gram similarity tier for near-duplicate
+messages, scoped to an identical conversation context
+"""
+
+import os
+import re
+import math
+import time
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .triage import CHAR_LANGUAGES, NEGATION_CUES
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+# Tokens that must match exactly for a near-duplicate hit: numbers ("2 pills"
+# vs "20 pills", "2 years old" vs "12") and negation cues ("fever" vs "no fever")
+_GUARD_PATTERN = re.compile(
+    r"\d+(?:[.,]\d+)?"
+    + "".join(
+        f"|{re.escape(cue)}" if language in CHAR_LANGUAGES else f"|(?<!\\w){re.escape(cue)}(?!\\w)"
+        for language, sides in NEGATION_CUES.items()
+        for cues in sides.values()
+        for cue in sorted(cues, key=len, reverse=True)
+    )
+)
+
+# Prompt states whose answers may be reused for a similar (not identical) message
+SIMILAR_STATES = ("greeting",)
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace"""
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+def make_context_key(state: str, language: str, history: List[Dict]) -> str:
+    """Identity of everything in the prompt except the new message ("<state>:<digest>")"""
+    material = "\x1e".join(
+        [state, language] + [f"{msg.get('role', 'user')}\x1f{normalize_text(msg.get('content', ''))}" for msg in history]
+    )
+    return f"{state}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+
+def guard_tokens(text: str) -> Tuple[str, ...]:
+    """Numbers and negation cues of a message, in order"""
+    return tuple(_GUARD_PATTERN.findall(text.casefold()))
+
+
+def _ngrams(text: str, n: int) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+
+class _Entry:
+    def __init__(self, context_key: str, text: str, vector: Counter, guards: Tuple[str, ...], ttl_seconds: float):
+        self.context_key = context_key
+        self.text = text
+        self.vector = vector
+        self.guards = guards
+        self.norm = math.sqrt(sum(count * count for count in vector.values()))
+        self.expires_at = time.time() + ttl_seconds
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        similarity: float = 0.9,
+        ngram: int = 3,
+        similar_states: Tuple[str, ...] = SIMILAR_STATES
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: LRU bound on stored answers
+            ttl_seconds: How long an answer may be reused
+            similarity: Cosine similarity of character n-grams needed for a near-duplicate hit (>1 disables the tier)
+            ngram: n-gram size used for similarity
+            similar_states: Prompt states (the prefix of the context key) the
+                similarity tier serves; other contexts only hit exactly
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.ngram = ngram
+        self.similar_states = similar_states
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Context key -> exact keys, so near-duplicates are only searched within the same context
+        self._by_context: Dict[str, Set[str]] = {}
+
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def _exact_key(context_key: str, message: str) -> str:
+        return hashlib.sha256(f"{context_key}\x1e{message}".encode("utf-8")).hexdigest()
+
+    def _similar_tier(self, context_key: str) -> bool:
+        return self.similarity <= 1 and context_key.partition(":")[0] in self.similar_states
+
+    def get(self, context_key: str, user_message: str) -> Optional[str]:
+        """
+        Return a cached answer for this message in this context
+
+        A similar message only hits in the states of similar_states and
+        when its numbers and negations are exactly those of the stored one.
+        """
+        message = normalize_text(user_message)
+        now = time.time()
+
+        key = self._exact_key(context_key, message)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits_exact += 1
+                return entry.text
+            self._remove(key)
+
+        if self._similar_tier(context_key):
+            guards = guard_tokens(user_message)
+            vector = _ngrams(message, self.ngram)
+            norm = math.sqrt(sum(count * count for count in vector.values()))
+            best_key, best_score = None, 0.0
+            for candidate_key in list(self._by_context.get(context_key, ())):
+                candidate = self._entries[candidate_key]
+                if candidate.expires_at <= now:
+                    self._remove(candidate_key)
+                    continue
+                if candidate.guards != guards:
+                    continue
+                dot = sum(count * candidate.vector.get(gram, 0) for gram, count in vector.items())
+                score = dot / (norm * candidate.norm) if norm and candidate.norm else 0.0
+                if score > best_score:
+                    best_key, best_score = candidate_key, score
+
+            if best_key is not None and best_score >= self.similarity:
+                self._entries.move_to_end(best_key)
+                self.hits_similar += 1
+                return self._entries[best_key].text
+
+        self.misses += 1
+        return None
+
+    def put(self, context_key: str, user_message: str, text: str):
+        """Store an answer"""
+        message = normalize_text(user_message)
+        key = self._exact_key(context_key, message)
+        self._remove(key)
+
+        vector = _ngrams(message, self.ngram)
+        self._entries[key] = _Entry(context_key, text, vector, guard_tokens(user_message), self.ttl_seconds)
+        self._by_context.setdefault(context_key, set()).add(key)
+        self.stores += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_context.get(entry.context_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[entry.context_key]
+
+    def stats(self) -> Dict:
+        lookups = self.hits_exact + self.hits_similar + self.misses
+        return {
+            "hits_exact": self.hits_exact,
+            "hits_similar": self.hits_similar,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (self.hits_exact + self.hits_similar) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "contexts": len(self._by_context)
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the response cache from the environment (None unless enabled)"""
+    if os.getenv("GEMINI_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return ResponseCache(
+        max_entries=int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", 1000)),
+        ttl_seconds=float(os.getenv("GEMINI_CACHE_TTL_SECONDS", 3600)),
+        similarity=float(os.getenv("GEMINI_CACHE_SIMILARITY", 0.9))
+    )
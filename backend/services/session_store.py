@@ -0,0 +1,359 @@
+"""
+Session Store - Server-Side Consultation State
+Keeps each consultation's history and incremental state keyed by
+conversation_id, so clients only send the new message on every turn
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from .prompt_builder import empty_summary
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the stored transcript per session
+MAX_STORED_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", 200))
+
+# Longest a turn may hold a conversation's lock, and wait for it
+SESSION_LOCK_SECONDS = float(os.getenv("SESSION_LOCK_SECONDS", 120))
+
+
+class SessionState:
+    """Incremental state of one consultation"""
+
+    def __init__(
+        self,
+        conversation_id: str,
+        language: str = "en",
+        history: Optional[List[Dict]] = None,
+        turn_count: int = 0,
+        has_greeted: bool = False,
+        summary: Optional[Dict[str, List[str]]] = None,
+        summarized_count: int = 0,
+        report: Optional[Dict] = None,
+        reported_count: int = 0,
+        trimmed_count: int = 0,
+        updated_at: Optional[float] = None
+    ):
+        self.conversation_id = conversation_id
+        self.language = language
+        self.history = history or []
+        self.turn_count = turn_count
+        self.has_greeted = has_greeted
+        # Rolling summary of messages folded out of the prompt (see prompt_builder.py)
+        self.summary = summary or empty_summary()
+        self.summarized_count = summarized_count
+        # Consultation report covering history[:reported_count] (see reports.py)
+        self.report = report
+        self.reported_count = reported_count
+        # Messages ever dropped from the front of history, so positions taken
+        # before a trim can be mapped onto the trimmed history
+        self.trimmed_count = trimmed_count
+        self.updated_at = updated_at or time.time()
+
+    @classmethod
+    def from_history(
+        cls,
+        conversation_id: str,
+        conversation_history: Optional[List[Dict]],
+        language: str = "en"
+    ) -> "SessionState":
+        """Seed a session from a client-supplied history (first turn or expired session)"""
+        state = cls(conversation_id, language)
+        for msg in conversation_history or []:
+            state._append(msg.get("role", "user"), msg.get("content", ""))
+        return state
+
+    def context_messages(self) -> List[Dict]:
+        """Messages not yet folded into the summary"""
+        return self.history[self.summarized_count:]
+
+    def record_turn(
+        self,
+        user_message: str,
+        assistant_text: Optional[str],
+        max_messages: int = MAX_STORED_MESSAGES
+    ):
+        """Append a completed turn and update the incremental state"""
+        self._append("user", user_message)
+        if assistant_text:
+            self._append("assistant", assistant_text)
+
+        # Keep the stored transcript bounded
+        overflow = len(self.history) - max_messages
+        if overflow > 0:
+            del self.history[:overflow]
+            self.summarized_count = max(0, self.summarized_count - overflow)
+            self.reported_count = max(0, self.reported_count - overflow)
+            self.trimmed_count += overflow
+
+        self.updated_at = time.time()
+
+    def _append(self, role: str, content: str):
+        self.history.append({"role": role, "content": content})
+        if role == "user":
+            self.turn_count += 1
+        elif role in ("assistant", "model"):
+            self.has_greeted = True
+
+    def to_dict(self) -> Dict:
+        return {
+            "conversation_id": self.conversation_id,
+            "language": self.language,
+            "history": self.history,
+            "turn_count": self.turn_count,
+            "has_greeted": self.has_greeted,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count,
+            "report": self.report,
+            "reported_count": self.reported_count,
+            "trimmed_count": self.trimmed_count,
+            "updated_at": self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SessionState":
+        data = dict(data)
+        if isinstance(data.get("summary"), str):
+            # Sessions saved before the structured summary
+            summary = empty_summary()
+            summary["statements"] = [
+                line[len("- Patient said: "):] for line in data["summary"].splitlines()
+                if line.startswith("- Patient said: ")
+            ]
+            data["summary"] = summary
+        return cls(**data)
+
+
+class KeyedLocks:
+    """Process-local asyncio locks created on demand and dropped when unused"""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+class InMemorySessionStore:
+    """Process-local LRU store with a TTL"""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._locks = KeyedLocks()
+
+    def lock(self, conversation_id: str):
+        """
+        Serialize read-modify-write of one conversation
+
+        Hold it from loading the session to saving it, so concurrent turns
+        (a second tab) and report updates never overwrite each other.
+        """
+        return self._locks.lock(conversation_id)
+
+    async def get(self, conversation_id: str) -> Optional[SessionState]:
+        state = self._sessions.get(conversation_id)
+        if state is None:
+            return None
+        if time.time() - state.updated_at > self.ttl_seconds:
+            del self._sessions[conversation_id]
+            return None
+        self._sessions.move_to_end(conversation_id)
+        return state
+
+    async def save(self, state: SessionState):
+        self._sessions[state.conversation_id] = state
+        self._sessions.move_to_end(state.conversation_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, conversation_id: str):
+        self._sessions.pop(conversation_id, None)
+
+    async def close(self):
+        self._sessions.clear()
+
+
+class RedisSessionStore:
+    """
+    Store backed by any Redis-compatible async client
+
+    The client only needs get(key), set(key, value, ex=seconds) and
+    delete(key), e.g. redis.asyncio.Redis or LocalRedis below. Clients with
+    lock() (redis-py) lock conversations across every worker; others only
+    within this process.
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl_seconds: float = 3600,
+        prefix: str = "medivoice:session:",
+        lock_seconds: float = SESSION_LOCK_SECONDS
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.lock_seconds = lock_seconds
+        self._locks = KeyedLocks()
+
+    @asynccontextmanager
+    async def lock(self, conversation_id: str) -> AsyncIterator[None]:
+        """
+        Serialize read-modify-write of one conversation (see InMemorySessionStore.lock)
+
+        The Redis lock is a lease of lock_seconds. If it cannot be acquired
+        in that time (or expires first), the holder proceeds with a warning
+        rather than failing the turn.
+        """
+        if not hasattr(self.client, "lock"):
+            async with self._locks.lock(conversation_id):
+                yield
+            return
+
+        lock = self.client.lock(
+            f"{self.prefix}lock:{conversation_id}",
+            timeout=self.lock_seconds,
+            blocking_timeout=self.lock_seconds
+        )
+        acquired = await lock.acquire()
+        if not acquired:
+            logger.warning(f"Session {conversation_id} is still locked after {self.lock_seconds:g}s, proceeding")
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except Exception as e:
+                    logger.warning(f"Session {conversation_id} lock expired before release: {str(e)}")
+
+    async def get(self, conversation_id: str) -> Optional[SessionState]:
+        raw = await self.client.get(self.prefix + conversation_id)
+        if raw is None:
+            return None
+        return SessionState.from_dict(json.loads(raw))
+
+    async def save(self, state: SessionState):
+        await self.client.set(
+            self.prefix + state.conversation_id,
+            json.dumps(state.to_dict()),
+            ex=int(self.ttl_seconds)
+        )
+
+    async def delete(self, conversation_id: str):
+        await self.client.delete(self.prefix + conversation_id)
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+
+
+class LocalRedis:
+    """Minimal in-process stand-in for a Redis client (local development and tests)"""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.time() > expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None):
+        self._data[key] = (value, time.time() + ex if ex else None)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+
+async def load_or_create_session(
+    store,
+    conversation_id: Optional[str],
+    conversation_history: Optional[List[Dict]] = None,
+    language: str = "en",
+    user_message: Optional[str] = None
+) -> SessionState:
+    """
+    Fetch the session for conversation_id, or start one
+
+    Callers that save the session back hold store.lock(conversation_id)
+    around the load and the save. A new session (or one that expired) is
+    seeded from the client-supplied history so older clients keep working.
+    Clients that include the pending user_message as the last history
+    entry have it dropped, since record_turn appends it once the turn
+    completes.
+    """
+    if conversation_id:
+        state = await store.get(conversation_id)
+        if state is not None:
+            state.language = language
+            return state
+
+    history = list(conversation_history or [])
+    if history and user_message is not None:
+        last = history[-1]
+        if last.get("role", "user") == "user" and last.get("content") == user_message:
+            history.pop()
+
+    return SessionState.from_history(
+        conversation_id or str(uuid.uuid4()),
+        history,
+        language
+    )
+
+
+def create_session_store():
+    """
+    Build the session store from the environment
+
+    SESSION_STORE_URL:
+        (unset)          in-memory LRU store
+        redis://...      Redis (requires the optional `redis` package)
+        local-redis://   in-process Redis stand-in
+    """
+    url = os.getenv("SESSION_STORE_URL", "")
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", 3600))
+
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("SESSION_STORE_URL points to Redis but the `redis` package is not installed")
+        logger.info("Using Redis session store")
+        return RedisSessionStore(redis.from_url(url, decode_responses=True), ttl_seconds)
+
+    if url.startswith("local-redis://"):
+        logger.info("Using local Redis stand-in session store")
+        return RedisSessionStore(LocalRedis(), ttl_seconds)
+
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", 1000))
+    return InMemorySessionStore(max_sessions=max_sessions, ttl_seconds=ttl_seconds)
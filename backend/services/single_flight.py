@@ -0,0 +1,154 @@
+"""
+Single Flight - Coalescing of Identical In-Flight Calls
+Concurrent callers with the same key share one upstream call, and completed
+results can be replayed for requests that carry an idempotency key
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_flight_key(namespace: str, *parts: str) -> str:
+    """Key of an upstream call from its normalized inputs"""
+    digest = hashlib.sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time
+
+    Callers that arrive while a call is in flight await the same task. A
+    caller that is cancelled only stops waiting; the call itself is
+    cancelled when its last waiter goes away, so nobody pays for a result
+    nobody will read.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await factory(), or the identical call already in flight"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so one waiter's cancellation does not reach the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self.abandoned += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def in_flight(self, key: str) -> bool:
+        flight = self._flights.get(key)
+        return flight is not None and not flight.task.done()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned
+        }
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request"""
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 10000):
+        """
+        Initialize the store
+
+        Args:
+            ttl_seconds: How long a completed response is replayed for its key
+            max_entries: LRU bound on remembered responses
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._flights = SingleFlight()
+        # Key -> (request fingerprint, result, expiry)
+        self._results: "OrderedDict[str, Tuple[str, Any, float]]" = OrderedDict()
+        # Fingerprints of requests still in flight
+        self._pending: Dict[str, str] = {}
+        self.replayed = 0
+
+    async def run(self, key: str, fingerprint: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run the request for an idempotency key once
+
+        A retry while the first attempt is in flight joins it; a retry after
+        it completed gets the stored result. Failures are not stored, so
+        they can be retried. Reusing a key for a different request raises
+        IdempotencyConflict.
+        """
+        entry = self._results.get(key)
+        if entry is not None:
+            stored_fingerprint, result, expires_at = entry
+            if expires_at > time.time():
+                if stored_fingerprint != fingerprint:
+                    raise IdempotencyConflict("Idempotency key was already used for a different request")
+                self._results.move_to_end(key)
+                self.replayed += 1
+                return result
+            del self._results[key]
+
+        pending = self._pending.get(key)
+        if pending is not None and pending != fingerprint:
+            raise IdempotencyConflict("Idempotency key is in use by a different request")
+        self._pending[key] = fingerprint
+
+        async def lead():
+            result = await factory()
+            self._results[key] = (fingerprint, result, time.time() + self.ttl_seconds)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            return result
+
+        try:
+            return await self._flights.do(key, lead)
+        finally:
+            if not self._flights.in_flight(key):
+                self._pending.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._flights.stats(), "stored": len(self._results), "replayed": self.replayed}
+
+
+def create_idempotency_store() -> IdempotencyStore:
+    """Build the idempotency store from the environment"""
+    return IdempotencyStore(
+        ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 600)),
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))
+    )
@@ -1,21 +1,200 @@
 """
 Speech Service - Speech-to-Text
-Handles voice input processing using Google Cloud Speech-to-Text
+Handles voice input processing with a local STT engine (see stt_engines.py)
+running in a bounded worker pool
 """
 
 import os
+import io
+import asyncio
 import logging
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional
+
+from .stt_engines import STTEngine, Recognizer, SAMPLE_RATE, SAMPLE_WIDTH
+from .metrics import instrument
+from .admission import AdmissionRejected, UpstreamLimiter
+from .resilience import UpstreamPolicy
 
 logger = logging.getLogger(__name__)
 
+# Locale codes passed to the STT engine
+LANGUAGE_CODES = {
+    "en": "en-US",
+    "es": "es-ES",
+    "hi": "hi-IN",
+    "ar": "ar-SA",
+    "zh": "zh-CN",
+    "fr": "fr-FR",
+    "de": "de-DE",
+    "pt": "pt-BR",
+    "ru": "ru-RU",
+    "ja": "ja-JP"
+}
+
+
+@instrument("audio_decode")
+def decode_audio(audio_content: bytes) -> bytes:
+    """Decode an audio file to 16 kHz mono 16-bit PCM (blocking)"""
+    import soundfile
+    from pydub import AudioSegment
+
+    try:
+        # WAV/FLAC/OGG are decoded natively, without an ffmpeg subprocess
+        samples, sample_rate = soundfile.read(io.BytesIO(audio_content), dtype="int16")
+        segment = AudioSegment(
+            samples.tobytes(),
+            frame_rate=sample_rate,
+            sample_width=SAMPLE_WIDTH,
+            channels=1 if samples.ndim == 1 else samples.shape[1]
+        )
+    except RuntimeError:
+        # Anything else (webm/opus from browsers, mp3, m4a) goes through ffmpeg
+        segment = AudioSegment.from_file(io.BytesIO(audio_content))
+
+    return segment.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(SAMPLE_WIDTH).raw_data
+
+
+class SpeechStream:
+    """
+    Incremental recognition of one utterance
+
+    16 kHz mono 16-bit PCM is fed chunk by chunk while the user speaks;
+    accept() returns the partial transcript when it changes and finish()
+    returns the final transcript.
+    """
+
+    def __init__(self, service: "SpeechService", language: str = "en", admitted: bool = False):
+        self.service = service
+        self.language = language
+        # Each engine call goes through the STT policy (uploads); voice sessions are not limited
+        self.admitted = admitted
+        self.language_code = LANGUAGE_CODES.get(language, "en-US")
+        self._recognizer: Optional[Recognizer] = None
+        self._partial = ""
+        # Odd trailing byte of a chunk that split a sample
+        self._remainder = b""
+
+    async def _get_recognizer(self) -> Recognizer:
+        if self._recognizer is None:
+            # May load the language model on first use
+            self._recognizer = await self._run(self.service.engine.recognizer, self.language_code)
+        return self._recognizer
+
+    async def _run(self, func, *args):
+        if not self.admitted:
+            return await self.service.run(func, *args)
+        # The slot is held for this call only, never while waiting for more audio
+        return await self.service.resilience.call(lambda: self.service.run(func, *args), timeout=None, retries=0)
+
+    async def accept(self, chunk: bytes) -> Optional[str]:
+        """Feed an audio chunk, returning a partial transcript if one is available"""
+        data = self._remainder + chunk
+        usable = len(data) - len(data) % SAMPLE_WIDTH
+        self._remainder = data[usable:]
+        if not usable:
+            return None
+
+        recognizer = await self._get_recognizer()
+        partial = await self._run(recognizer.accept, data[:usable])
+        if not partial or partial == self._partial:
+            return None
+        self._partial = partial
+        return partial
+
+    async def finish(self) -> str:
+        """Finalize the utterance and return its transcript"""
+        if self._recognizer is None:
+            return ""
+        recognizer, self._recognizer = self._recognizer, None
+        return await self._run(recognizer.finish)
+
+
 class SpeechService:
-    def __init__(self):
-        """Initialize Speech-to-Text service"""
-        # This will use Google Cloud Speech-to-Text API
-        # For now, we'll use a placeholder implementation
-        pass
-    
+    def __init__(
+        self,
+        engine: STTEngine,
+        max_workers: Optional[int] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        resilience: Optional[UpstreamPolicy] = None
+    ):
+        """
+        Initialize Speech-to-Text service
+
+        Args:
+            engine: Loaded-once STT engine shared by every request
+            max_workers: Size of the inference pool (STT_WORKERS, default: CPU count up to 4)
+            limiter: Admission control for uploaded recordings (voice sessions
+                are not limited), used when no resilience policy is given
+            resilience: Deadline per engine call, retries and circuit breaker
+                for uploaded recordings (holds the limiter)
+        """
+        self.engine = engine
+        self.resilience = resilience or UpstreamPolicy("stt", limiter=limiter)
+        self.limiter = self.resilience.limiter
+        max_workers = max_workers or int(os.getenv("STT_WORKERS", min(4, os.cpu_count() or 1)))
+        # Recognition is CPU-bound and blocking; keep it off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stt")
+        logger.info(f"Speech service using {engine.name} engine with {max_workers} workers")
+
+    async def run(self, func, *args, timeout: Optional[float] = None):
+        """
+        Run a blocking engine call in the worker pool
+
+        The call is abandoned (its thread cannot be interrupted) once it
+        exceeds the STT deadline (or the given timeout), so a wedged engine
+        never holds a request.
+        """
+        async with asyncio.timeout(timeout if timeout is not None else self.resilience.timeout):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def supports(self, language: str) -> bool:
+        """Whether a speech model is installed for the language"""
+        return self.engine.supports(LANGUAGE_CODES.get(language, "en-US"))
+
+    def create_stream(self, language: str = "en", admitted: bool = False) -> SpeechStream:
+        """
+        Start incremental recognition of a new utterance
+
+        admitted streams send every engine call through the STT policy
+        (admission, breaker); voice sessions leave it off.
+        """
+        return SpeechStream(self, language, admitted)
+
+    @instrument("speech_to_text", upstream="stt")
+    async def transcribe_stream(self, pcm_chunks: AsyncIterator[bytes], language: str = "en") -> str:
+        """
+        Transcribe 16 kHz mono PCM as it is produced (e.g. by audio_ingest)
+
+        Each engine call is admitted, given the STT deadline and counted by
+        the breaker on its own, so a slow upload never holds an STT slot
+        while the client is still sending. The input cannot be replayed, so
+        calls are never retried.
+        """
+        stream = self.create_stream(language, admitted=True)
+        async for chunk in pcm_chunks:
+            await stream.accept(chunk)
+        return await stream.finish()
+
+    async def transcribe_batch(self, clips: List[bytes], language: str = "en") -> List[str]:
+        """
+        Transcribe decoded clips of similar length in one worker call
+
+        The STT deadline covers one recording, so a bucket's deadline grows
+        with the audio it holds (the deadline plus real time). Clips cost a
+        whole bucket of work, so a failed call is never retried.
+        """
+        audio_seconds = sum(len(clip) for clip in clips) / (SAMPLE_RATE * SAMPLE_WIDTH)
+        timeout = self.resilience.timeout + audio_seconds if self.resilience.timeout is not None else None
+
+        def transcribe():
+            return self.run(
+                self.engine.transcribe_batch, clips, LANGUAGE_CODES.get(language, "en-US"), timeout=timeout
+            )
+
+        return await self.resilience.call(transcribe, timeout=None, retries=0)
+
+    @instrument("speech_to_text", upstream="stt")
     async def speech_to_text(
         self,
         audio_content: bytes,
@@ -23,39 +202,31 @@ class SpeechService:
     ) -> str:
         """
         Convert speech to text
-        
+
         Args:
-            audio_content: Audio file bytes
+            audio_content: Audio file bytes (any format pydub/ffmpeg can read)
             language: Language code
-            
+
         Returns:
             Transcribed text
         """
         try:
-            # Language code mapping for Google Speech-to-Text
-            language_codes = {
-                "en": "en-US",
-                "es": "es-ES",
-                "hi": "hi-IN",
-                "ar": "ar-SA",
-                "zh": "zh-CN",
-                "fr": "fr-FR",
-                "de": "de-DE",
-                "pt": "pt-BR",
-                "ru": "ru-RU",
-                "ja": "ja-JP"
-            }
-            
-            lang_code = language_codes.get(language, "en-US")
-            
-            # TODO: Implement actual Google Cloud Speech-to-Text
-            # For now, return a placeholder
+            lang_code = LANGUAGE_CODES.get(language, "en-US")
             logger.info(f"Processing speech-to-text for language: {lang_code}")
-            
-            # Placeholder implementation
-            # In production, use Google Cloud Speech-to-Text API
-            return "This is a placeholder transcription. Implement Google Cloud Speech-to-Text API."
-            
+
+            async def transcribe() -> str:
+                pcm = await self.run(decode_audio, audio_content)
+                return await self.run(self.engine.transcribe, pcm, lang_code)
+
+            # Deadlines are per engine call (see run)
+            return await self.resilience.call(transcribe, timeout=None)
+
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error in speech-to-text: {str(e)}")
             raise Exception(f"Failed to transcribe audio: {str(e)}")
+
+    def close(self):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
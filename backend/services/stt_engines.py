@@ -0,0 +1,200 @@
+"""
+Speech-to-Text Engines - Pluggable Local Recognizers
+Engines take 16 kHz mono 16-bit PCM and produce partial and final
+transcripts. Their methods block, so SpeechService runs them in its worker pool.
+"""
+
+import os
+import json
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# PCM format every engine accepts
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+# PCM fed to a recognizer per step when transcribing a complete clip (1 second)
+CLIP_CHUNK_BYTES = SAMPLE_RATE * SAMPLE_WIDTH
+
+
+class Recognizer:
+    """Recognition state of one utterance (not thread-safe; calls are sequential)"""
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        """Feed PCM audio, returning the transcript so far"""
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        """Return the final transcript"""
+        raise NotImplementedError
+
+
+class STTEngine:
+    """Shared, loaded-once recognition backend"""
+
+    name = "base"
+
+    def supports(self, language_code: str) -> bool:
+        """Whether the engine can recognize a language (without loading its model)"""
+        return True
+
+    def recognizer(self, language_code: str) -> Recognizer:
+        """Start recognizing a new utterance (may load the language model)"""
+        raise NotImplementedError
+
+    def transcribe(self, pcm: bytes, language_code: str) -> str:
+        """Transcribe a complete clip"""
+        recognizer = self.recognizer(language_code)
+        for offset in range(0, len(pcm), CLIP_CHUNK_BYTES):
+            recognizer.accept(pcm[offset:offset + CLIP_CHUNK_BYTES])
+        return recognizer.finish()
+
+    def transcribe_batch(self, clips: List[bytes], language_code: str) -> List[str]:
+        """
+        Transcribe several clips of similar length in one call
+
+        Engines with real batched inference override this; the default
+        decodes the clips back to back on one worker with the model warm.
+        """
+        return [self.transcribe(pcm, language_code) for pcm in clips]
+
+
+class StubRecognizer(Recognizer):
+    def __init__(self, language_code: str, text: Optional[str]):
+        self.language_code = language_code
+        self.text = text
+        self._bytes = 0
+
+    def _transcript(self) -> str:
+        if self.text is not None:
+            return self.text
+        seconds = self._bytes / (SAMPLE_RATE * SAMPLE_WIDTH)
+        return f"[{self.language_code}] {seconds:.2f}s of audio"
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        self._bytes += len(pcm)
+        return self._transcript()
+
+    def finish(self) -> str:
+        return self._transcript() if self._bytes else ""
+
+
+class StubEngine(STTEngine):
+    """
+    Deterministic engine for tests and development
+
+    Returns STT_STUB_TEXT for any non-empty utterance, or a description of
+    the audio length when it is unset.
+    """
+
+    name = "stub"
+
+    def __init__(self, text: Optional[str] = None):
+        self.text = text
+
+    def recognizer(self, language_code: str) -> Recognizer:
+        return StubRecognizer(language_code, self.text)
+
+
+class VoskRecognizer(Recognizer):
+    def __init__(self, recognizer):
+        self._recognizer = recognizer
+        self._segments: List[str] = []
+
+    def accept(self, pcm: bytes) -> Optional[str]:
+        if self._recognizer.AcceptWaveform(pcm):
+            # Vosk finalized a segment at a pause
+            self._add_segment(json.loads(self._recognizer.Result()).get("text", ""))
+            return " ".join(self._segments)
+
+        partial = json.loads(self._recognizer.PartialResult()).get("partial", "")
+        return " ".join(self._segments + ([partial] if partial else []))
+
+    def finish(self) -> str:
+        self._add_segment(json.loads(self._recognizer.FinalResult()).get("text", ""))
+        return " ".join(self._segments)
+
+    def _add_segment(self, text: str):
+        if text:
+            self._segments.append(text)
+
+
+class VoskEngine(STTEngine):
+    """
+    Offline CPU recognizer backed by Vosk (Kaldi) models
+
+    Models live in model_dir, one directory per language named by its
+    locale code ("en-US") or short code ("en"). Each model is loaded on
+    first use and shared by every request after that.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_dir: str, short_codes: Optional[Dict[str, str]] = None):
+        try:
+            import vosk
+        except ImportError:
+            raise ValueError("STT_ENGINE=vosk requires the vosk package")
+        if not model_dir or not os.path.isdir(model_dir):
+            raise ValueError(f"VOSK_MODEL_DIR is not a directory: {model_dir!r}")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model_dir = model_dir
+        # Locale code -> short code, for model directories named "en"
+        self.short_codes = short_codes or {}
+        self._models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _model_path(self, language_code: str) -> Optional[str]:
+        candidates = [language_code, self.short_codes.get(language_code, "")]
+        return next(
+            (os.path.join(self.model_dir, name) for name in candidates
+             if name and os.path.isdir(os.path.join(self.model_dir, name))),
+            None
+        )
+
+    def supports(self, language_code: str) -> bool:
+        return language_code in self._models or self._model_path(language_code) is not None
+
+    def _model(self, language_code: str):
+        model = self._models.get(language_code)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(language_code)
+            if model is None:
+                path = self._model_path(language_code)
+                if path is None:
+                    raise ValueError(f"No speech model installed for {language_code}")
+                logger.info(f"Loading Vosk model for {language_code} from {path}")
+                model = self._vosk.Model(path)
+                self._models[language_code] = model
+        return model
+
+    def recognizer(self, language_code: str) -> Recognizer:
+        recognizer = self._vosk.KaldiRecognizer(self._model(language_code), SAMPLE_RATE)
+        return VoskRecognizer(recognizer)
+
+
+def create_stt_engine(short_codes: Optional[Dict[str, str]] = None) -> STTEngine:
+    """
+    Build the engine selected by STT_ENGINE ("vosk", the default, or "stub")
+
+    The stub engine returns made-up transcripts, so it is only used when
+    asked for (tests, benchmarks); a deploy without Vosk models gets no
+    speech-to-text rather than fake input.
+
+    Raises:
+        ValueError: If the engine is unknown or cannot be loaded
+    """
+    name = os.getenv("STT_ENGINE", "vosk").lower()
+    if name == "stub":
+        return StubEngine(text=os.getenv("STT_STUB_TEXT"))
+    if name == "vosk":
+        return VoskEngine(os.getenv("VOSK_MODEL_DIR", ""), short_codes)
+    raise ValueError(f"Unknown STT_ENGINE: {name}")
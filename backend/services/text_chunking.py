@@ -0,0 +1,44 @@
+"""
+Text Chunking - Sentence Segmentation for Streaming
+Splits streamed model output into sentences that can be voiced one by one
+"""
+
+import re
+from typing import List, Optional
+
+# Sentence terminators for Latin, Devanagari, Arabic and CJK scripts
+SENTENCE_END = re.compile(r"(?<=[.!?;।؟])\s+|(?<=[。！？])|\n+")
+
+
+class SentenceChunker:
+    def __init__(self, min_chars: int = 20):
+        """
+        Initialize the chunker
+
+        Args:
+            min_chars: Sentences shorter than this are merged with the next
+                one so TTS is not called for fragments like "1."
+        """
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return every sentence it completed"""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Return whatever text is left once the stream has ended"""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return remainder or None
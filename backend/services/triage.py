@@ -0,0 +1,534 @@
+"""
+Triage Engine - Emergency and Urgency Keyword Matching
+Compiles one regex per supported language at startup and reports every
+matched term with its span, for user messages and streamed model output
+"""
+
+import re
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EMERGENCY = "emergency"
+URGENT = "urgent"
+
+# Keyword dictionaries per language code (same codes as /api/languages).
+# English terms are matched for every language since patients code-switch.
+TRIAGE_KEYWORDS = {
+    "en": {
+        EMERGENCY: [
+            "chest pain", "chest pains", "can't breathe", "cannot breathe", "severe bleeding",
+            "unconscious", "stroke", "heart attack", "suicide", "suicidal", "overdose", "overdosed",
+            "severe pain", "difficulty breathing", "choking", "choked", "seizure", "seizures",
+            "not breathing", "passed out"
+        ],
+        URGENT: [
+            "fever", "fevers", "feverish", "vomit", "vomits", "vomited", "vomiting", "diarrhea", "pain",
+            "pains", "painful", "bleed", "bleeds", "bleeding", "injury", "injuries", "injured",
+            "infection", "infections", "infected", "rash", "rashes", "swelling", "swollen"
+        ]
+    },
+    "es": {
+        EMERGENCY: [
+            "dolor de pecho", "dolor en el pecho", "no puedo respirar", "sangrado abundante",
+            "hemorragia", "inconsciente", "derrame cerebral", "ataque cardíaco", "infarto",
+            "suicidio", "sobredosis", "dolor intenso", "dificultad para respirar", "me estoy ahogando",
+            "convulsión", "convulsiones"
+        ],
+        URGENT: [
+            "fiebre", "vómito", "vómitos", "vomitando", "diarrea", "dolor", "dolores", "sangrado",
+            "herida", "heridas", "lesión", "lesiones", "infección", "infecciones", "sarpullido",
+            "erupción", "hinchazón", "hinchado", "hinchada"
+        ]
+    },
+    "hi": {
+        EMERGENCY: [
+            "सीने में दर्द", "छाती में दर्द", "सांस नहीं ले पा", "सांस लेने में तकलीफ", "बहुत खून",
+            "बेहोश", "स्ट्रोक", "लकवा", "दिल का दौरा", "हार्ट अटैक", "आत्महत्या", "ओवरडोज",
+            "तेज दर्द", "दम घुट", "दौरा पड़"
+        ],
+        URGENT: [
+            "बुखार", "उल्टी", "दस्त", "दर्द", "खून", "चोट", "संक्रमण", "चकत्ते", "सूजन"
+        ]
+    },
+    "ar": {
+        EMERGENCY: [
+            "ألم في الصدر", "لا أستطيع التنفس", "نزيف حاد", "فاقد الوعي", "غيبوبة",
+            "سكتة دماغية", "جلطة", "نوبة قلبية", "انتحار", "جرعة زائدة", "ألم شديد",
+            "صعوبة في التنفس", "اختناق", "نوبة صرع"
+        ],
+        URGENT: [
+            "حمى", "حرارة", "قيء", "استفراغ", "إسهال", "ألم", "نزيف", "إصابة", "جرح",
+            "عدوى", "التهاب", "طفح", "تورم"
+        ]
+    },
+    "zh": {
+        EMERGENCY: [
+            "胸痛", "胸口痛", "无法呼吸", "不能呼吸", "喘不过气", "大出血", "昏迷", "失去意识",
+            "中风", "心脏病发作", "心梗", "自杀", "过量服药", "剧痛", "呼吸困难", "窒息", "噎住",
+            "抽搐"
+        ],
+        URGENT: [
+            "发烧", "发热", "呕吐", "腹泻", "拉肚子", "疼", "痛", "出血", "受伤", "感染",
+            "皮疹", "肿"
+        ]
+    },
+    "fr": {
+        EMERGENCY: [
+            "douleur thoracique", "douleur à la poitrine", "je ne peux pas respirer",
+            "saignement abondant", "hémorragie", "inconscient", "avc", "accident vasculaire",
+            "crise cardiaque", "infarctus", "suicide", "surdose", "overdose", "douleur intense",
+            "difficulté à respirer", "étouffe", "étouffer", "étouffement", "convulsion", "convulsions"
+        ],
+        URGENT: [
+            "fièvre", "vomissement", "vomissements", "vomi", "vomir", "vomis", "diarrhée", "douleur",
+            "douleurs", "saignement", "saignements", "saigne", "blessure", "blessures", "blessé",
+            "blessée", "infection", "infections", "éruption", "rougeur", "rougeurs", "gonflement",
+            "gonflé", "gonflée", "enflure"
+        ]
+    },
+    "de": {
+        EMERGENCY: [
+            "brustschmerz", "brustschmerzen", "schmerzen in der brust", "kann nicht atmen",
+            "starke blutung", "starke blutungen", "bewusstlos", "schlaganfall", "herzinfarkt", "suizid",
+            "selbstmord", "überdosis", "starke schmerzen", "atemnot", "ersticke", "ersticken",
+            "krampfanfall", "krampfanfälle"
+        ],
+        URGENT: [
+            "fieber", "erbrechen", "erbreche", "durchfall", "schmerz", "schmerzen", "blutung",
+            "blutungen", "blute", "blutet", "verletzung", "verletzungen", "verletzt", "infektion",
+            "infektionen", "entzündung", "entzündet", "ausschlag", "schwellung", "geschwollen"
+        ]
+    },
+    "pt": {
+        EMERGENCY: [
+            "dor no peito", "não consigo respirar", "sangramento intenso", "hemorragia",
+            "inconsciente", "desmaiou", "avc", "derrame", "ataque cardíaco", "infarto",
+            "suicídio", "overdose", "dor intensa", "dificuldade para respirar", "engasgado",
+            "engasgando", "convulsão", "convulsões"
+        ],
+        URGENT: [
+            "febre", "vômito", "vômitos", "vomitando", "vomitei", "diarreia", "dor", "dores",
+            "sangramento", "sangrando", "ferimento", "ferimentos", "ferido", "ferida", "lesão",
+            "lesões", "infecção", "infecções", "erupção", "manchas", "inchaço", "inchado", "inchada"
+        ]
+    },
+    "ru": {
+        EMERGENCY: [
+            "боль в груди", "не могу дышать", "сильное кровотечение", "без сознания",
+            "потерял сознание", "потеряла сознание", "инсульт", "инсульта", "сердечный приступ",
+            "инфаркт", "инфаркта", "самоубийство", "суицид", "передозировка", "сильная боль",
+            "сильные боли", "трудно дышать", "задыхаюсь", "подавился", "подавилась", "судороги",
+            "судорога"
+        ],
+        URGENT: [
+            "температура", "температуру", "температурой", "жар", "лихорадка", "рвота", "рвоты",
+            "рвет", "рвёт", "тошнит", "диарея", "понос", "боль", "боли", "болит", "болят",
+            "кровотечение", "травма", "травму", "инфекция", "инфекцию", "сыпь", "отек", "отёк"
+        ]
+    },
+    "ja": {
+        EMERGENCY: [
+            "胸の痛み", "胸が痛い", "息ができない", "呼吸ができない", "大量出血", "意識がない",
+            "意識不明", "脳卒中", "心臓発作", "心筋梗塞", "自殺", "過剰摂取", "激痛",
+            "呼吸困難", "窒息", "喉に詰まった", "けいれん"
+        ],
+        URGENT: [
+            "熱", "発熱", "嘔吐", "吐き気", "下痢", "痛い", "痛み", "出血", "けが", "怪我",
+            "感染", "発疹", "腫れ"
+        ]
+    }
+}
+
+# Scripts written without spaces (or with attached affixes) are matched as
+# plain substrings; the others require a word start before each term.
+SUBSTRING_LANGUAGES = {"zh", "ja", "hi", "ar"}
+
+# Negation cues per language: "before" cues negate a term they precede within
+# NEGATION_WINDOW words (characters for zh/ja) in the same clause, "after"
+# cues one they follow (Hindi and Japanese negate after the symptom). Cues
+# like "never" are left out on purpose: "never had chest pain like this" is
+# an emergency. English cues apply to every language, like English terms.
+NEGATION_CUES = {
+    "en": {"before": [
+        "no", "not", "don't", "dont", "do not", "doesn't", "does not", "didn't", "did not", "isn't",
+        "aren't", "wasn't", "haven't", "hasn't", "without", "denies", "denied", "deny", "free of", "no longer"
+    ]},
+    "es": {"before": ["no", "sin", "ningún", "ninguna", "ni", "niega", "niego"]},
+    "fr": {"before": ["pas", "pas de", "aucun", "aucune", "sans", "ni", "plus de"]},
+    "de": {"before": ["kein", "keine", "keinen", "keiner", "nicht", "ohne"]},
+    "pt": {"before": ["não", "nao", "sem", "nenhum", "nenhuma", "nem", "nego"]},
+    "ru": {"before": ["нет", "не", "без", "ни"]},
+    "hi": {"before": ["कोई नहीं", "बिना"], "after": ["नहीं", "ना"]},
+    "ar": {"before": ["لا", "ليس", "ليست", "لست", "بدون", "دون", "لم", "ما عندي", "ما في", "ما"]},
+    "zh": {"before": ["没有", "没", "不", "无", "未", "否认", "并无"]},
+    "ja": {"after": ["ない", "ありません", "なし", "ません", "ではない"]}
+}
+
+# Phrases that contain a cue without negating the symptom ("not sure if it's a
+# stroke", "是不是胸痛"); they are blanked out before cues are looked for
+PSEUDO_NEGATIONS = {
+    "en": [
+        "not sure", "don't know", "dont know", "do not know", "not certain", "no doubt", "not only",
+        "not just", "no idea", "can't tell"
+    ],
+    "es": ["no sé", "no se si", "no estoy seguro", "no estoy segura", "no solo"],
+    "fr": ["sais pas", "suis pas sûr", "suis pas sûre", "pas seulement", "pas sûr"],
+    "de": ["weiß nicht", "weiss nicht", "nicht sicher", "nicht nur"],
+    "pt": ["não sei", "nao sei", "não tenho certeza", "não só"],
+    "ru": ["не знаю", "не уверен", "не уверена", "не только"],
+    "hi": ["पता नहीं"],
+    "ar": ["لا أعرف", "لا اعرف", "لست متأكد", "لست متأكدا", "ما أدري"],
+    "zh": ["是不是", "有没有", "不知道", "不确定"],
+    "ja": ["わからない", "分からない", "かもしれない"]
+}
+
+# Words that end a clause, so a negation before them does not reach past.
+# Coordinating conjunctions count too: in "no pulse and is unconscious" the
+# negation covers the pulse, not the unconsciousness.
+CLAUSE_BREAKS = {
+    "en": ["but", "however", "although", "though", "except", "yet", "and", "or", "plus", "also"],
+    "es": ["pero", "sino", "aunque", "y", "e", "o", "u", "también"],
+    "fr": ["mais", "cependant", "pourtant", "et", "ou", "aussi"],
+    "de": ["aber", "sondern", "jedoch", "doch", "und", "oder", "auch"],
+    "pt": ["mas", "porém", "porem", "embora", "e", "ou", "também"],
+    "ru": ["но", "однако", "а", "и", "или", "также"],
+    "hi": ["लेकिन", "पर", "मगर", "और", "या", "तथा"],
+    "ar": ["لكن", "ولكن", "لكنّ", "و", "أو", "او"],
+    "zh": ["但是", "但", "可是", "不过", "和", "并且", "而且", "还有", "或者", "以及"],
+    "ja": ["でも", "しかし", "けど", "が、", "そして", "または", "それと", "それに"]
+}
+
+# Words that may stand between a negation cue and an emergency term it
+# negates ("I don't have difficulty breathing"). Anything else in between
+# keeps the emergency: "did not eat before he passed out".
+NEGATION_FILLERS = {
+    "en": ["have", "has", "had", "having", "got", "any", "a", "an", "feel", "feeling", "experiencing"],
+    "es": ["tengo", "tiene", "tienes", "tenemos", "hay", "un", "una", "siento", "presenta"],
+    "fr": ["ai", "a", "avons", "de", "d'", "la", "le", "les", "un", "une"],
+    "de": ["habe", "hat", "haben", "ein", "eine", "einen"],
+    "pt": ["tenho", "tem", "temos", "estou com", "está com", "um", "uma", "sinto"],
+    "ru": ["у меня", "у него", "у неё", "есть", "было"],
+    "hi": ["है", "हैं", "था", "थी", "हो रहा", "हो रही"],
+    "ar": ["لدي", "لديه", "لديها", "عندي", "عنده", "عندها", "يوجد", "أي"],
+    "zh": ["有", "任何", "出现", "感到"],
+    "ja": ["は", "が", "も", "で"]
+}
+
+# Emergency terms that only say how bad a pain is, and sites where such a pain
+# is urgent rather than an emergency ("severe pain in my toe")
+SEVERITY_TERMS = {
+    "severe pain", "dolor intenso", "douleur intense", "starke schmerzen", "dor intensa",
+    "сильная боль", "сильные боли", "तेज दर्द", "ألم شديد", "剧痛", "激痛"
+}
+MINOR_SITES = {
+    "en": [
+        "toe", "toes", "finger", "fingers", "thumb", "nail", "tooth", "teeth", "knee", "ankle", "foot",
+        "feet", "heel", "wrist", "elbow", "hand"
+    ],
+    "es": ["dedo", "dedos", "uña", "diente", "dientes", "muela", "rodilla", "tobillo", "pie", "pies", "talón", "muñeca", "codo", "mano"],
+    "fr": ["orteil", "doigt", "doigts", "ongle", "dent", "dents", "genou", "cheville", "pied", "pieds", "talon", "poignet", "coude", "main"],
+    "de": ["zeh", "zehe", "zehen", "finger", "nagel", "zahn", "zähne", "knie", "knöchel", "fuß", "füße", "ferse", "handgelenk", "ellbogen", "hand"],
+    "pt": ["dedo", "dedos", "unha", "dente", "dentes", "joelho", "tornozelo", "pé", "pés", "calcanhar", "pulso", "cotovelo", "mão"],
+    "ru": ["палец", "пальце", "пальца", "ноготь", "зуб", "зубе", "зубы", "колено", "колене", "лодыжке", "стопе", "пятке", "запястье", "локте"],
+    "hi": ["उंगली", "अंगूठे", "दांत", "घुटने", "टखने", "एड़ी", "कलाई", "कोहनी"],
+    "ar": ["إصبع", "أصبع", "ظفر", "سن", "أسنان", "ضرس", "ركبة", "الركبة", "كاحل", "قدم", "القدم", "كعب", "معصم", "مرفق"],
+    "zh": ["脚趾", "手指", "指甲", "牙", "膝盖", "脚踝", "脚跟", "手腕", "手肘", "脚"],
+    "ja": ["足の指", "指", "爪", "歯", "膝", "足首", "かかと", "手首", "肘"]
+}
+
+# How far a negation cue or a site may be from the term
+NEGATION_WINDOW = 4
+SITE_WINDOW = 5
+# The same windows in characters, for languages written without spaces
+CHAR_NEGATION_WINDOW = 6
+CHAR_SITE_WINDOW = 8
+CHAR_LANGUAGES = {"zh", "ja"}
+
+_CLAUSE_PUNCTUATION = ".!?;:,\n。！？；，、"
+
+
+def _trie_pattern(terms: List[str]) -> str:
+    """
+    Build a regex from a prefix trie of terms
+
+    Shared prefixes are factored out ("chest pain" / "choking" share "ch"),
+    so the regex engine walks the terms like an automaton instead of trying
+    every alternative at every position. Optional groups are greedy, so the
+    longest term starting at a position wins ("vomissement" over "vomi").
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A term ends here but longer ones continue
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class TriageMatch:
+    """One matched keyword"""
+
+    def __init__(self, term: str, category: str, start: int, end: int):
+        self.term = term
+        self.category = category
+        self.start = start
+        self.end = end
+
+    def to_dict(self) -> Dict:
+        return {"term": self.term, "category": self.category, "span": [self.start, self.end]}
+
+
+class TriageResult:
+    """Matches found in one text"""
+
+    def __init__(self, matches: List[TriageMatch]):
+        self.matches = matches
+        self.is_emergency = any(m.category == EMERGENCY for m in matches)
+        self.is_urgent = any(m.category == URGENT for m in matches)
+
+    @property
+    def severity(self) -> str:
+        return "high" if self.is_emergency else "medium" if self.is_urgent else "low"
+
+    def to_dict(self) -> Dict:
+        return {
+            "is_emergency": self.is_emergency,
+            "is_urgent": self.is_urgent,
+            "severity": self.severity,
+            "matches": [m.to_dict() for m in self.matches]
+        }
+
+
+def _alternation(phrases: List[str]) -> str:
+    return "|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True))
+
+
+def _phrase_pattern(phrases: List[str], bounded: bool) -> Optional["re.Pattern"]:
+    if not phrases:
+        return None
+    alternation = _alternation(phrases)
+    if bounded:
+        alternation = f"(?<!\\w)(?:{alternation})(?!\\w)"
+    return re.compile(alternation, re.IGNORECASE)
+
+
+def _merged(table: Dict[str, List[str]], language: str) -> List[str]:
+    return table.get(language, []) + (table.get("en", []) if language != "en" else [])
+
+
+class _CompiledLanguage:
+    def __init__(self, pattern: "re.Pattern", categories: Dict[str, str], max_term_length: int, language: str = "en"):
+        self.pattern = pattern
+        self.categories = categories
+        self.max_term_length = max_term_length
+
+        self.by_chars = language in CHAR_LANGUAGES
+        bounded = not self.by_chars
+        cues = {"before": [], "after": []}
+        for source in ([language, "en"] if language != "en" else ["en"]):
+            for side in cues:
+                cues[side] += NEGATION_CUES.get(source, {}).get(side, [])
+        self.negation_before = _phrase_pattern(cues["before"], bounded)
+        self.negation_after = _phrase_pattern(cues["after"], bounded)
+        # Cues right next to the term, but for filler words (emergency terms)
+        fillers = _alternation(_merged(NEGATION_FILLERS, language))
+        self.adjacent_before = self.adjacent_after = None
+        if cues["before"]:
+            before = _alternation(cues["before"])
+            self.adjacent_before = re.compile(
+                f"(?<!\\w)(?:{before})(?:\\s+(?:{fillers}))*\\s*$" if bounded else f"(?:{before})(?:{fillers})*$",
+                re.IGNORECASE
+            )
+        if cues["after"]:
+            after = _alternation(cues["after"])
+            self.adjacent_after = re.compile(
+                f"^\\s*(?:(?:{fillers})\\s+)*(?:{after})(?!\\w)" if bounded else f"^(?:{fillers})*(?:{after})",
+                re.IGNORECASE
+            )
+        self.pseudo_negations = _phrase_pattern(_merged(PSEUDO_NEGATIONS, language), bounded)
+        self.clause_break = re.compile(
+            f"[{_CLAUSE_PUNCTUATION}]|" + _phrase_pattern(_merged(CLAUSE_BREAKS, language), bounded).pattern,
+            re.IGNORECASE
+        )
+        self.minor_sites = _phrase_pattern(_merged(MINOR_SITES, language), bounded)
+        # Longest stretch around a term that context checks look at (for streams)
+        self.context_length = CHAR_SITE_WINDOW if self.by_chars else 16 * max(NEGATION_WINDOW, SITE_WINDOW)
+
+    def _clause(self, text: str, start: int, end: int) -> Tuple[str, str]:
+        """The text of the term's clause before and after it"""
+        clause_start = 0
+        for boundary in self.clause_break.finditer(text, 0, start):
+            clause_start = boundary.end()
+        boundary = self.clause_break.search(text, end)
+        clause_end = boundary.start() if boundary else len(text)
+        return text[clause_start:start], text[end:clause_end]
+
+    def _window(self, text: str, size: int, from_end: bool) -> str:
+        if self.by_chars:
+            return text[-size:] if from_end else text[:size]
+        words = text.split()
+        return " ".join(words[-size:] if from_end else words[:size])
+
+    def negated(self, before: str, after: str, adjacent: bool = False) -> bool:
+        """
+        True when a cue in the term's clause negates it
+
+        With adjacent=True (emergency terms) only a cue right before or
+        after the term counts, give or take NEGATION_FILLERS.
+        """
+        window = CHAR_NEGATION_WINDOW if self.by_chars else NEGATION_WINDOW
+        if self.pseudo_negations:
+            before = self.pseudo_negations.sub(" ", before)
+            after = self.pseudo_negations.sub(" ", after)
+        if adjacent:
+            return bool(
+                (self.adjacent_before and self.adjacent_before.search(before))
+                or (self.adjacent_after and self.adjacent_after.search(after))
+            )
+        if self.negation_before and self.negation_before.search(self._window(before, window, True)):
+            return True
+        return bool(self.negation_after and self.negation_after.search(self._window(after, window, False)))
+
+    def at_minor_site(self, before: str, after: str) -> bool:
+        window = CHAR_SITE_WINDOW if self.by_chars else SITE_WINDOW
+        return any(
+            self.minor_sites.search(self._window(side, window, from_end))
+            for side, from_end in ((before, True), (after, False))
+        )
+
+
+class TriageEngine:
+    def __init__(self, keywords: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        """Compile one matcher per language (done once at startup)"""
+        keywords = keywords or TRIAGE_KEYWORDS
+        self._languages: Dict[str, _CompiledLanguage] = {
+            language: self._compile(language, keywords)
+            for language in keywords
+        }
+        logger.info(f"Triage engine compiled for languages: {', '.join(sorted(self._languages))}")
+
+    @staticmethod
+    def _compile(language: str, keywords: Dict[str, Dict[str, List[str]]]) -> _CompiledLanguage:
+        categories: Dict[str, str] = {}
+        sources = [keywords.get("en", {})]
+        if language != "en":
+            sources.insert(0, keywords[language])
+
+        # Emergency terms win when the same term appears in both lists
+        for source in sources:
+            for category in (EMERGENCY, URGENT):
+                for term in source.get(category, []):
+                    categories.setdefault(term.casefold(), category)
+
+        terms = list(categories)
+        pattern = _trie_pattern(terms)
+        if language not in SUBSTRING_LANGUAGES:
+            # Whole words only ("pain" is not in "painting"); inflections are listed
+            pattern = f"(?<!\\w)(?:{pattern})(?!\\w)"
+        else:
+            # The script itself has no word boundaries, but the English terms do
+            pattern = f"(?<![a-z])(?:{pattern})(?![a-z])"
+
+        return _CompiledLanguage(
+            re.compile(pattern, re.IGNORECASE),
+            categories,
+            max(len(term) for term in terms),
+            language
+        )
+
+    def _matcher(self, language: str) -> _CompiledLanguage:
+        return self._languages.get(language) or self._languages["en"]
+
+    def scan(self, text: str, language: str = "en") -> TriageResult:
+        """
+        Find every emergency/urgency term in text
+
+        Terms negated in their clause ("no chest pain", "I don't have
+        trouble breathing") are left out; emergency terms only when the
+        cue is right next to them. A severity-only emergency term at a
+        minor site ("severe pain in my toe") is reported as urgent.
+        """
+        compiled = self._matcher(language)
+        matches = []
+        for match in compiled.pattern.finditer(text):
+            term = match.group(0).casefold()
+            before, after = compiled._clause(text, match.start(), match.end())
+            category = compiled.categories.get(term, URGENT)
+            if compiled.negated(before, after, adjacent=category == EMERGENCY):
+                continue
+            if category == EMERGENCY and term in SEVERITY_TERMS and compiled.at_minor_site(before, after):
+                category = URGENT
+            matches.append(TriageMatch(match.group(0), category, match.start(), match.end()))
+        return TriageResult(matches)
+
+    def stream(self, language: str = "en") -> "TriageStream":
+        """Start scanning text that arrives in pieces (e.g. model output)"""
+        return TriageStream(self, language)
+
+
+class TriageStream:
+    """
+    Incremental scanner for streamed text
+
+    Only the last max_term_length characters (plus the negation context
+    before a term) are rescanned with each new delta, so every term is
+    reported exactly once, with spans relative to the whole stream. A term
+    that ends with the text received so far is held back until more text
+    (or flush) shows it is not the start of a longer word ("vomi" in
+    "vomissement"). Context after a term is only what has arrived by the
+    time the term is reported.
+    """
+
+    def __init__(self, engine: TriageEngine, language: str = "en"):
+        self.engine = engine
+        self.language = language
+        self._tail = ""
+        self._offset = 0
+        # Stream offsets of the terms already reported
+        self._reported: Set[int] = set()
+        self.matches: List[TriageMatch] = []
+
+    def _collect(self, window: str, final: bool) -> List[TriageMatch]:
+        found = []
+        for match in self.engine.scan(window, self.language).matches:
+            # Terms that ended inside the tail were settled with the previous delta
+            if match.end < len(self._tail) or match.start + self._offset in self._reported:
+                continue
+            if match.end == len(window) and not final:
+                continue
+            self._reported.add(match.start + self._offset)
+            found.append(TriageMatch(
+                match.term,
+                match.category,
+                match.start + self._offset,
+                match.end + self._offset
+            ))
+        self.matches.extend(found)
+        return found
+
+    def feed(self, delta: str) -> List[TriageMatch]:
+        """Scan a new delta and return the terms it completed"""
+        window = self._tail + delta
+        found = self._collect(window, final=False)
+
+        compiled = self.engine._matcher(self.language)
+        keep = compiled.max_term_length + compiled.context_length
+        self._offset += max(0, len(window) - keep)
+        self._tail = window[-keep:]
+        self._reported = {start for start in self._reported if start >= self._offset}
+        return found
+
+    def flush(self) -> List[TriageMatch]:
+        """Report a term held back at the end of the stream"""
+        return self._collect(self._tail, final=True)
@@ -0,0 +1,189 @@
+"""
+TTS Cache - Content-Addressed Audio Cache
+Keeps synthesized audio keyed by (text, voice, model, voice settings) in a
+byte-bounded memory tier and a file-backed disk tier that survives restarts
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(text: str, voice_id: str, model_id: str, voice_settings: Dict, **variant) -> str:
+    """Content address of one synthesis request"""
+    material = json.dumps(
+        {
+            "text": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "voice_settings": voice_settings,
+            **variant
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_memory_bytes: Budget of the in-memory LRU tier
+            disk_dir: Directory of the disk tier (None disables it)
+            max_disk_bytes: Budget of the disk tier, evicted least recently used first
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = disk_dir
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.audio")
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU order from file mtimes (refreshed on every read)"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".audio"):
+                continue
+            stat = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+        logger.info(f"TTS cache disk tier loaded {len(self._disk)} entries ({self._disk_bytes} bytes)")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return cached audio, promoting disk hits into memory"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return data
+
+        if self.disk_dir and key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read_file, key)
+            except OSError:
+                self._forget_disk(key)
+            else:
+                self._disk.move_to_end(key)
+                self.hits_disk += 1
+                self._put_memory(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        return key in self._memory or key in self._disk
+
+    async def put(self, key: str, data: bytes):
+        """Store audio in both tiers"""
+        self._put_memory(key, data)
+
+        if self.disk_dir and key not in self._disk and len(data) <= self.max_disk_bytes:
+            try:
+                await asyncio.to_thread(self._write_file, key, data)
+            except OSError as e:
+                logger.error(f"Failed to write TTS cache entry: {str(e)}")
+                return
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            await self._evict_disk()
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            key, _ = next(iter(self._disk.items()))
+            self._forget_disk(key)
+            try:
+                await asyncio.to_thread(os.remove, self._path(key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _read_file(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as f:
+            data = f.read()
+        # Refresh the mtime so restarts keep the LRU order
+        os.utime(path)
+        return data
+
+    def _write_file(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes
+        }
+
+
+def create_tts_cache() -> Optional[TTSCache]:
+    """Build the TTS cache from the environment (None when disabled)"""
+    if os.getenv("TTS_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+
+    disk_dir = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "medivoice", "tts"))
+    return TTSCache(
+        max_memory_bytes=int(float(os.getenv("TTS_CACHE_MEMORY_MB", 64)) * 1024 * 1024),
+        disk_dir=disk_dir or None,
+        max_disk_bytes=int(float(os.getenv("TTS_CACHE_DISK_MB", 512)) * 1024 * 1024)
+    )
@@ -0,0 +1,268 @@
+"""
+Voice Session - Full-Duplex Consultation over WebSocket
+Keeps one connection per consultation: microphone audio in, transcripts,
+text and synthesized speech out, with barge-in support
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .admission import AdmissionRejected
+from .audio_ingest import contains_speech
+from .conversation_stream import stream_conversation_turn
+from .gemini_service import FallbackText
+from .session_store import SessionState
+from .stt_engines import SAMPLE_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# Speech frames in a row (30 ms each) that count as the user talking over an answer
+BARGE_IN_FRAMES = 3
+
+
+class VoiceSession:
+    """
+    Protocol (client -> server):
+        binary frame                      microphone audio (16 kHz mono 16-bit PCM)
+        {"type": "start", "language"}     (optional) switch the session language
+        {"type": "end_utterance"}         the user stopped speaking, run the turn
+        {"type": "text", "message"}       typed message, run the turn directly
+        {"type": "interrupt"}             cancel the in-flight answer
+
+    Protocol (server -> client):
+        {"type": "ready", "conversation_id", "language"}
+        {"type": "transcript", "text", "final"}
+        {"type": "text", "delta"}
+        {"type": "audio_start", "sentence", "format"} then binary audio frames
+                                          (MP3 unless the session asked for another format)
+        {"type": "audio_end", "sentence", "text"}
+        {"type": "done", "conversation_id", "text", "medical_context", "fallback"}
+        {"type": "interrupted"}
+        {"type": "error", "detail"}
+
+    Speech arriving while an answer is still being generated or voiced is a
+    barge-in: the in-flight turn (including its TTS) is cancelled. Speech
+    is what the VAD detects (about 90 ms of it), or, without a VAD, any new
+    partial transcript; silence and background noise keep the answer going.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        gemini_service,
+        elevenlabs_service,
+        speech_service,
+        session_store,
+        language: str = "en",
+        conversation_id: Optional[str] = None,
+        greetings=None,
+        reports=None,
+        audio_variant=None,
+        vad=None
+    ):
+        self.websocket = websocket
+        self.gemini_service = gemini_service
+        self.elevenlabs_service = elevenlabs_service
+        self.speech_service = speech_service
+        self.session_store = session_store
+        self.greetings = greetings
+        self.reports = reports
+        self.audio_variant = audio_variant
+        self.vad = vad
+        self.language = language
+        self.conversation_id = conversation_id or str(uuid.uuid4())
+        self.state: Optional[SessionState] = None
+
+        self._send_lock = asyncio.Lock()
+        self._utterance = None
+        self._turn: Optional[asyncio.Task] = None
+        self._audio_sentence: Optional[int] = None
+        # Odd trailing byte of a chunk that split a sample (for the VAD)
+        self._remainder = b""
+
+    async def _send_json(self, message: Dict):
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def _send_bytes(self, data: bytes):
+        async with self._send_lock:
+            await self.websocket.send_bytes(data)
+
+    async def run(self):
+        """Serve the session until the client disconnects"""
+        # Resume a consultation started over HTTP (or a previous connection)
+        self.state = await self.session_store.get(self.conversation_id)
+        if self.state is None:
+            self.state = SessionState(self.conversation_id, self.language)
+
+        await self._send_json({
+            "type": "ready",
+            "conversation_id": self.conversation_id,
+            "language": self.language
+        })
+
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+
+                if message.get("bytes") is not None:
+                    await self._on_audio(message["bytes"])
+                elif message.get("text") is not None:
+                    await self._on_control(message["text"])
+        finally:
+            await self._cancel_turn()
+
+    def _heard_speech(self, chunk: bytes) -> bool:
+        data = self._remainder + chunk
+        usable = len(data) - len(data) % SAMPLE_WIDTH
+        self._remainder = data[usable:]
+        return contains_speech(np.frombuffer(data[:usable], dtype="<i2"), self.vad, BARGE_IN_FRAMES)
+
+    async def _barge_in(self):
+        if self._turn_in_flight():
+            await self._cancel_turn()
+            await self._send_json({"type": "interrupted"})
+
+    async def _on_audio(self, chunk: bytes):
+        # Fed even with no turn in flight, so the noise floor keeps up with the room
+        if self.vad is not None and self._heard_speech(chunk):
+            await self._barge_in()
+
+        if self.speech_service is None:
+            await self._send_json({"type": "error", "detail": "Speech-to-text is not configured"})
+            return
+
+        if self._utterance is None:
+            self._utterance = self.speech_service.create_stream(self.language)
+
+        partial = await self._utterance.accept(chunk)
+        if partial:
+            if self.vad is None:
+                await self._barge_in()
+            await self._send_json({"type": "transcript", "text": partial, "final": False})
+
+    async def _on_control(self, raw: str):
+        try:
+            control = json.loads(raw)
+        except ValueError:
+            await self._send_json({"type": "error", "detail": "Invalid JSON message"})
+            return
+
+        kind = control.get("type")
+        if kind == "start":
+            language = control.get("language", self.language)
+            if self.speech_service is not None and not self.speech_service.supports(language):
+                await self._send_json({"type": "error", "detail": f"Speech-to-text is not available for language: {language}"})
+                return
+            self.language = language
+        elif kind == "end_utterance":
+            await self._finish_utterance()
+        elif kind == "text":
+            message = (control.get("message") or "").strip()
+            if message:
+                await self._start_turn(message)
+        elif kind == "interrupt":
+            await self._barge_in()
+        else:
+            await self._send_json({"type": "error", "detail": f"Unknown message type: {kind}"})
+
+    async def _finish_utterance(self):
+        utterance, self._utterance = self._utterance, None
+        if utterance is None:
+            return
+
+        try:
+            transcript = (await utterance.finish()).strip()
+        except Exception as e:
+            logger.error(f"Error in session speech-to-text: {str(e)}")
+            await self._send_json({"type": "error", "detail": str(e)})
+            return
+
+        await self._send_json({"type": "transcript", "text": transcript, "final": True})
+        if transcript:
+            await self._start_turn(transcript)
+
+    def _turn_in_flight(self) -> bool:
+        return self._turn is not None and not self._turn.done()
+
+    async def _cancel_turn(self):
+        if self._turn_in_flight():
+            self._turn.cancel()
+            try:
+                await self._turn
+            except asyncio.CancelledError:
+                pass
+        self._turn = None
+
+    async def _start_turn(self, message: str):
+        await self._cancel_turn()
+        self._turn = asyncio.create_task(self._run_turn(message))
+
+    async def _run_turn(self, message: str):
+        """Stream one answer to the client and record it in the session history"""
+        async with self.session_store.lock(self.conversation_id):
+            # Another tab or a report update may have saved the session since the last turn
+            stored = await self.session_store.get(self.conversation_id)
+            if stored is not None:
+                self.state = stored
+            await self._stream_turn(message)
+
+    async def _stream_turn(self, message: str):
+        self.state.language = self.language
+        parts: List[str] = []
+        fallback = False
+
+        try:
+            async for event in stream_conversation_turn(
+                self.gemini_service,
+                self.elevenlabs_service,
+                user_message=message,
+                language=self.language,
+                encode_audio=False,
+                session=self.state,
+                # Voice sessions carry no patient record
+                cacheable=True,
+                greetings=self.greetings,
+                audio_variant=self.audio_variant
+            ):
+                kind, data = event["event"], event["data"]
+                if kind == "text":
+                    parts.append(data["delta"])
+                    await self._send_json({"type": "text", "delta": data["delta"]})
+                elif kind == "audio":
+                    if data["sentence"] != self._audio_sentence:
+                        self._audio_sentence = data["sentence"]
+                        await self._send_json({"type": "audio_start", "sentence": data["sentence"], "format": data["format"]})
+                    await self._send_bytes(data["chunk"])
+                elif kind == "audio_end":
+                    await self._send_json({"type": "audio_end", **data})
+                elif kind == "done":
+                    fallback = data["fallback"]
+                    await self._send_json({
+                        "type": "done",
+                        "conversation_id": data["conversation_id"],
+                        "text": data["text"],
+                        "medical_context": data["medical_context"],
+                        "fallback": fallback
+                    })
+        except AdmissionRejected as e:
+            await self._send_json({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error in voice session turn: {str(e)}")
+            await self._send_json({"type": "error", "detail": str(e)})
+        finally:
+            # On barge-in, keep what was already said in the history (but never the canned apology)
+            self._audio_sentence = None
+            fallback = fallback or any(isinstance(part, FallbackText) for part in parts)
+            if not fallback:
+                self.state.record_turn(message, "".join(parts))
+                await self.session_store.save(self.state)
+                if self.reports is not None:
+                    self.reports.schedule_update(self.conversation_id)
@@ -0,0 +1,181 @@
+"""Admission control: priority ordering and load shedding"""
+
+import asyncio
+
+import pytest
+
+from services.admission import (
+    BACKGROUND, EMERGENCY, NORMAL, URGENT,
+    AdmissionRejected, UpstreamLimiter, current_priority, priority, turn_priority
+)
+from services.triage import TriageEngine
+
+
+async def queue_behind_busy_slot(limiter, levels):
+    """Occupy the only slot, queue one call per level, then free the slot; returns the grant order"""
+    order = []
+
+    async def call(name, level):
+        async with limiter.slot(level):
+            order.append(name)
+
+    await limiter.acquire(NORMAL)
+    tasks = []
+    for name, level in levels:
+        tasks.append(asyncio.create_task(call(name, level)))
+        await asyncio.sleep(0)
+    limiter.release(0.01)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return order, results
+
+
+def test_higher_priority_runs_first_and_ties_are_fifo():
+    limiter = UpstreamLimiter("test", concurrency=1)
+    levels = [("bg", BACKGROUND), ("n1", NORMAL), ("e", EMERGENCY), ("n2", NORMAL), ("u", URGENT)]
+
+    order, _ = asyncio.run(queue_behind_busy_slot(limiter, levels))
+    assert order == ["e", "u", "n1", "n2", "bg"]
+    assert limiter.stats()["admitted"] == 6
+    assert limiter.stats()["waited"] == 5
+
+
+def test_full_queue_sheds_the_arrival():
+    limiter = UpstreamLimiter("test", concurrency=1, max_queue=2)
+    levels = [("n1", NORMAL), ("n2", NORMAL), ("n3", NORMAL)]
+
+    order, results = asyncio.run(queue_behind_busy_slot(limiter, levels))
+    assert order == ["n1", "n2"]
+    assert isinstance(results[2], AdmissionRejected)
+    assert results[2].status_code == 503
+    assert results[2].reason == "queue full"
+    assert limiter.rejected["queue_full"] == 1
+
+
+def test_higher_priority_displaces_the_newest_lowest_waiter():
+    limiter = UpstreamLimiter("test", concurrency=1, max_queue=3)
+    levels = [("bg1", BACKGROUND), ("bg2", BACKGROUND), ("n", NORMAL), ("e", EMERGENCY)]
+
+    order, results = asyncio.run(queue_behind_busy_slot(limiter, levels))
+    assert order == ["e", "n", "bg1"]
+    assert isinstance(results[1], AdmissionRejected)
+    assert results[1].reason == "displaced"
+    assert limiter.rejected["displaced"] == 1
+
+
+def test_waiters_past_the_deadline_are_shed():
+    limiter = UpstreamLimiter("test", concurrency=1, queue_timeout=0.05)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        limiter.release(0.01)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.reason == "deadline"
+    assert 1 <= rejected.retry_after <= 60
+    assert limiter.stats()["queued"] == 0
+    assert limiter.stats()["active"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = UpstreamLimiter("test", concurrency=1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release(0.01)
+
+        # The next caller gets the slot right away
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+
+    asyncio.run(scenario())
+    assert limiter.stats()["queued"] == 0
+    assert limiter.stats()["active"] == 1
+
+
+def test_check_refuses_work_that_would_be_shed():
+    limiter = UpstreamLimiter("test", concurrency=1, max_queue=1)
+
+    async def scenario():
+        await limiter.acquire()
+        limiter.check(NORMAL)
+        queued = asyncio.create_task(limiter.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected):
+            limiter.check(BACKGROUND)
+        # A more urgent call would displace the background waiter
+        limiter.check(NORMAL)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_answers_429():
+    limiter = UpstreamLimiter("test", concurrency=10, rate=1, burst=1, queue_timeout=0.5)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert rejected.reason == "rate limit"
+    assert rejected.retry_after >= 1
+
+
+def test_rate_limited_waiters_start_when_tokens_refill():
+    limiter = UpstreamLimiter("test", concurrency=10, rate=50, burst=1, queue_timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        await asyncio.wait_for(limiter.acquire(), 0.5)
+
+    asyncio.run(scenario())
+    assert limiter.stats()["active"] == 2
+
+
+def test_priority_context():
+    assert current_priority() == NORMAL
+    with priority(EMERGENCY):
+        assert current_priority() == EMERGENCY
+        with priority(BACKGROUND):
+            assert current_priority() == BACKGROUND
+        assert current_priority() == EMERGENCY
+    assert current_priority() == NORMAL
+
+
+def test_calls_run_at_the_context_priority():
+    limiter = UpstreamLimiter("test", concurrency=1)
+    order = []
+
+    async def call(name, level):
+        with priority(level):
+            async with limiter.slot():
+                order.append(name)
+
+    async def scenario():
+        await limiter.acquire()
+        tasks = [asyncio.create_task(call("normal", NORMAL)), asyncio.create_task(call("emergency", EMERGENCY))]
+        await asyncio.sleep(0)
+        limiter.release(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["emergency", "normal"]
+
+
+def test_turn_priority():
+    triage = TriageEngine()
+    assert turn_priority(triage.scan("I have chest pain")) == EMERGENCY
+    assert turn_priority(triage.scan("I have a fever")) == URGENT
+    assert turn_priority(triage.scan("Hello")) == NORMAL
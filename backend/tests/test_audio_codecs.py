@@ -0,0 +1,39 @@
+"""Opus encoding through soundfile's public API"""
+
+import io
+
+import numpy as np
+import pytest
+
+from services import audio_codecs
+from services.audio_codecs import VARIANTS, split_audio_id
+
+soundfile = pytest.importorskip("soundfile")
+if "OPUS" not in soundfile.available_subtypes("OGG"):
+    pytest.skip("libsndfile has no Opus encoder", allow_module_level=True)
+
+
+def speech_like_pcm(seconds: float, sample_rate: int) -> bytes:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (8000 * np.sin(2 * np.pi * 440 * t) * np.sin(2 * np.pi * 3 * t)).astype("<i2").tobytes()
+
+
+def test_opus_bitrate_follows_quality():
+    pcm = speech_like_pcm(5, 24000)
+    sizes = [len(audio_codecs._encode_ogg_opus(pcm, 24000, kbps)) for kbps in (16, 24, 32)]
+    assert sizes == sorted(sizes)
+
+    info = soundfile.info(io.BytesIO(audio_codecs._encode_ogg_opus(pcm, 24000, 24)))
+    assert info.subtype == "OPUS"
+    assert round(info.duration) == 5
+
+
+def test_opus_without_compression_level(monkeypatch):
+    monkeypatch.setattr(audio_codecs, "_compression_level_supported", lambda: False)
+    encoded = audio_codecs._encode_ogg_opus(speech_like_pcm(1, 16000) + b"\0", 16000, 16)
+    assert soundfile.info(io.BytesIO(encoded)).subtype == "OPUS"
+
+
+def test_split_audio_id():
+    assert split_audio_id("abc") == ("abc", "audio/mpeg")
+    assert split_audio_id("abc" + VARIANTS["opus"]["low"].suffix) == ("abc", "audio/ogg;codecs=opus")
@@ -0,0 +1,232 @@
+"""Streaming WAV decoding, resampling, limits and VAD of uploaded audio"""
+
+import asyncio
+import shutil
+import struct
+
+import numpy as np
+import pytest
+
+from services import audio_ingest
+from services.audio_ingest import (
+    AudioDecodeError, AudioIngest, EnergyVAD, IngestLimitExceeded, PCMRingBuffer, StreamingResampler, filter_speech
+)
+from services.stt_engines import SAMPLE_RATE
+
+# (format tag, bits) -> encoder of float samples in [-1, 1)
+ENCODINGS = {
+    (1, 8): lambda x: (np.round(x * 127) + 128).astype(np.uint8).tobytes(),
+    (1, 16): lambda x: np.round(x * 32767).astype("<i2").tobytes(),
+    (1, 24): lambda x: b"".join(int(v).to_bytes(3, "little", signed=True) for v in np.round(x * 8388607)),
+    (1, 32): lambda x: np.round(x * 2147483647).astype("<i4").tobytes(),
+    (3, 32): lambda x: x.astype("<f4").tobytes()
+}
+
+
+def sine(seconds: float, rate: int, amplitude: float = 0.5, frequency: float = 220) -> np.ndarray:
+    return amplitude * np.sin(2 * np.pi * frequency * np.arange(int(rate * seconds)) / rate)
+
+
+def wav(channels_data, rate: int, tag: int = 1, bits: int = 16, data_size=None, extensible: bool = False) -> bytes:
+    """A WAV file of one float array per channel"""
+    frames = np.stack(channels_data, axis=1).reshape(-1)
+    data = ENCODINGS[(tag, bits)](frames)
+    channels, width = len(channels_data), bits // 8
+    if extensible:
+        fmt = struct.pack("<HHIIHHHHI", 0xFFFE, channels, rate, rate * channels * width, channels * width, bits, 22, bits, 0)
+        fmt += struct.pack("<H", tag) + b"\0\0\0\0\x10\0\x80\0\0\xaa\0\x38\x9b\x71"
+    else:
+        fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * channels * width, channels * width, bits)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    # An odd-sized chunk before data exercises the pad byte
+    body += b"LIST" + struct.pack("<I", 3) + b"abc\0"
+    body += b"data" + struct.pack("<I", len(data) if data_size is None else data_size) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class Upload:
+    """UploadFile stand-in that hands out at most step bytes per read"""
+
+    def __init__(self, data: bytes, step: int = 1000):
+        self.data = data
+        self.step = step
+        self.offset = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        size = min(size, self.step)
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+
+def ingest(data: bytes, step: int = 1000, vad=None, max_bytes: int = 10_000_000, max_seconds: float = 60):
+    audio = AudioIngest(max_bytes=max_bytes, max_seconds=max_seconds, vad=vad)
+
+    async def collect():
+        return b"".join([chunk async for chunk in audio.voiced_pcm(Upload(data, step))])
+
+    pcm = np.frombuffer(asyncio.run(collect()), dtype="<i2")
+    return audio, pcm
+
+
+def rms(samples: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)) / 32768)
+
+
+@pytest.mark.parametrize("tag,bits", list(ENCODINGS))
+@pytest.mark.parametrize("rate", [8000, 22050, 44100])
+def test_decodes_every_encoding_and_rate(tag, bits, rate):
+    audio, pcm = ingest(wav([sine(1, rate)], rate, tag, bits), step=777)
+
+    assert abs(len(pcm) - SAMPLE_RATE) <= 2
+    assert audio.duration_seconds == pytest.approx(1, abs=0.001)
+    assert rms(pcm) == pytest.approx(0.5 / np.sqrt(2), rel=0.02)
+
+
+def test_resampled_signal_keeps_its_shape():
+    _, pcm = ingest(wav([sine(1, 48000)], 48000), step=513)
+    expected = sine(1, SAMPLE_RATE) * 32768
+    assert np.max(np.abs(pcm[:len(expected)] - expected[:len(pcm)])) < 0.01 * 32768
+
+
+def test_stereo_is_mixed_down():
+    left, right = sine(1, 24000), np.zeros(24000)
+    _, pcm = ingest(wav([left, right], 24000, bits=24))
+    assert rms(pcm) == pytest.approx(0.25 / np.sqrt(2), rel=0.02)
+
+
+def test_extensible_format():
+    _, pcm = ingest(wav([sine(0.5, 16000)], 16000, tag=3, bits=32, extensible=True))
+    assert len(pcm) == 8000
+
+
+@pytest.mark.parametrize("data_size", [0, 0xFFFFFFFF])
+def test_streamed_data_size_reads_to_the_end(data_size):
+    _, pcm = ingest(wav([sine(1, 16000)], 16000, data_size=data_size), step=4096)
+    assert len(pcm) == SAMPLE_RATE
+
+
+def test_data_size_bounds_the_samples():
+    data = wav([sine(1, 16000)], 16000, data_size=16000) + b"\1" * 1000
+    _, pcm = ingest(data)
+    assert len(pcm) == 8000
+
+
+@pytest.mark.parametrize("data", [
+    b"RIFF\0\0\0\0WAVEfmt \x10\0\0\0\1\0",
+    b"RIFF\0\0\0\0WAVE",
+])
+def test_truncated_header(data):
+    with pytest.raises(AudioDecodeError):
+        ingest(data, step=7)
+
+
+def test_data_before_format():
+    with pytest.raises(AudioDecodeError):
+        ingest(b"RIFF\0\0\0\0WAVEdata\4\0\0\0\0\0\0\0")
+
+
+def test_unsupported_encoding():
+    data = wav([sine(0.1, 16000)], 16000)
+    data = data[:20] + struct.pack("<H", 2) + data[22:]  # ADPCM
+    with pytest.raises(AudioDecodeError):
+        ingest(data)
+
+
+def test_max_bytes():
+    data = wav([sine(2, 16000)], 16000)
+    upload_reads = []
+
+    class CountingUpload(Upload):
+        async def read(self, size=-1):
+            chunk = await super().read(size)
+            upload_reads.append(len(chunk))
+            return chunk
+
+    audio = AudioIngest(max_bytes=10_000, max_seconds=60)
+
+    async def collect():
+        return [chunk async for chunk in audio.voiced_pcm(CountingUpload(data))]
+
+    with pytest.raises(IngestLimitExceeded):
+        asyncio.run(collect())
+    # Reading stops at the first read past the limit
+    assert sum(upload_reads) <= 11_000
+
+
+def test_max_seconds():
+    with pytest.raises(IngestLimitExceeded):
+        ingest(wav([sine(3, 8000)], 8000), max_seconds=2)
+
+
+def test_empty_upload():
+    with pytest.raises(AudioDecodeError):
+        ingest(b"")
+
+
+def test_compressed_audio_needs_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_ingest.shutil, "which", lambda name: None)
+    with pytest.raises(AudioDecodeError):
+        ingest(b"OggS" + b"\0" * 100)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_ffmpeg_pipe():
+    import io
+    import soundfile
+
+    buffer = io.BytesIO()
+    soundfile.write(buffer, sine(1, 44100), 44100, format="FLAC")
+    _, pcm = ingest(buffer.getvalue(), step=2048)
+    assert abs(len(pcm) - SAMPLE_RATE) <= 100
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_ffmpeg_rejects_garbage():
+    with pytest.raises(AudioDecodeError):
+        ingest(b"\x1a\x45\xdf\xa3" + b"\0" * 1000)
+
+
+def test_vad_drops_silence():
+    rate = 16000
+    signal = np.concatenate([np.zeros(rate), sine(1, rate), np.zeros(2 * rate)])
+    audio, pcm = ingest(wav([signal], rate), vad=EnergyVAD())
+
+    assert audio.duration_seconds == pytest.approx(4, abs=0.01)
+    # The tone, plus pre-roll and hangover at its edges
+    assert 1.0 <= audio.speech_seconds <= 1.5
+    assert len(pcm) == audio.samples_kept
+
+
+def test_vad_keeps_nothing_of_silence_and_quiet_noise():
+    noise = np.random.default_rng(0).normal(0, 0.001, 16000 * 2)
+    audio, pcm = ingest(wav([noise], 16000), vad=EnergyVAD())
+    assert audio.speech_seconds == 0
+    assert len(pcm) == 0
+
+
+def test_filter_speech():
+    samples = (np.concatenate([np.zeros(16000), sine(0.5, 16000)]) * 32767).astype(np.int16)
+    kept = filter_speech(samples, EnergyVAD(preroll_ms=0, hangover_ms=30))
+    assert 8000 <= len(kept) <= 8000 + 480 * 2
+
+
+def test_ring_buffer_wraps():
+    ring = PCMRingBuffer(5)
+    assert ring.write(np.arange(4, dtype=np.int16)) == 4
+    assert list(ring.read(3)) == [0, 1, 2]
+    assert ring.write(np.arange(10, 20, dtype=np.int16)) == 4
+    assert ring.free == 0
+    assert list(ring.read(10)) == [3, 10, 11, 12, 13]
+    assert len(ring) == 0
+
+
+def test_resampler_is_continuous_across_blocks():
+    signal = sine(1, 44100)
+    whole = StreamingResampler(44100).process(signal)
+    resampler = StreamingResampler(44100)
+    pieces = np.concatenate([resampler.process(signal[i:i + 1000]) for i in range(0, len(signal), 1000)])
+
+    assert abs(len(pieces) - len(whole)) <= 1
+    length = min(len(pieces), len(whole))
+    assert np.allclose(pieces[:length], whole[:length])
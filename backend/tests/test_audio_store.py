@@ -0,0 +1,154 @@
+"""Audio artifact store and GET /api/audio/{id} (Range, ETag, expiry)"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from services.audio_store import AudioArtifactStore, parse_range_header
+from services.tts_cache import TTSCache
+
+AUDIO = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store():
+    return AudioArtifactStore(ttl_seconds=60, max_bytes=10_000)
+
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    app.add_api_route("/api/audio/{audio_id}", main.get_audio)
+    app.state.services = SimpleNamespace(audio_store=store, tts_cache=None)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None)
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=10-5", "bytes=-0", "bytes=a-b"])
+def test_parse_range_header_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range_header(header, 1024)
+
+
+def test_full_body(client, store):
+    artifact = store.put(AUDIO, artifact_id="a1")
+    response = client.get("/api/audio/a1")
+
+    assert response.status_code == 200
+    assert response.content == AUDIO
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == artifact.etag
+    assert response.headers["content-length"] == str(len(AUDIO))
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert "expires" in response.headers
+
+
+def test_range_request(client, store):
+    store.put(AUDIO, artifact_id="a1")
+    response = client.get("/api/audio/a1", headers={"Range": "bytes=10-19"})
+
+    assert response.status_code == 206
+    assert response.content == AUDIO[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(AUDIO)}"
+    assert response.headers["content-length"] == "10"
+
+
+def test_unsatisfiable_range(client, store):
+    store.put(AUDIO, artifact_id="a1")
+    response = client.get("/api/audio/a1", headers={"Range": f"bytes={len(AUDIO)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(AUDIO)}"
+
+
+def test_if_none_match(client, store):
+    artifact = store.put(AUDIO, artifact_id="a1")
+    response = client.get("/api/audio/a1", headers={"If-None-Match": artifact.etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == artifact.etag
+
+
+def test_if_range(client, store):
+    artifact = store.put(AUDIO, artifact_id="a1")
+
+    fresh = client.get("/api/audio/a1", headers={"Range": "bytes=0-9", "If-Range": artifact.etag})
+    assert fresh.status_code == 206
+
+    # A stale validator gets the whole, current body
+    stale = client.get("/api/audio/a1", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert stale.status_code == 200
+    assert stale.content == AUDIO
+
+
+def test_missing_audio(client):
+    assert client.get("/api/audio/nope").status_code == 404
+
+
+def test_expired_audio_is_not_revived_from_the_tts_cache(tmp_path):
+    store = AudioArtifactStore(ttl_seconds=0)
+    tts_cache = TTSCache(disk_dir=str(tmp_path))
+    asyncio.run(tts_cache.put("a1", AUDIO))
+    store.put(AUDIO, artifact_id="a1")
+
+    app = FastAPI()
+    app.add_api_route("/api/audio/{audio_id}", main.get_audio)
+    app.state.services = SimpleNamespace(audio_store=store, tts_cache=tts_cache)
+
+    assert TestClient(app).get("/api/audio/a1").status_code == 404
+    assert tts_cache.stats()["hits_memory"] + tts_cache.stats()["hits_disk"] == 0
+
+
+def test_etag_follows_content(store):
+    first = store.put(AUDIO, artifact_id="a1")
+    assert store.put(AUDIO, artifact_id="a2").etag == first.etag
+    assert store.put(AUDIO[:10], artifact_id="a3").etag != first.etag
+
+
+def test_expired_artifacts_are_gone():
+    store = AudioArtifactStore(ttl_seconds=0)
+    store.put(AUDIO, artifact_id="a1")
+    assert store.get("a1") is None
+    assert store.stats()["bytes"] == 0
+
+
+def test_oldest_artifacts_are_evicted(store):
+    for index in range(12):
+        store.put(AUDIO, artifact_id=f"a{index}")
+
+    assert store.stats() == {"artifacts": 9, "bytes": 9 * len(AUDIO), "pending": 0}
+    assert store.get("a0") is None and store.get("a2") is None
+    assert store.get("a3") is not None
+
+
+def test_wait_for_reserved_artifact(store):
+    async def scenario():
+        store.reserve("late")
+        store.reserve("failed")
+        waiting = asyncio.gather(store.wait_for("late", 1), store.wait_for("failed", 1), store.wait_for("never", 1))
+        await asyncio.sleep(0)
+        store.put(AUDIO, artifact_id="late")
+        store.fail("failed")
+        return await waiting
+
+    late, failed, never = asyncio.run(scenario())
+    assert late.data == AUDIO
+    assert failed is None and never is None
@@ -0,0 +1,119 @@
+"""Archive expansion, upload limits and the batch pipeline"""
+
+import io
+import wave
+import asyncio
+import zipfile
+
+from services.batch_transcription import BatchTranscriber, expand_archives
+from services.speech_service import SpeechService
+from services.stt_engines import StubEngine, SAMPLE_RATE, SAMPLE_WIDTH
+
+
+def wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(b"\0\1" * int(SAMPLE_RATE * seconds))
+    return buffer.getvalue()
+
+
+def archive(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as f:
+        for name, data in members:
+            f.writestr(name, data)
+    return buffer.getvalue()
+
+
+class Upload:
+    """Minimal UploadFile stand-in that tracks how much was read"""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self._file = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    @property
+    def bytes_read(self) -> int:
+        return self._file.tell()
+
+
+def test_expand_archives():
+    files = [
+        ("a.wav", b"RIFF" + b"\0" * 10),
+        ("b.zip", archive([("one.wav", b"1" * 10), ("dir/two.wav", b"2" * 10), ("__MACOSX/x", b"")])),
+        ("bad.zip", b"PK\3\4 not really")
+    ]
+    recordings, rejected = expand_archives(files, max_files=10, max_file_bytes=100)
+
+    assert [name for name, _ in recordings] == ["a.wav", "b.zip/one.wav", "b.zip/dir/two.wav"]
+    assert rejected == [{"filename": "bad.zip", "error": "Invalid zip archive"}]
+
+
+def test_expand_archives_stops_at_file_limit():
+    files = [("c.zip", archive([(f"{index}.wav", b"x") for index in range(5)]))]
+    recordings, rejected = expand_archives(files, max_files=2, max_file_bytes=100)
+
+    assert len(recordings) == 2
+    assert [entry["error"] for entry in rejected] == ["Batch is limited to 2 files"] * 3
+
+
+def test_expand_archives_ignores_declared_size():
+    data = bytearray(archive([("big.wav", b"\0" * 10000)]))
+    # Understate the uncompressed size in the central directory
+    entry = data.rfind(b"PK\1\2")
+    data[entry + 24:entry + 28] = (10).to_bytes(4, "little")
+
+    recordings, rejected = expand_archives([("d.zip", bytes(data))], max_files=10, max_file_bytes=100)
+    assert recordings == []
+    assert rejected[0]["filename"] == "d.zip/big.wav"
+
+
+def test_read_uploads_enforces_limits():
+    transcriber = BatchTranscriber(None, max_files=2, max_file_bytes=1000)
+    large = Upload("large.wav", b"\0" * 1_000_000)
+    skipped = Upload("third.wav", b"\0" * 10)
+    uploads = [Upload("small.wav", b"\0" * 10), large, skipped]
+
+    files, rejected = asyncio.run(transcriber.read_uploads(uploads))
+
+    assert files == [("small.wav", b"\0" * 10)]
+    assert [entry["filename"] for entry in rejected] == ["large.wav", "third.wav"]
+    assert large.bytes_read < 200_000
+    assert skipped.bytes_read == 0
+
+
+def test_read_uploads_allows_archives_up_to_the_batch_size():
+    transcriber = BatchTranscriber(None, max_files=4, max_file_bytes=1000)
+    data = archive([(f"{index}.wav", bytes(range(256)) * 3) for index in range(4)])
+    assert len(data) > 1000
+
+    files, rejected = asyncio.run(transcriber.read_uploads([Upload("e.zip", data)]))
+    assert files == [("e.zip", data)]
+    assert rejected == []
+
+
+def test_transcribe_end_to_end():
+    speech = SpeechService(StubEngine(text="hello"), max_workers=1)
+    transcriber = BatchTranscriber(speech, max_workers=1, batch_size=2, vad_threshold_db=None)
+    files = [("a.wav", wav(1)), ("f.zip", archive([("b.wav", wav(1)), ("c.wav", wav(2))])), ("bad.wav", b"junk")]
+    refused = [{"filename": "x.wav", "error": "refused"}]
+
+    async def collect():
+        return [result async for result in transcriber.transcribe(files, "en", refused)]
+
+    try:
+        results = sorted(asyncio.run(collect()), key=lambda result: result["index"])
+    finally:
+        transcriber.close()
+        speech.close()
+
+    assert [result["filename"] for result in results] == ["a.wav", "f.zip/b.wav", "f.zip/c.wav", "bad.wav", "x.wav"]
+    assert [result.get("transcription") for result in results[:3]] == ["hello"] * 3
+    assert "error" in results[3]
+    assert results[4]["error"] == "refused"
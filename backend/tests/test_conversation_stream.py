@@ -0,0 +1,45 @@
+"""Streamed turns: done payload and the fallback marker"""
+
+import asyncio
+
+from services.conversation_stream import stream_conversation_turn
+from services.gemini_service import FallbackText
+from services.session_store import SessionState
+from services.triage import TriageEngine
+
+
+class FakeGemini:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.triage = TriageEngine()
+
+    async def stream_medical_response(self, **kwargs):
+        for delta in self.deltas:
+            yield delta
+
+    def _analyze_medical_context(self, user_message, text, language):
+        return {"analyzed": True}
+
+
+def done_event(deltas):
+    async def run():
+        events = [event async for event in stream_conversation_turn(
+            FakeGemini(deltas), None, user_message="I feel dizzy", session=SessionState("c1")
+        )]
+        return events[-1]
+
+    return asyncio.run(run())
+
+
+def test_answer_is_not_fallback():
+    done = done_event(["You may be ", "dehydrated."])
+    assert done["event"] == "done"
+    assert done["data"]["text"] == "You may be dehydrated."
+    assert done["data"]["fallback"] is False
+    assert done["data"]["medical_context"] == {"analyzed": True}
+
+
+def test_fallback_is_marked():
+    done = done_event([FallbackText("I apologize, try again.")])
+    assert done["data"]["fallback"] is True
+    assert done["data"]["medical_context"] == {"error": True}
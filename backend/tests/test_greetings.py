@@ -0,0 +1,61 @@
+"""When the first turn is answered with a pre-rendered greeting"""
+
+import pytest
+
+from services.greetings import Greeting, GreetingStore, is_small_talk
+from services.session_store import SessionState
+from services.triage import TriageEngine
+
+
+@pytest.mark.parametrize("message,language", [
+    ("Hello", "en"),
+    ("hi doctor, how are you?", "en"),
+    ("Good morning Dr. MediVoice!", "en"),
+    ("Hola, buenos días", "es"),
+    ("Bonjour docteur, ça va ?", "fr"),
+    ("Guten Morgen, Herr Doktor", "de"),
+    ("Здравствуйте, доктор", "ru"),
+    ("您好，医生", "zh"),
+    ("こんにちは、先生", "ja")
+])
+def test_small_talk(message, language):
+    assert is_small_talk(message, language)
+
+
+@pytest.mark.parametrize("message,language", [
+    ("Hi, I have a headache since yesterday", "en"),
+    ("hello my child has a fever", "en"),
+    ("Hola, tengo tos", "es"),
+    ("医生，我头疼", "zh"),
+    ("こんにちは、頭が痛いです", "ja"),
+    ("", "en")
+])
+def test_not_small_talk(message, language):
+    assert not is_small_talk(message, language)
+
+
+def store() -> GreetingStore:
+    greetings = GreetingStore()
+    greetings._greetings = {"en": [Greeting("Hello! How can I help?")]}
+    return greetings
+
+
+def test_greets_only_a_small_talk_first_message():
+    greetings, triage = store(), TriageEngine()
+    session = SessionState("c1")
+
+    def will_greet(message):
+        return greetings.will_greet(session, message, "en", triage.scan(message, "en"))
+
+    assert will_greet("Hello doctor")
+    assert not will_greet("Hello, I have chest pain")
+    assert not will_greet("I feel dizzy")
+
+    session.record_turn("Hello doctor", "Hello! How can I help?")
+    assert not will_greet("Hello again")
+
+
+def test_no_greeting_without_variants():
+    triage = TriageEngine()
+    assert store().greeting_for(SessionState("c1", "fr"), "Bonjour", "fr", triage.scan("Bonjour", "fr")) is None
+    assert store().greeting_for(SessionState("c1"), "Hi", "en", triage.scan("Hi", "en"))["text"] == "Hello! How can I help?"
@@ -0,0 +1,132 @@
+"""Stage instrumentation and the /metrics endpoint"""
+
+import asyncio
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from services.metrics import (
+    STAGE_IN_FLIGHT, STAGE_SECONDS, UPSTREAM_ERRORS, MetricsMiddleware, MetricsRegistry, instrument
+)
+
+
+def scrape():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, server_timing=True)
+    app.add_api_route("/metrics", main.get_metrics)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return response.text
+
+
+def sample(text: str, line: str) -> float:
+    match = re.search("^" + re.escape(line) + r" (\S+)$", text, re.MULTILINE)
+    assert match, f"{line} is not exposed"
+    return float(match.group(1))
+
+
+@instrument("test_sync_stage", upstream="test_upstream")
+def sync_stage(fail: bool = False):
+    if fail:
+        raise ValueError("boom")
+    return "ok"
+
+
+@instrument("test_async_stage", upstream="test_upstream")
+async def async_stage(fail: bool = False):
+    await asyncio.sleep(0)
+    if fail:
+        raise TimeoutError()
+    return "ok"
+
+
+def test_instrument_records_success_and_error():
+    assert sync_stage() == "ok"
+    with pytest.raises(ValueError):
+        sync_stage(fail=True)
+    assert asyncio.run(async_stage()) == "ok"
+    with pytest.raises(TimeoutError):
+        asyncio.run(async_stage(fail=True))
+
+    # Both outcomes are timed, and only failures count as upstream errors
+    assert STAGE_SECONDS.count(stage="test_sync_stage") == 2
+    assert STAGE_SECONDS.count(stage="test_async_stage") == 2
+    assert UPSTREAM_ERRORS.value(upstream="test_upstream", error="ValueError") == 1
+    assert UPSTREAM_ERRORS.value(upstream="test_upstream", error="TimeoutError") == 1
+    assert STAGE_IN_FLIGHT.value(stage="test_sync_stage") == 0
+    assert STAGE_IN_FLIGHT.value(stage="test_async_stage") == 0
+
+
+def test_cancellation_is_not_an_upstream_error():
+    @instrument("test_cancelled_stage", upstream="test_cancelled")
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(hang())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert STAGE_SECONDS.count(stage="test_cancelled_stage") == 1
+    assert UPSTREAM_ERRORS.value(upstream="test_cancelled", error="CancelledError") == 0
+
+
+def test_endpoint_exposes_stage_histograms():
+    @instrument("test_scraped_stage", upstream="test_scraped")
+    def scraped(fail=False):
+        if fail:
+            raise RuntimeError("boom")
+
+    scraped()
+    with pytest.raises(RuntimeError):
+        scraped(fail=True)
+    text = scrape()
+
+    assert "# TYPE medivoice_stage_duration_seconds histogram" in text
+    assert sample(text, 'medivoice_stage_duration_seconds_count{stage="test_scraped_stage"}') == 2
+    assert sample(text, 'medivoice_stage_duration_seconds_bucket{stage="test_scraped_stage",le="+Inf"}') == 2
+    assert sample(text, 'medivoice_stage_duration_seconds_sum{stage="test_scraped_stage"}') >= 0
+    assert sample(text, 'medivoice_stage_in_flight{stage="test_scraped_stage"}') == 0
+    assert sample(text, 'medivoice_upstream_errors_total{upstream="test_scraped",error="RuntimeError"}') == 1
+
+    # Buckets are cumulative
+    buckets = [
+        float(value) for value in
+        re.findall(r'^medivoice_stage_duration_seconds_bucket\{stage="test_scraped_stage",le="[^"]+"\} (\S+)$', text, re.MULTILINE)
+    ]
+    assert buckets == sorted(buckets)
+
+
+def test_endpoint_exposes_request_durations():
+    scrape()
+    text = scrape()
+    assert sample(text, 'medivoice_http_request_duration_seconds_count{method="GET",route="/metrics",status="200"}') >= 1
+
+
+def test_histogram_rendering():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage="a")
+    registry.add_collector(lambda: [("cache_hits_total", "counter", "Cache hits", [({"cache": "tts"}, 3)])])
+    registry.add_collector(lambda: 1 / 0)
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="a",le="0.1"} 1',
+        'latency_seconds_bucket{stage="a",le="1"} 3',
+        'latency_seconds_bucket{stage="a",le="+Inf"} 4',
+        'latency_seconds_sum{stage="a"} 6.05',
+        'latency_seconds_count{stage="a"} 4',
+        "# HELP cache_hits_total Cache hits",
+        "# TYPE cache_hits_total counter",
+        'cache_hits_total{cache="tts"} 3'
+    ]
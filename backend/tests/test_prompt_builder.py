@@ -0,0 +1,55 @@
+"""Rolling summary of folded messages"""
+
+import pytest
+
+from services.prompt_builder import PromptBuilder, empty_summary
+from services.triage import TriageEngine
+
+
+@pytest.fixture(scope="module")
+def builder():
+    return PromptBuilder(triage=TriageEngine())
+
+
+def fold(builder, messages, language="en"):
+    summary = empty_summary()
+    for content in messages:
+        builder.fold(summary, {"role": "user", "content": content}, language)
+    return summary
+
+
+def test_everyday_symptoms_are_summarized(builder):
+    summary = fold(builder, ["I've had a headache and a cough for 3 days", "Now some dizziness and a mild fever"])
+
+    assert summary["symptoms"] == ["headache", "cough", "dizziness", "fever"]
+    assert summary["durations"] == ["for 3 days"]
+    assert summary["severity"] == ["mild"]
+
+
+def test_negated_symptoms_are_skipped(builder):
+    summary = fold(builder, ["Sore throat, but no fever and I don't have a cough"])
+    assert summary["symptoms"] == ["Sore throat"]
+
+
+def test_red_flags_and_symptoms_are_merged(builder):
+    summary = fold(builder, ["I have chest pain and back pain, also nausea"])
+    assert [term.casefold() for term in summary["symptoms"]] == ["chest pain", "back pain", "nausea"]
+
+
+def test_symptoms_in_other_languages(builder):
+    assert fold(builder, ["Tengo dolor de cabeza y tos"], "es")["symptoms"] == ["dolor de cabeza", "tos"]
+    assert fold(builder, ["我头疼，还咳嗽"], "zh")["symptoms"] == ["头疼", "咳嗽"]
+    # English is matched for every language (code-switching)
+    assert fold(builder, ["J'ai de la fièvre et un headache"], "fr")["symptoms"] == ["fièvre", "headache"]
+
+
+def test_symptoms_are_not_repeated(builder):
+    summary = fold(builder, ["Headache again", "the headache is worse"])
+    assert summary["symptoms"] == ["Headache"]
+
+
+def test_model_messages_only_add_advice(builder):
+    summary = empty_summary()
+    builder.fold(summary, {"role": "assistant", "content": "Rest and drink fluids. A fever should pass."})
+    assert summary["symptoms"] == []
+    assert summary["advice"] == ["Rest and drink fluids."]
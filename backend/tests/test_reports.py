@@ -0,0 +1,332 @@
+"""Report parsing, validation and the background report jobs"""
+
+import asyncio
+import json
+
+import pytest
+
+from services.admission import AdmissionRejected
+from services.reports import ConsultationReport, ReportJobManager, ReportParseError, ReportQueueFull, parse_report
+
+REPORT = {
+    "patient_symptoms": "Headache for two days",
+    "diagnosis": "Tension headache",
+    "medications": ["Paracetamol"],
+    "lifestyle_advice": "Rest and drink water",
+    "precautions": "Seek care if vision changes",
+    "follow_up": "In one week"
+}
+
+HISTORY = [{"role": "user", "content": "I have a headache"}, {"role": "assistant", "content": "Rest and drink water"}]
+
+
+class FakeGemini:
+    """Answers report prompts with canned model output, through the real parser"""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.transcripts = []
+        # Cleared to hold generations until the test releases them
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def _answer(self, transcript):
+        self.transcripts.append(transcript)
+        await self.release.wait()
+        output = self.outputs.pop(0) if len(self.outputs) > 1 else self.outputs[0]
+        if isinstance(output, Exception):
+            raise output
+        return parse_report(output)
+
+    async def generate_consultation_report(self, conversation_history=None, transcript=None):
+        return await self._answer(transcript)
+
+    async def update_consultation_report(self, report, transcript):
+        return await self._answer(transcript)
+
+
+def test_parse_report_in_prose_and_code_fence():
+    text = "Here is the report:\n```json\n" + json.dumps(REPORT) + "\n```\nLet me know if you need more."
+    assert parse_report(text) == ConsultationReport(**REPORT)
+
+
+def test_parse_report_coerces_loose_fields():
+    report = parse_report(json.dumps({
+        "patient_symptoms": ["Headache", "Nausea"],
+        "diagnosis": None,
+        "medications": "Paracetamol, Ibuprofen, "
+    }))
+    assert report.patient_symptoms == "Headache Nausea"
+    assert report.diagnosis == ""
+    assert report.medications == ["Paracetamol", "Ibuprofen"]
+    # Missing fields default to empty
+    assert report.follow_up == ""
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "I cannot produce a report for this conversation.",
+    "} reversed {",
+    # Cut off mid-answer (output token limit)
+    '{"patient_symptoms": "Headache", "diagnosis": "Tens',
+    '{"patient_symptoms": "Headache",}',
+])
+def test_parse_report_rejects_malformed_output(text):
+    with pytest.raises(ReportParseError):
+        parse_report(text)
+
+
+@pytest.mark.parametrize("data", [
+    ["not", "an", "object"],
+    {"medications": 5},
+    {"medications": [{"name": "Paracetamol"}]},
+    {"diagnosis": {"primary": "Tension headache"}},
+])
+def test_parse_report_rejects_invalid_fields(data):
+    with pytest.raises(ReportParseError):
+        parse_report("Report: " + json.dumps(data))
+
+
+def test_job_status_transitions():
+    async def run():
+        gemini = FakeGemini(json.dumps(REPORT))
+        gemini.release.clear()
+        manager = ReportJobManager(gemini, workers=1)
+        job = manager.submit(HISTORY)
+        statuses = []
+
+        async def watch():
+            async for state in manager.watch(job):
+                statuses.append(state["status"])
+
+        watcher = asyncio.create_task(watch())
+        assert job.status == "queued"
+        manager.start()
+        await asyncio.sleep(0)
+        assert job.status == "running"
+        assert job.finished_at is None
+        gemini.release.set()
+        await manager.wait(job)
+        await watcher
+        await manager.close()
+        return job, statuses
+
+    job, statuses = asyncio.run(run())
+    assert statuses == ["queued", "running", "done"]
+    assert job.to_dict()["report"] == REPORT
+    assert job.error is None
+    assert job.finished_at is not None
+    # Dropped once the report exists
+    assert job.transcript is None
+
+
+def test_identical_transcripts_share_a_job():
+    async def run():
+        gemini = FakeGemini(json.dumps(REPORT))
+        manager = ReportJobManager(gemini, workers=1)
+        manager.start()
+        first = manager.submit(HISTORY)
+        second = manager.submit(list(HISTORY))
+        await manager.wait(first)
+        third = manager.submit(HISTORY)
+        await manager.close()
+        return gemini, manager, first, second, third
+
+    gemini, manager, first, second, third = asyncio.run(run())
+    assert first is second is third
+    assert len(gemini.transcripts) == 1
+    assert manager.stats()["reused"] == 2
+
+
+def test_malformed_model_output_fails_the_job_and_is_retried():
+    async def run():
+        gemini = FakeGemini('{"patient_symptoms": "Head', json.dumps(REPORT))
+        manager = ReportJobManager(gemini, workers=1)
+        manager.start()
+        failed = await manager.wait(manager.submit(HISTORY))
+        failed_state = failed.to_dict()
+        # A failed job is not reused for the same transcript
+        retried = await manager.wait(manager.submit(HISTORY))
+        await manager.close()
+        return failed, failed_state, retried
+
+    failed, failed_state, retried = asyncio.run(run())
+    assert failed_state["status"] == "failed"
+    assert failed_state["error"] == "Failed to generate report"
+    assert failed_state["report"] is None
+    assert retried is not failed
+    assert retried.status == "done"
+
+
+def test_shed_job_carries_retry_after():
+    async def run():
+        gemini = FakeGemini(AdmissionRejected("gemini", "queue full", 503, 7))
+        manager = ReportJobManager(gemini, workers=1)
+        manager.start()
+        job = await manager.wait(manager.submit(HISTORY))
+        await manager.close()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == "failed"
+    assert job.retry_after == 7
+
+
+def test_queue_full():
+    async def run():
+        manager = ReportJobManager(FakeGemini(json.dumps(REPORT)), max_queue=1)
+        manager.submit(HISTORY)
+        with pytest.raises(ReportQueueFull):
+            manager.submit(HISTORY + [{"role": "user", "content": "and a fever"}])
+        await manager.close()
+
+    asyncio.run(run())
+
+
+def test_close_fails_queued_jobs():
+    async def run():
+        manager = ReportJobManager(FakeGemini(json.dumps(REPORT)))
+        job = manager.submit(HISTORY)
+        await manager.close()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == "failed"
+    assert job.error == "Report generation was cancelled"
+
+
+def turn(index):
+    return [{"role": "user", "content": f"question {index}"}, {"role": "assistant", "content": f"answer {index}"}]
+
+
+async def session_with_turns(store, count, max_messages=200):
+    from services.session_store import SessionState
+
+    session = await store.get("c1") or SessionState("c1")
+    for index in range(count):
+        session.record_turn(f"question {index}", f"answer {index}", max_messages=max_messages)
+    await store.save(session)
+    return session
+
+
+def test_session_report_sends_only_new_messages():
+    from services.session_store import InMemorySessionStore
+
+    async def run():
+        store = InMemorySessionStore()
+        gemini = FakeGemini(json.dumps(REPORT))
+        manager = ReportJobManager(gemini, session_store=store)
+        session = await session_with_turns(store, 2)
+        await manager.schedule_update("c1")
+        first = session.reported_count
+
+        session.record_turn("question 2", "answer 2")
+        await store.save(session)
+        await manager.schedule_update("c1")
+        await manager.close()
+        return gemini, session, first
+
+    gemini, session, first = asyncio.run(run())
+    assert first == 4
+    assert session.reported_count == 6
+    assert session.report == REPORT
+    assert gemini.transcripts[1] == "USER: question 2\nASSISTANT: answer 2"
+
+
+def test_reported_count_survives_trimming():
+    from services.session_store import InMemorySessionStore
+
+    async def run():
+        store = InMemorySessionStore()
+        gemini = FakeGemini(json.dumps(REPORT))
+        manager = ReportJobManager(gemini, session_store=store)
+        session = await session_with_turns(store, 3, max_messages=6)
+        await manager.schedule_update("c1")
+        assert session.reported_count == 6
+
+        # Two more turns push the four oldest messages out
+        session.record_turn("question 3", "answer 3", max_messages=6)
+        session.record_turn("question 4", "answer 4", max_messages=6)
+        await store.save(session)
+        trimmed = session.reported_count
+        await manager.schedule_update("c1")
+        await manager.close()
+        return gemini, session, trimmed
+
+    gemini, session, trimmed = asyncio.run(run())
+    assert trimmed == 2
+    assert session.history[0]["content"] == "question 2"
+    assert gemini.transcripts[1] == "USER: question 3\nASSISTANT: answer 3\nUSER: question 4\nASSISTANT: answer 4"
+    assert session.reported_count == len(session.history) == 6
+
+
+def test_turns_trimmed_during_an_update():
+    from services.session_store import InMemorySessionStore
+
+    async def run():
+        store = InMemorySessionStore()
+        gemini = FakeGemini(json.dumps(REPORT))
+        manager = ReportJobManager(gemini, session_store=store)
+        session = await session_with_turns(store, 2, max_messages=4)
+
+        gemini.release.clear()
+        update = manager.schedule_update("c1")
+        await asyncio.sleep(0)
+        # A turn lands (and drops the oldest one) while the model is answering
+        session.record_turn("question 2", "answer 2", max_messages=4)
+        await store.save(session)
+        manager.schedule_update("c1")
+        gemini.release.set()
+        await update
+        await manager.close()
+        return gemini, session
+
+    gemini, session = asyncio.run(run())
+    assert gemini.transcripts == [
+        "USER: question 0\nASSISTANT: answer 0\nUSER: question 1\nASSISTANT: answer 1",
+        # The follow-up pass only sends the turn that was not covered
+        "USER: question 2\nASSISTANT: answer 2"
+    ]
+    assert session.reported_count == len(session.history) == 4
+
+
+def test_failed_update_keeps_the_delta():
+    from services.session_store import InMemorySessionStore
+
+    async def run():
+        store = InMemorySessionStore()
+        gemini = FakeGemini("no report today", json.dumps(REPORT))
+        manager = ReportJobManager(gemini, session_store=store)
+        session = await session_with_turns(store, 1)
+        manager.start()
+        failed = await manager.wait(manager.submit_session(session))
+        count_after_failure = session.reported_count
+        done = await manager.wait(manager.submit_session(session))
+        await manager.close()
+        return gemini, failed, count_after_failure, done, session
+
+    gemini, failed, count_after_failure, done, session = asyncio.run(run())
+    assert failed.status == "failed"
+    assert count_after_failure == 0
+    assert done.status == "done"
+    assert gemini.transcripts[1] == gemini.transcripts[0]
+    assert session.reported_count == 2
+
+
+def test_up_to_date_session_report_needs_no_model_call():
+    from services.session_store import InMemorySessionStore
+
+    async def run():
+        store = InMemorySessionStore()
+        gemini = FakeGemini(json.dumps(REPORT))
+        manager = ReportJobManager(gemini, session_store=store)
+        session = await session_with_turns(store, 1)
+        await manager.schedule_update("c1")
+        job = manager.submit_session(session)
+        await manager.close()
+        return gemini, job
+
+    gemini, job = asyncio.run(run())
+    assert job.status == "done"
+    assert job.report == ConsultationReport(**REPORT)
+    assert len(gemini.transcripts) == 1
@@ -0,0 +1,236 @@
+"""Retries, hedging and circuit breaker transitions of UpstreamPolicy"""
+
+import time
+import asyncio
+
+import pytest
+
+from services.resilience import (
+    CLOSED, HALF_OPEN, OPEN, HEDGE_MIN_SAMPLES,
+    CircuitBreaker, CircuitOpen, UpstreamPolicy, is_retryable
+)
+from services.speech_service import SpeechService
+from services.stt_engines import StubEngine, SAMPLE_RATE, SAMPLE_WIDTH
+
+
+class Upstream:
+    """Callable factory that fails a number of times before answering"""
+
+    def __init__(self, failures=0, error=TimeoutError, delay=0.0):
+        self.failures = failures
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise self.error()
+        return f"answer {self.calls}"
+
+
+def policy(**kwargs) -> UpstreamPolicy:
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.001)
+    return UpstreamPolicy("test", **kwargs)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+def test_is_retryable():
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectionError())
+    assert is_retryable(StatusError(503))
+    assert is_retryable(StatusError(429))
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError())
+    assert not is_retryable(CircuitOpen("test", 1))
+
+
+def test_transient_failure_is_retried():
+    upstream = Upstream(failures=2)
+    test_policy = policy(retries=2)
+
+    assert asyncio.run(test_policy.call(upstream)) == "answer 3"
+    assert upstream.calls == 3
+    assert test_policy.retried == 2
+    assert test_policy.breaker.state == CLOSED
+
+
+def test_retries_are_exhausted():
+    upstream = Upstream(failures=5)
+    test_policy = policy(retries=1)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 2
+
+
+def test_permanent_failure_is_not_retried():
+    upstream = Upstream(failures=1, error=ValueError)
+    test_policy = policy(retries=3)
+
+    with pytest.raises(ValueError):
+        asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 1
+    # The upstream answered, so the breaker does not count it
+    assert test_policy.breaker.failures == 0
+
+
+def test_deadline_applies_per_attempt():
+    upstream = Upstream(delay=0.2)
+    test_policy = policy(timeout=0.05, retries=1)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 2
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.before_call()
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after > 0
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_closes_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.02)
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_open_breaker_fails_fast_and_stops_retrying():
+    upstream = Upstream(failures=10)
+    test_policy = policy(retries=5, breaker=CircuitBreaker("test", failure_threshold=2, reset_timeout=60))
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 2
+    assert test_policy.breaker.state == OPEN
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 2
+
+
+def test_slow_call_is_hedged():
+    test_policy = policy(hedge=True, hedge_ratio=1.0)
+    test_policy._latencies.extend([0.01] * HEDGE_MIN_SAMPLES)
+    test_policy.calls = HEDGE_MIN_SAMPLES
+    delays = [1.0, 0.0]
+
+    async def factory():
+        await asyncio.sleep(delays.pop(0))
+        return "done"
+
+    async def call():
+        started = time.monotonic()
+        result = await test_policy.call(factory)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(call())
+    assert result == "done"
+    assert elapsed < 0.5
+    assert test_policy.hedged == 1
+    assert test_policy.hedge_wins == 1
+
+
+def test_hedging_respects_ratio():
+    test_policy = policy(hedge=True, hedge_ratio=0.0)
+    test_policy._latencies.extend([0.001] * HEDGE_MIN_SAMPLES)
+    upstream = Upstream(delay=0.02)
+
+    asyncio.run(test_policy.call(upstream))
+    assert upstream.calls == 1
+    assert test_policy.hedged == 0
+
+
+def test_stream_is_retried_before_first_item():
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError()
+        for item in ("a", "b"):
+            yield item
+
+    async def collect():
+        return [item async for item in policy(retries=1).stream(factory)]
+
+    assert asyncio.run(collect()) == ["a", "b"]
+    assert len(attempts) == 2
+
+
+def test_batch_deadline_scales_with_audio():
+    class SlowEngine(StubEngine):
+        def transcribe_batch(self, clips, language_code):
+            time.sleep(0.2)
+            return super().transcribe_batch(clips, language_code)
+
+    # Per-call deadline well below the engine time, but 8 clips of 0.5 s extend it
+    service = SpeechService(SlowEngine(text="ok"), max_workers=1, resilience=policy(timeout=0.05))
+    clips = [b"\0" * (SAMPLE_RATE * SAMPLE_WIDTH // 2)] * 8
+
+    assert asyncio.run(service.transcribe_batch(clips, "en")) == ["ok"] * 8
+    with pytest.raises(TimeoutError):
+        asyncio.run(service.run(service.engine.transcribe_batch, clips, "en-US"))
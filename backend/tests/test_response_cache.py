@@ -0,0 +1,84 @@
+"""Response cache: exact and near-duplicate tiers"""
+
+import pytest
+
+from services.response_cache import ResponseCache, guard_tokens, make_context_key, normalize_text
+
+GREETING = make_context_key("greeting", "en", [])
+CONSULTATION = make_context_key("consultation", "en", [{"role": "assistant", "content": "Hello"}])
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_entries=10, ttl_seconds=60)
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello,   DOCTOR! ") == "hello doctor"
+
+
+def test_context_key_names_the_state():
+    assert GREETING.startswith("greeting:")
+    assert make_context_key("greeting", "en", []) == GREETING
+    assert make_context_key("greeting", "es", []) != GREETING
+
+
+def test_exact_hit_ignores_case_and_punctuation(cache):
+    cache.put(CONSULTATION, "I have a headache.", "answer")
+    assert cache.get(CONSULTATION, "i have a HEADACHE") == "answer"
+    assert cache.get(GREETING, "I have a headache") is None
+    assert cache.stats()["hits_exact"] == 1
+
+
+def test_similar_hit_in_greeting_context(cache):
+    cache.put(GREETING, "Hello doctor, how are you today?", "greeting answer")
+    assert cache.get(GREETING, "hello doctor how are you today") == "greeting answer"
+    assert cache.get(GREETING, "Hello docter, how are you today?") == "greeting answer"
+    assert cache.stats()["hits_similar"] == 1
+
+
+def test_no_similar_hits_outside_greeting_context(cache):
+    cache.put(CONSULTATION, "Hello doctor, how are you today?", "answer")
+    assert cache.get(CONSULTATION, "Hello docter, how are you today?") is None
+
+
+@pytest.mark.parametrize("stored,asked", [
+    ("I took 2 pills of ibuprofen", "I took 20 pills of ibuprofen"),
+    ("my son is 2 years old and has a fever", "my son is 12 years old and has a fever"),
+    ("my temperature is 38.5 degrees today", "my temperature is 39.5 degrees today"),
+    ("I have no fever and a bad cough tonight", "I have fever and a bad cough tonight")
+])
+def test_numbers_and_negations_must_match(cache, stored, asked):
+    cache.put(GREETING, stored, "answer")
+    assert cache.get(GREETING, asked) is None
+
+
+def test_guard_tokens():
+    assert guard_tokens("I took 2 pills, not 20") == ("2", "not", "20")
+    assert guard_tokens("我没有发烧") == ("没有",)
+    assert guard_tokens("Nothing to note") == ()
+
+
+def test_similarity_tier_can_be_disabled():
+    cache = ResponseCache(similarity=1.1)
+    cache.put(GREETING, "Hello doctor, how are you today?", "answer")
+    assert cache.get(GREETING, "Hello docter, how are you today?") is None
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl_seconds=0)
+    cache.put(GREETING, "hello", "answer")
+    assert cache.get(GREETING, "hello") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put(CONSULTATION, "one", "1")
+    cache.put(CONSULTATION, "two", "2")
+    cache.get(CONSULTATION, "one")
+    cache.put(CONSULTATION, "three", "3")
+
+    assert cache.get(CONSULTATION, "two") is None
+    assert cache.get(CONSULTATION, "one") == "1"
+    assert cache.stats()["entries"] == 2
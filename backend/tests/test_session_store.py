@@ -0,0 +1,120 @@
+"""Session stores: round trips and the per-conversation lock"""
+
+import asyncio
+
+import pytest
+
+from services.session_store import (
+    InMemorySessionStore, LocalRedis, RedisSessionStore, SessionState, create_session_store
+)
+
+
+def stores():
+    return [InMemorySessionStore(), RedisSessionStore(LocalRedis())]
+
+
+@pytest.mark.parametrize("store", stores(), ids=["memory", "local-redis"])
+def test_round_trip(store):
+    async def run():
+        state = SessionState("c1", "es")
+        state.record_turn("hola", "buenos dias")
+        await store.save(state)
+        return await store.get("c1")
+
+    loaded = asyncio.run(run())
+    assert loaded.language == "es"
+    assert loaded.history == [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "buenos dias"}]
+
+
+@pytest.mark.parametrize("store", stores(), ids=["memory", "local-redis"])
+def test_lock_serializes_read_modify_write(store):
+    async def turn(index):
+        async with store.lock("c1"):
+            state = await store.get("c1") or SessionState("c1")
+            # A slow upstream call between load and save
+            await asyncio.sleep(0.01)
+            state.record_turn(f"message {index}", "answer")
+            await store.save(state)
+
+    async def run():
+        await asyncio.gather(*(turn(index) for index in range(5)))
+        return await store.get("c1")
+
+    assert asyncio.run(run()).turn_count == 5
+
+
+def test_locks_are_per_conversation():
+    store = InMemorySessionStore()
+
+    async def run():
+        async with store.lock("a"):
+            # Would deadlock if conversations shared a lock
+            async with store.lock("b"):
+                pass
+        return store._locks._locks
+
+    assert asyncio.run(run()) == {}
+
+
+class FakeRedisLock:
+    def __init__(self, owners, name, acquirable):
+        self.owners = owners
+        self.name = name
+        self.acquirable = acquirable
+
+    async def acquire(self):
+        if not self.acquirable:
+            return False
+        self.owners.append(self.name)
+        return True
+
+    async def release(self):
+        self.owners.remove(self.name)
+
+
+class LockingRedis(LocalRedis):
+    """LocalRedis with a redis-py style lock()"""
+
+    def __init__(self, acquirable=True):
+        super().__init__()
+        self.acquirable = acquirable
+        self.owners = []
+        self.calls = []
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        self.calls.append((name, timeout, blocking_timeout))
+        return FakeRedisLock(self.owners, name, self.acquirable)
+
+
+def test_redis_lock_is_used_when_available():
+    client = LockingRedis()
+    store = RedisSessionStore(client, lock_seconds=30)
+
+    async def run():
+        async with store.lock("c1"):
+            return list(client.owners)
+
+    assert asyncio.run(run()) == ["medivoice:session:lock:c1"]
+    assert client.owners == []
+    assert client.calls == [("medivoice:session:lock:c1", 30, 30)]
+
+
+def test_redis_lock_timeout_proceeds():
+    store = RedisSessionStore(LockingRedis(acquirable=False))
+
+    async def run():
+        async with store.lock("c1"):
+            return True
+
+    assert asyncio.run(run())
+
+
+def test_redis_without_package_is_reported(monkeypatch):
+    try:
+        import redis  # noqa: F401
+        pytest.skip("redis is installed")
+    except ImportError:
+        pass
+    monkeypatch.setenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+    with pytest.raises(ValueError):
+        create_session_store()
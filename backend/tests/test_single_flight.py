@@ -0,0 +1,179 @@
+"""Coalescing of identical calls, cancellation and idempotency keys"""
+
+import asyncio
+
+import pytest
+
+from services.single_flight import IdempotencyConflict, IdempotencyStore, SingleFlight, make_flight_key
+
+
+class Upstream:
+    """Counts calls and finishes them when released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"result {self.calls}"
+
+
+def test_flight_key():
+    assert make_flight_key("gemini", "a", "b") == make_flight_key("gemini", "a", "b")
+    assert make_flight_key("gemini", "a", "b") != make_flight_key("gemini", "ab")
+    assert make_flight_key("gemini", "a").startswith("gemini:")
+
+
+def test_concurrent_callers_share_one_call():
+    flights, upstream = SingleFlight(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        callers = [asyncio.create_task(flights.do("k", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flights.in_flight("k")
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        # The key is free again once the call completed
+        assert not flights.in_flight("k")
+        assert await flights.do("k", upstream) == "result 2"
+        return results
+
+    assert asyncio.run(scenario()) == ["result 1"] * 3
+    assert flights.stats() == {"in_flight": 0, "calls": 2, "coalesced": 2, "abandoned": 0}
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flights, upstream = SingleFlight(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        first = asyncio.create_task(flights.do("k", upstream))
+        second = asyncio.create_task(flights.do("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == "result 1"
+    assert upstream.cancelled == 0
+    assert flights.stats()["abandoned"] == 0
+
+
+def test_call_is_cancelled_when_its_last_caller_leaves():
+    flights, upstream = SingleFlight(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        callers = [asyncio.create_task(flights.do("k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert not flights.in_flight("k")
+
+        # A new caller starts a fresh call instead of joining the cancelled one
+        upstream.release.set()
+        return await flights.do("k", upstream)
+
+    assert asyncio.run(scenario()) == "result 2"
+    assert upstream.cancelled == 1
+    assert flights.stats()["abandoned"] == 1
+
+
+def test_failure_reaches_every_caller_and_is_not_kept():
+    flights = SingleFlight()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        results = await asyncio.gather(*(flights.do("k", failing) for _ in range(2)), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await flights.do("k", failing)
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(attempts) == 2
+
+
+def test_idempotent_retries_replay_the_result():
+    store, upstream = IdempotencyStore(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        first = asyncio.create_task(store.run("key", "request", upstream))
+        retry = asyncio.create_task(store.run("key", "request", upstream))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(first, retry)
+        return results + [await store.run("key", "request", upstream)]
+
+    assert asyncio.run(scenario()) == ["result 1"] * 3
+    assert upstream.calls == 1
+    assert store.stats()["replayed"] == 1
+
+
+def test_idempotency_key_reuse_is_a_conflict():
+    store, upstream = IdempotencyStore(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        first = asyncio.create_task(store.run("key", "request", upstream))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict):
+            await store.run("key", "other request", upstream)
+        upstream.release.set()
+        await first
+        with pytest.raises(IdempotencyConflict):
+            await store.run("key", "other request", upstream)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_idempotent_request_can_be_retried():
+    store, upstream = IdempotencyStore(), Upstream()
+
+    async def scenario():
+        upstream.release = asyncio.Event()
+        first = asyncio.create_task(store.run("key", "request", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        upstream.release.set()
+        return await store.run("key", "request", upstream)
+
+    assert asyncio.run(scenario()) == "result 2"
+    assert store.stats()["stored"] == 1
+
+
+def test_stored_results_expire_and_are_bounded():
+    async def run(store, key):
+        async def factory():
+            return key
+        return await store.run(key, "request", factory)
+
+    expired = IdempotencyStore(ttl_seconds=0)
+    asyncio.run(run(expired, "a"))
+    assert asyncio.run(run(expired, "a")) == "a"
+    assert expired.stats()["replayed"] == 0
+
+    bounded = IdempotencyStore(max_entries=2)
+    for key in ("a", "b", "c"):
+        asyncio.run(run(bounded, key))
+    assert bounded.stats()["stored"] == 2
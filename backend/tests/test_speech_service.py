@@ -0,0 +1,147 @@
+"""SpeechService over the deterministic stub engine"""
+
+import io
+import sys
+import wave
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.speech_service import SpeechService
+from services.stt_engines import StubEngine, VoskEngine, create_stt_engine, SAMPLE_RATE, SAMPLE_WIDTH
+
+
+def pcm(seconds: float) -> bytes:
+    return b"\0\1" * int(SAMPLE_RATE * seconds)
+
+
+def wav(seconds: float, sample_rate: int = SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\0\1" * int(sample_rate * seconds))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def service():
+    speech = SpeechService(StubEngine(), max_workers=2)
+    yield speech
+    speech.close()
+
+
+def test_speech_to_text(service):
+    assert asyncio.run(service.speech_to_text(wav(1.5), "es")) == "[es-ES] 1.50s of audio"
+
+
+def test_speech_to_text_resamples(service):
+    assert asyncio.run(service.speech_to_text(wav(2, sample_rate=8000), "en")) == "[en-US] 2.00s of audio"
+
+
+def test_speech_to_text_rejects_garbage(service):
+    with pytest.raises(Exception, match="Failed to transcribe audio"):
+        asyncio.run(service.speech_to_text(b"not audio", "en"))
+
+
+def test_transcribe_stream(service):
+    async def chunks():
+        audio = pcm(1)
+        # Odd-sized chunks split samples; the stream must keep the remainder
+        for offset in range(0, len(audio), 3001):
+            yield audio[offset:offset + 3001]
+
+    assert asyncio.run(service.transcribe_stream(chunks(), "fr")) == "[fr-FR] 1.00s of audio"
+
+
+def test_transcribe_stream_without_audio(service):
+    async def chunks():
+        return
+        yield
+
+    assert asyncio.run(service.transcribe_stream(chunks(), "en")) == ""
+
+
+def test_stream_reports_changed_partials(service):
+    async def run():
+        stream = service.create_stream("en")
+        partials = [await stream.accept(pcm(0.5)), await stream.accept(b""), await stream.accept(pcm(0.5))]
+        return partials, await stream.finish()
+
+    partials, final = asyncio.run(run())
+    assert partials == ["[en-US] 0.50s of audio", None, "[en-US] 1.00s of audio"]
+    assert final == "[en-US] 1.00s of audio"
+
+
+def test_transcribe_batch(service):
+    clips = [pcm(1), pcm(2), pcm(0.5)]
+    assert asyncio.run(service.transcribe_batch(clips, "de")) == [
+        "[de-DE] 1.00s of audio", "[de-DE] 2.00s of audio", "[de-DE] 0.50s of audio"
+    ]
+
+
+def test_fixed_stub_text():
+    speech = SpeechService(StubEngine(text="I have a headache"), max_workers=1)
+    try:
+        assert asyncio.run(speech.transcribe_batch([pcm(1), b""], "en")) == ["I have a headache", ""]
+    finally:
+        speech.close()
+
+
+def test_stub_engine_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv("STT_ENGINE", raising=False)
+    monkeypatch.setenv("VOSK_MODEL_DIR", str(tmp_path / "missing"))
+    # No Vosk means no speech-to-text, never made-up transcripts
+    with pytest.raises(ValueError):
+        create_stt_engine()
+
+    monkeypatch.setenv("STT_ENGINE", "stub")
+    assert create_stt_engine().name == "stub"
+
+
+def test_vosk_supports_installed_models_only(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "vosk", SimpleNamespace(SetLogLevel=lambda level: None))
+    (tmp_path / "en-US").mkdir()
+    (tmp_path / "es").mkdir()
+    speech = SpeechService(VoskEngine(str(tmp_path), {"es-ES": "es"}), max_workers=1)
+    try:
+        assert speech.supports("en")
+        assert speech.supports("es")
+        assert not speech.supports("ja")
+    finally:
+        speech.close()
+
+
+def test_explicit_vosk_engine_fails_loudly(monkeypatch, tmp_path):
+    monkeypatch.setenv("STT_ENGINE", "vosk")
+    monkeypatch.setenv("VOSK_MODEL_DIR", str(tmp_path / "missing"))
+    with pytest.raises(ValueError):
+        create_stt_engine()
+
+
+def test_slow_upload_does_not_hold_the_stt_slot():
+    from services.admission import UpstreamLimiter
+
+    limiter = UpstreamLimiter("stt", concurrency=1, max_queue=0)
+    speech = SpeechService(StubEngine(text="ok"), max_workers=2, limiter=limiter)
+
+    async def slow_upload():
+        for _ in range(3):
+            yield pcm(0.1)
+            await asyncio.sleep(0.05)
+
+    async def run():
+        upload = asyncio.ensure_future(speech.transcribe_stream(slow_upload(), "en"))
+        await asyncio.sleep(0.02)
+        # Would be shed (no queue) if the upload held the only slot
+        batch = await speech.transcribe_batch([pcm(1)], "en")
+        return batch, await upload
+
+    try:
+        assert asyncio.run(run()) == (["ok"], "ok")
+        # Recognizer, three chunks, finish and the batch call
+        assert limiter.admitted == 6
+    finally:
+        speech.close()
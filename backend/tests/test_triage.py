@@ -0,0 +1,205 @@
+"""Triage keyword classification"""
+
+import pytest
+
+from services.triage import EMERGENCY, TRIAGE_KEYWORDS, URGENT, TriageEngine
+
+
+@pytest.fixture(scope="module")
+def triage():
+    return TriageEngine()
+
+
+@pytest.mark.parametrize("message,language", [
+    ("no chest pain", "en"),
+    ("I don't have difficulty breathing", "en"),
+    ("Patient denies chest pain", "en"),
+    ("No tengo dolor de pecho", "es"),
+    ("Je n'ai pas de douleur thoracique", "fr"),
+    ("Ich habe keine Brustschmerzen", "de"),
+    ("Não tenho dor no peito", "pt"),
+    ("Нет, у меня не инсульт", "ru"),
+    ("सीने में दर्द नहीं है", "hi"),
+    ("ليس لدي ألم في الصدر", "ar"),
+    ("没有胸痛", "zh"),
+    ("胸の痛みはありません", "ja")
+])
+def test_negated_emergency_is_not_flagged(triage, message, language):
+    assert not triage.scan(message, language).is_emergency
+
+
+@pytest.mark.parametrize("message,language", [
+    ("I have chest pain", "en"),
+    ("No, I have chest pain", "en"),
+    ("no fever but chest pain", "en"),
+    ("I've never had chest pain like this", "en"),
+    ("I'm not sure if it's a stroke", "en"),
+    ("I can't breathe", "en"),
+    ("no puedo respirar", "es"),
+    ("je ne peux pas respirer", "fr"),
+    ("我不知道是不是胸痛", "zh"),
+    ("不能呼吸", "zh")
+])
+def test_emergency_survives_negation_handling(triage, message, language):
+    assert triage.scan(message, language).is_emergency
+
+
+@pytest.mark.parametrize("message", [
+    "He has no pulse and is unconscious",
+    "the baby is not moving and unconscious",
+    "no appetite and severe bleeding",
+    "Patient denies chest pain or seizure",
+    "I did not eat before he passed out"
+])
+def test_negation_does_not_reach_other_emergencies(triage, message):
+    assert triage.scan(message, "en").is_emergency
+
+
+@pytest.mark.parametrize("message,language", [
+    ("No tiene apetito y está inconsciente", "es"),
+    ("Pas de fièvre et il est inconscient", "fr"),
+    ("没有发烧和胸痛", "zh")
+])
+def test_conjunctions_end_the_negation(triage, message, language):
+    assert triage.scan(message, language).is_emergency
+
+
+def test_urgent_terms_after_a_conjunction_are_kept(triage):
+    result = triage.scan("no fever or rash", "en")
+    assert [m.term for m in result.matches] == ["rash"]
+
+
+def test_negation_is_scoped_to_its_clause(triage):
+    result = triage.scan("no fever, but chest pain", "en")
+    assert [(m.term, m.category) for m in result.matches] == [("chest pain", EMERGENCY)]
+
+
+@pytest.mark.parametrize("message,language", [
+    ("severe pain in my toe", "en"),
+    ("my tooth has severe pain", "en"),
+    ("dolor intenso en el dedo", "es"),
+    ("脚趾剧痛", "zh")
+])
+def test_severe_pain_at_minor_site_is_urgent(triage, message, language):
+    result = triage.scan(message, language)
+    assert not result.is_emergency
+    assert result.is_urgent
+
+
+def test_severe_pain_elsewhere_is_emergency(triage):
+    assert triage.scan("severe pain in my chest", "en").is_emergency
+    assert triage.scan("severe pain in my toe and chest pain", "en").is_emergency
+
+
+def test_stream_applies_negation(triage):
+    deltas = ["The patient has no ch", "est pain. ", "They report chest ", "pain now."]
+    stream = triage.stream("en")
+    found = [match for delta in deltas for match in stream.feed(delta)]
+    assert [(m.term, m.category, m.start) for m in found] == [
+        ("chest pain", EMERGENCY, "".join(deltas).rindex("chest pain"))
+    ]
+
+
+@pytest.mark.parametrize("message,language,severity", [
+    ("I have chest pain", "en", "high"),
+    ("I think I'm having a HEART ATTACK", "en", "high"),
+    ("I've had a fever since yesterday", "en", "medium"),
+    ("Just checking in about my appointment", "en", "low"),
+    ("Tengo dolor de pecho", "es", "high"),
+    ("J'ai de la fièvre", "fr", "medium"),
+    ("Ich habe Brustschmerzen", "de", "high"),
+    ("Estou com febre", "pt", "medium"),
+    ("У меня температура", "ru", "medium"),
+    ("मुझे बुखार है", "hi", "medium"),
+    ("عندي ألم في الصدر", "ar", "high"),
+    ("我发烧了", "zh", "medium"),
+    ("胸が痛い", "ja", "high")
+])
+def test_classification(triage, message, language, severity):
+    assert triage.scan(message, language).severity == severity
+
+
+def test_every_language_is_compiled(triage):
+    for language, categories in TRIAGE_KEYWORDS.items():
+        term = categories[EMERGENCY][0]
+        assert triage.scan(term, language).is_emergency, (language, term)
+
+
+def test_english_is_matched_for_every_language(triage):
+    result = triage.scan("tengo fiebre y chest pain", "es")
+    assert [(m.term, m.category) for m in result.matches] == [("fiebre", URGENT), ("chest pain", EMERGENCY)]
+    assert result.is_emergency and result.is_urgent
+
+
+def test_unknown_language_falls_back_to_english(triage):
+    assert triage.scan("chest pain", "xx").is_emergency
+    assert triage.scan("tengo fiebre", "xx").matches == []
+
+
+@pytest.mark.parametrize("message,language", [
+    ("I live in Spain", "en"),
+    ("I am painting my kitchen", "en"),
+    ("The rashers are burnt", "en"),
+    ("我在painting", "zh")
+])
+def test_terms_match_whole_words(triage, message, language):
+    assert triage.scan(message, language).matches == []
+
+
+@pytest.mark.parametrize("message,language,term", [
+    ("Painful knees", "en", "Painful"),
+    ("He vomited twice", "en", "vomited"),
+    ("Ich habe Schmerzen", "de", "Schmerzen"),
+    ("Des vomissements depuis hier", "fr", "vomissements"),
+    ("У меня болит живот", "ru", "болит"),
+    ("我有fever", "zh", "fever")
+])
+def test_inflections_are_listed(triage, message, language, term):
+    assert [m.term for m in triage.scan(message, language).matches] == [term]
+
+
+def test_emergency_wins_over_urgent_for_the_same_span(triage):
+    result = triage.scan("severe bleeding", "en")
+    assert [(m.term, m.category, m.start, m.end) for m in result.matches] == [("severe bleeding", EMERGENCY, 0, 15)]
+
+
+def test_to_dict(triage):
+    assert triage.scan("fever and chest pain", "en").to_dict() == {
+        "is_emergency": True,
+        "is_urgent": True,
+        "severity": "high",
+        "matches": [
+            {"term": "fever", "category": URGENT, "span": [0, 5]},
+            {"term": "chest pain", "category": EMERGENCY, "span": [10, 20]}
+        ]
+    }
+
+
+def test_stream_reports_terms_split_across_deltas_once(triage):
+    text = "I have had a fever and now chest pain and a rash"
+    stream = triage.stream("en")
+    found = [match for index in range(0, len(text), 3) for match in stream.feed(text[index:index + 3])]
+    found += stream.flush()
+
+    expected = [(m.term, m.category, m.start, m.end) for m in triage.scan(text, "en").matches]
+    assert [(m.term, m.category, m.start, m.end) for m in found] == expected
+    assert stream.matches == found
+
+
+def test_stream_waits_for_the_rest_of_a_word(triage):
+    stream = triage.stream("fr")
+    assert stream.feed("Il a vomi") == []
+    assert [(m.term, m.start) for m in stream.feed("ssement depuis hier")] == [("vomissement", 5)]
+    assert stream.flush() == []
+
+    stream = triage.stream("en")
+    assert stream.feed("I was pain") == []
+    assert stream.feed("ting all day") == []
+    assert stream.flush() == []
+
+
+def test_stream_flush_reports_the_last_term(triage):
+    stream = triage.stream("en")
+    assert stream.feed("It started with a fever") == []
+    assert [m.term for m in stream.flush()] == ["fever"]
+    assert stream.flush() == []
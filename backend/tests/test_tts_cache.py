@@ -0,0 +1,117 @@
+"""TTS cache keys and the eviction of both tiers"""
+
+import os
+import asyncio
+
+import pytest
+
+from services.audio_codecs import VARIANTS, split_audio_id
+from services.elevenlabs_service import ElevenLabsService
+from services.tts_cache import TTSCache, make_cache_key
+
+SETTINGS = {"stability": 0.4, "similarity_boost": 0.75}
+
+
+def test_cache_key_is_stable():
+    key = make_cache_key("Hello", "voice", "model", SETTINGS)
+    assert key == make_cache_key("Hello", "voice", "model", dict(reversed(list(SETTINGS.items()))))
+    assert len(key) == 64
+
+
+@pytest.mark.parametrize("changed", [
+    {"text": "Hello!"},
+    {"voice_id": "other"},
+    {"model_id": "other"},
+    {"voice_settings": {**SETTINGS, "stability": 0.5}},
+    {"format": "opus", "quality": "low"}
+])
+def test_cache_key_covers_every_input(changed):
+    base = {"text": "Hello", "voice_id": "voice", "model_id": "model", "voice_settings": SETTINGS}
+    assert make_cache_key(**{**base, **changed}) != make_cache_key(**base)
+
+
+@pytest.fixture
+def elevenlabs(monkeypatch):
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "test")
+    return ElevenLabsService()
+
+
+def test_service_keys(elevenlabs):
+    default = elevenlabs.cache_key("Hello", "en")
+    # The default MP3 variant keeps the keys cached before variants existed
+    assert default == make_cache_key("Hello", "pNInz6obpgDQGcFmaJgB", elevenlabs.model_id, elevenlabs.voice_settings.dict())
+    assert elevenlabs.cache_key("Hello", "en", voice_id="custom") != default
+    assert elevenlabs.cache_key("Hello", "en", variant=VARIANTS["mp3"]["low"]) != default
+
+    opus = VARIANTS["opus"]["standard"]
+    audio_id = elevenlabs.audio_id("Hello", "en", variant=opus)
+    assert split_audio_id(audio_id) == (elevenlabs.cache_key("Hello", "en", variant=opus), opus.content_type)
+    assert split_audio_id(elevenlabs.audio_id("Hello")) == (default, "audio/mpeg")
+
+
+def test_memory_tier_is_lru_by_bytes():
+    cache = TTSCache(max_memory_bytes=30)
+
+    async def scenario():
+        await cache.put("a", b"a" * 10)
+        await cache.put("b", b"b" * 10)
+        await cache.put("c", b"c" * 10)
+        await cache.get("a")
+        await cache.put("d", b"d" * 10)
+        await cache.put("huge", b"x" * 31)
+        return [await cache.get(key) is not None for key in ("a", "b", "c", "d", "huge")]
+
+    assert asyncio.run(scenario()) == [True, False, True, True, False]
+    stats = cache.stats()
+    assert stats["memory_bytes"] == 30 and stats["memory_entries"] == 3
+    assert (stats["hits_memory"], stats["misses"]) == (4, 2)
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    async def fill():
+        cache = TTSCache(max_memory_bytes=10, disk_dir=str(tmp_path))
+        await cache.put("a", b"a" * 20)
+        return cache.stats()
+
+    assert asyncio.run(fill())["memory_entries"] == 0
+
+    cache = TTSCache(max_memory_bytes=100, disk_dir=str(tmp_path))
+    assert asyncio.run(cache.get("a")) == b"a" * 20
+    assert cache.stats()["hits_disk"] == 1
+    # Promoted into memory
+    assert asyncio.run(cache.get("a")) == b"a" * 20
+    assert cache.stats()["hits_memory"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=30)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await cache.put(key, key.encode() * 10)
+        await cache.get("a")
+        await cache.put("d", b"d" * 10)
+
+    asyncio.run(scenario())
+    assert sorted(os.listdir(tmp_path)) == ["a.audio", "c.audio", "d.audio"]
+    assert cache.stats()["disk_bytes"] == 30
+
+
+def test_restart_keeps_disk_lru_order(tmp_path):
+    for index, key in enumerate(("old", "new")):
+        path = tmp_path / f"{key}.audio"
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (1000 + index, 1000 + index))
+
+    cache = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=20)
+    asyncio.run(cache.put("newest", b"y" * 10))
+    assert sorted(os.listdir(tmp_path)) == ["new.audio", "newest.audio"]
+
+
+def test_missing_disk_file_is_a_miss(tmp_path):
+    cache = TTSCache(max_memory_bytes=0, disk_dir=str(tmp_path))
+    asyncio.run(cache.put("a", b"a"))
+    os.remove(tmp_path / "a.audio")
+
+    assert asyncio.run(cache.get("a")) is None
+    assert not cache.contains("a")
@@ -0,0 +1,57 @@
+"""Voice input endpoints refuse languages without a speech model"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from services.speech_service import SpeechService
+from services.stt_engines import StubEngine
+
+
+class EnglishOnlyEngine(StubEngine):
+    def supports(self, language_code: str) -> bool:
+        return language_code == "en-US"
+
+
+@pytest.fixture
+def speech():
+    service = SpeechService(EnglishOnlyEngine(text="hello"), max_workers=1)
+    yield service
+    service.close()
+
+
+def client(speech):
+    app = FastAPI()
+    app.add_api_route("/api/voice-input", main.process_voice_input, methods=["POST"])
+    app.add_api_websocket_route("/ws/session", main.voice_session)
+    app.state.services = SimpleNamespace(speech=speech, gemini=object())
+    return TestClient(app)
+
+
+def upload(test_client, language):
+    return test_client.post(f"/api/voice-input?language={language}", files={"audio": ("a.wav", b"RIFF", "audio/wav")})
+
+
+def test_voice_input_without_an_engine_is_unavailable():
+    response = upload(client(None), "en")
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Speech-to-text is not configured"
+
+
+def test_voice_input_in_a_language_without_a_model_is_unavailable(speech):
+    response = upload(client(speech), "ja")
+    assert response.status_code == 503
+    assert "ja" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("has_engine", [False, True])
+def test_voice_session_is_closed_when_speech_is_unavailable(speech, has_engine):
+    with client(speech if has_engine else None).websocket_connect("/ws/session?language=ja") as websocket:
+        assert websocket.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1013
@@ -0,0 +1,106 @@
+"""Barge-in of the voice session: speech interrupts an answer, silence does not"""
+
+import asyncio
+
+import numpy as np
+
+from services.audio_ingest import EnergyVAD
+from services.speech_service import SpeechService
+from services.stt_engines import StubEngine, SAMPLE_RATE
+from services.voice_session import VoiceSession
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+
+def tone(seconds: float, amplitude: int) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+
+def session_with_turn(vad, speech_service):
+    websocket = FakeWebSocket()
+    session = VoiceSession(websocket, None, None, speech_service, None, vad=vad)
+    session._turn = asyncio.ensure_future(asyncio.sleep(60))
+    return session, websocket
+
+
+def interrupted(websocket) -> bool:
+    return {"type": "interrupted"} in websocket.sent
+
+
+def test_silence_does_not_barge_in():
+    async def run():
+        session, websocket = session_with_turn(EnergyVAD(), None)
+        for _ in range(10):
+            await session._on_audio(tone(0.1, 20))
+        assert session._turn_in_flight()
+        await session._cancel_turn()
+        return websocket
+
+    assert not interrupted(asyncio.run(run()))
+
+
+def test_speech_barges_in():
+    async def run():
+        session, websocket = session_with_turn(EnergyVAD(), None)
+        # Chunks shorter than a VAD frame still add up to a barge-in
+        audio = tone(0.3, 8000)
+        for offset in range(0, len(audio), 321):
+            await session._on_audio(audio[offset:offset + 321])
+        return session, websocket
+
+    session, websocket = asyncio.run(run())
+    assert interrupted(websocket)
+    assert not session._turn_in_flight()
+
+
+def test_short_click_does_not_barge_in():
+    async def run():
+        session, websocket = session_with_turn(EnergyVAD(), None)
+        await session._on_audio(tone(0.5, 20) + tone(0.03, 8000) + tone(0.5, 20))
+        await session._cancel_turn()
+        return websocket
+
+    assert not interrupted(asyncio.run(run()))
+
+
+def test_partial_transcript_barges_in_without_vad():
+    speech = SpeechService(StubEngine(text="wait"), max_workers=1)
+
+    async def run():
+        session, websocket = session_with_turn(None, speech)
+        await session._on_audio(tone(0.1, 20))
+        return websocket
+
+    try:
+        websocket = asyncio.run(run())
+    finally:
+        speech.close()
+    assert interrupted(websocket)
+    assert {"type": "transcript", "text": "wait", "final": False} in websocket.sent
+
+
+def test_switching_to_a_language_without_a_model_is_refused():
+    class EnglishOnlyEngine(StubEngine):
+        def supports(self, language_code):
+            return language_code == "en-US"
+
+    speech = SpeechService(EnglishOnlyEngine(), max_workers=1)
+    websocket = FakeWebSocket()
+    session = VoiceSession(websocket, None, None, speech, None)
+    try:
+        asyncio.run(session._on_control('{"type": "start", "language": "ja"}'))
+    finally:
+        speech.close()
+
+    assert session.language == "en"
+    assert websocket.sent[-1]["type"] == "error"
@@ -39,6 +39,8 @@ function App() {
   
   const recognitionRef = useRef(null)
   const audioRef = useRef(null)
+  // Server-side session id returned by the backend after the first turn
+  const conversationIdRef = useRef(null)
 
   // Initialize Web Speech API
   useEffect(() => {
@@ -150,11 +152,14 @@ function App() {
         body: JSON.stringify({
           message: transcript,
           language: selectedLanguage,
-          conversation_history: updatedHistory // Send immediate history from REF
+          conversation_id: conversationIdRef.current,
+          // History is only needed to seed the server-side session
+          conversation_history: conversationIdRef.current ? [] : updatedHistory
         })
       })
 
       const data = await response.json()
+      conversationIdRef.current = data.conversation_id
       
       // Add AI response to conversation
       setConversation(prev => [...prev, {
@@ -162,6 +167,11 @@ function App() {
         content: data.text_response
       }])
 
+      // Emergency fast path: the detailed answer is still being generated
+      const followup = data.followup_url
+        ? fetch(`${BACKEND_URL}${data.followup_url}`).then(res => res.ok ? res.json() : null)
+        : null
+
       // Play audio response
       if (data.audio_url) {
         setStatus('AI is speaking...')
@@ -173,6 +183,18 @@ function App() {
         alert('⚠️ EMERGENCY DETECTED: Please seek immediate medical attention or call emergency services!')
       }
 
+      const followupData = followup ? await followup : null
+      if (followupData) {
+        setConversation(prev => [...prev, {
+          role: 'assistant',
+          content: followupData.text_response
+        }])
+        if (followupData.audio_url) {
+          setStatus('AI is speaking...')
+          await playAudio(followupData.audio_url)
+        }
+      }
+
       setStatus('Listening...')
 
     } catch (error) {
@@ -201,7 +223,8 @@ function App() {
         }
         
         setIsSpeaking(true)
-        audioRef.current.src = audioUrl
+        // Cached audio is served by the backend under a relative URL
+        audioRef.current.src = audioUrl.startsWith('/') ? `${BACKEND_URL}${audioUrl}` : audioUrl
         audioRef.current.onended = () => {
           setIsSpeaking(false)
           
@@ -246,19 +269,30 @@ function App() {
     if (conversation.length === 0) return
     setStatus('Generating Report...')
     try {
-      const response = await fetch(`${BACKEND_URL}/api/report`, {
+      const response = await fetch(`${BACKEND_URL}/api/report/jobs`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ conversation_history: conversation, language: selectedLanguage })
+        body: JSON.stringify({
+          conversation_id: conversationIdRef.current,
+          conversation_history: conversation,
+          language: selectedLanguage
+        })
+      })
+      const job = await response.json()
+      if (!response.ok) throw new Error(job.detail || 'Failed to queue report')
+
+      // Repeated clicks on an unchanged conversation return the finished job at once
+      const reportData = job.status === 'done' ? job.report : await new Promise((resolve, reject) => {
+        const events = new EventSource(`${BACKEND_URL}${job.events_url}`)
+        events.addEventListener('report', (event) => {
+          events.close()
+          resolve(JSON.parse(event.data).report)
+        })
+        events.addEventListener('error', (event) => {
+          events.close()
+          reject(new Error(event.data ? JSON.parse(event.data).error : 'Report stream failed'))
+        })
       })
-      const data = await response.json()
-      let reportData = {}
-      try {
-          reportData = JSON.parse(data.report)
-      } catch (e) {
-          console.error("Failed to parse report JSON", e)
-          reportData = { diagnosis: "Error parsing report", patient_symptoms: "N/A" }
-      }
 
       const doc = new jsPDF()
       doc.setFontSize(22)